@@ -0,0 +1,122 @@
+"""
+Early termination of catastrophically slow or hung compilations.
+
+Once the control has been timed in a configuration, each run of another
+peer gets a timeout of FACTOR times the control's median time (but at
+least MIN_TIME): an experiment that is ten times slower, or loops
+forever, is killed there rather than waited for.  A peer with RUNS runs
+killed is aborted: it isn't run again in that configuration, and its
+comparisons are reported as an AbortedResult - a catastrophic regression -
+instead of being measured.
+
+A fixed timeout can be given as well, and applies to every run, the
+control's included; but the control is what the others are measured
+against, so its being killed is an error rather than an abort.
+"""
+from __future__ import division
+
+from collections import OrderedDict
+
+import stats
+
+# A run taking this many times the control's median time is killed.
+FACTOR = 5
+
+# The number of killed runs after which a peer is aborted.
+RUNS = 2
+
+# Never kill a run before this many seconds, so that the jitter of short
+# compilations can't abort them.
+MIN_TIME = 1.0
+
+class AbortedResult(object):
+    """
+    The comparison of a peer that was aborted: "base_time" is the
+    control's median time (None if it wasn't timed), and "changed_time"
+    the longest time a killed run had taken, a lower bound
+    """
+
+    always_display = True
+
+    def __init__(self, name, killed, base_time):
+        self.name = name
+        self.killed = list(killed)
+        self.base_time = base_time
+        self.changed_time = max(self.killed)
+
+    def __str__(self):
+        msg = ('Catastrophic regression: %s aborted after %i run(s) killed'
+               ' at %s s' % (self.name, len(self.killed),
+                             ', '.join('%.2f' % t for t in self.killed)))
+        if self.base_time:
+            msg += (' (control: %.3f s; at least %.1fx slower)'
+                    % (self.base_time, self.changed_time / self.base_time))
+        return msg
+
+class Policy:
+    """
+    The timeouts and killed runs of the peers in one configuration.  A
+    factor of 0 disables the timeouts derived from the control, leaving
+    only the fixed timeout, if any.
+    """
+    def __init__(self, factor=FACTOR, runs=RUNS, timeout=None,
+                 control='control'):
+        self.factor = factor
+        self.runs = runs
+        self.timeout = timeout
+        self.control = control
+        self.control_times = []
+        self.killed = OrderedDict()
+        # The names of the aborted peers, for run_interleaved to skip.
+        self.aborted = set()
+
+    def get_timeout(self, peer_name):
+        """
+        Get the timeout in seconds for the next run of a peer, or None
+        """
+        timeout = self.timeout
+        if peer_name != self.control and self.control_times and self.factor:
+            limit = max(self.factor * stats.median(self.control_times),
+                        MIN_TIME)
+            if timeout is None or limit < timeout:
+                timeout = limit
+        return timeout
+
+    def record(self, peer_name, elapsed, timed_out):
+        """
+        Record how long a run of a peer took, and whether it was killed,
+        returning a note for the log.  Raise RuntimeError if the control
+        was killed.
+        """
+        if timed_out and peer_name == self.control:
+            raise RuntimeError('%s was killed after %.2f s, at the fixed'
+                               ' timeout of %s s' % (peer_name, elapsed,
+                                                     self.timeout))
+        if not timed_out:
+            if peer_name == self.control:
+                self.control_times.append(elapsed)
+            return ''
+        killed = self.killed.setdefault(peer_name, [])
+        killed.append(elapsed)
+        if len(killed) < self.runs:
+            return ' (killed after %.2f s)' % elapsed
+        self.aborted.add(peer_name)
+        return ' (killed after %.2f s; aborted)' % elapsed
+
+    def get_base_time(self):
+        """
+        Get the control's median time, or None if it hasn't been timed
+        """
+        if not self.control_times:
+            return None
+        return stats.median(self.control_times)
+
+    def get_results(self):
+        """
+        Get a dict mapping the names of the aborted peers to AbortedResults
+        """
+        base_time = self.get_base_time()
+        return dict((peer_name, AbortedResult(peer_name,
+                                              self.killed[peer_name],
+                                              base_time))
+                    for peer_name in self.aborted)
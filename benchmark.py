@@ -1,12 +1,33 @@
 from collections import OrderedDict, namedtuple
+import optparse
 import os
+import random
 import re
 import subprocess
-import stat
 import sys
 import time
 
+import abort
+import budget
+import coldcache
+import conditioning
+import energy
+import gcsweep
+import grind
+import history
+import interference
+import launcher
+import layout
+import memreport
+import memtrace
+import noisefloor
 import perf
+import preflight
+import profdiff
+import schedule
+import snapshot
+import subset
+import sweep
 
 STAT_FIELDS = ('usr', 'sys', 'wall', 'ggc')
 class Stats(namedtuple('Stats', STAT_FIELDS)):
@@ -46,6 +67,14 @@ class TimeReport(OrderedDict):
                 tr['TOTAL'] = stats
         return tr
 
+    def get_phases(self):
+        """
+        Get the (name, wall) pairs for the top-level phases of the
+        compilation, in the order they ran
+        """
+        return [(name, stats.wall) for name, stats in self.items()
+                if name.startswith('phase ')]
+
 class Peer:
     """
     Either the control or the experiment.
@@ -55,20 +84,24 @@ class Peer:
     def __init__(self, name, path):
         self.name = name
         self.path = path
+        self.build_path = path
+        self.debug_path = path
 
     def get_binary(self, binary_name):
         return os.path.join(self.path, binary_name)
 
-    def strip_binaries(self):
+    def get_debug_binary(self, binary_name):
+        return os.path.join(self.debug_path, binary_name)
+
+    def use_snapshot(self):
         """
-        Strip various binaries of debuginfo
+        Switch to a snapshot of the build with the binaries stripped of
+        debuginfo (see snapshot.py), leaving the build itself untouched;
+        the unstripped binaries stay available via get_debug_binary()
         """
-        for binary_name in ('xgcc', 'cc1', 'cc1plus', 'collect2'):
-            path = self.get_binary(binary_name)
-            statinfo = os.stat(path)
-            if stat.S_ISREG(statinfo.st_mode) \
-               and statinfo.st_mode & stat.S_IXOTH:
-                subprocess.call(['strip', path])
+        the_snapshot = snapshot.get_snapshot(self.build_path)
+        self.path = the_snapshot.path
+        self.debug_path = the_snapshot.debug_path
 
 class Options:
     def __init__(self, benchmark_name):
@@ -85,113 +118,1548 @@ def make_test_name(binary_name, args):
         test_name += ' %s' % arg
     return test_name
 
+def make_peers(control_path, experiment_paths):
+    """
+    Make the Peer instances for a control and a list of experiments.
+    A lone experiment is named "experiment"; several are numbered
+    "experiment1", "experiment2", etc.
+    """
+    peers = [Peer('control', control_path)]
+    if len(experiment_paths) == 1:
+        peers.append(Peer('experiment', experiment_paths[0]))
+    else:
+        for idx, path in enumerate(experiment_paths):
+            peers.append(Peer('experiment%i' % (idx + 1), path))
+    return peers
+
+def run_interleaved(peers, test_name, num_iters, measure, sched=None,
+                    first_iter=0, skip=()):
+    """
+    Call measure(peer) once for every peer in each of num_iters rounds,
+    so that all the peers see the same host conditions.  The order of the
+    peers within each round is given by sched, a schedule.Schedule
+    (default: always in the order given).  Rounds are logged as
+    iterations numbered from first_iter.  Peers whose names are in skip
+    (which measure may add to) are not run.
+    measure should return a (value, text) pair; the text is logged.
+    Return a list of lists of values, one list per peer.
+    """
+    if sched is None:
+        sched = schedule.Schedule()
+    else:
+        print('  schedule: %s' % sched)
+    data = [[] for peer in peers]
+    blocks = sched.iter_blocks(len(peers), num_iters)
+    for iter_idx, order in enumerate(blocks, first_iter):
+        for peer_idx in order:
+            peer = peers[peer_idx]
+            if peer.name in skip:
+                continue
+            sys.stdout.write('  iteration %i: %s: %s: '
+                             % (iter_idx, peer.name, test_name))
+            sys.stdout.flush()
+            value, text = measure(peer)
+            sys.stdout.write(text + '\n')
+            sys.stdout.flush()
+            data[peer_idx].append(value)
+    return data
+
+def find_contaminated_iterations(peers, readings, log_from=0):
+    """
+    Given a list of the interference.Readings taken during each peer's
+    samples, log the contaminated samples (from iteration log_from on) and
+    return the set of the indices of the iterations they were taken in
+    """
+    bad = set()
+    for peer, peer_readings in zip(peers, readings):
+        reasons = interference.find_contaminated(peer_readings)
+        for iter_idx, reason in enumerate(reasons):
+            if reason:
+                if iter_idx >= log_from:
+                    print('  interference: iteration %i: %s: %s'
+                          % (iter_idx, peer.name, reason))
+                bad.add(iter_idx)
+    return bad
+
+def drop_iterations(peers, data, skip, bad=()):
+    """
+    Given the lists of samples from run_interleaved(), in which each peer
+    not in skip has a sample for every iteration, leave out the iterations
+    in bad and those in which one of those peers' runs was killed (a
+    sample of None) from all of them, so that their samples stay paired;
+    the killed runs of the peers in skip are just left out.
+    Return the new lists of samples
+    """
+    bad = set(bad)
+    for peer, samples in zip(peers, data):
+        if peer.name not in skip:
+            bad.update(iter_idx for iter_idx, value in enumerate(samples)
+                       if value is None)
+    return [[value for iter_idx, value in enumerate(samples)
+             if value is not None
+             and (peer.name in skip or iter_idx not in bad)]
+            for peer, samples in zip(peers, data)]
+
+class Comparisons(OrderedDict):
+    """
+    An ordered mapping from (control name, experiment name) pairs to perf
+    results: each experiment against the shared control, then each pair
+    of experiments.
+    """
+    @classmethod
+    def from_data(cls, peers, data, compare_func, benchmark_name,
+                  noise_floor=None, config=None, aborted=None):
+        """
+        If noise_floor (a noisefloor.NoiseFloor) has an entry for config,
+        its significance threshold and minimum detectable effect for the
+        number of samples are passed on to compare_func.
+        aborted maps the names of aborted peers to the results to give
+        for every pair they are in (see abort.Policy.get_results())
+        """
+        aborted = aborted or {}
+        result = cls()
+        pairs = [(0, idx) for idx in range(1, len(peers))]
+        for a in range(1, len(peers)):
+            for b in range(a + 1, len(peers)):
+                pairs.append((a, b))
+        for a, b in pairs:
+            key = (peers[a].name, peers[b].name)
+            if peers[b].name in aborted:
+                result[key] = aborted[peers[b].name]
+                continue
+            if peers[a].name in aborted:
+                result[key] = aborted[peers[a].name]
+                continue
+            options = Options(benchmark_name)
+            options.control_label = peers[a].name
+            options.experiment_label = peers[b].name
+            if noise_floor is not None and config in noise_floor:
+                num_samples = min(len(data[a]), len(data[b]))
+                options.significance_threshold = \
+                    noise_floor.threshold(config, num_samples)
+                options.min_detectable_effect = \
+                    noise_floor.mde(config, num_samples)
+            result[key] = compare_func(data[a], data[b], options)
+        return result
+
+    def __str__(self):
+        if len(self) == 1:
+            return str(list(self.values())[0])
+        return '\n\n'.join('%s -> %s:\n%s' % (a, b, result)
+                            for (a, b), result in self.items())
+
+def measure_wallclock(peers, binary_name, args, num_iters=10, sched=None,
+                      condition=None, interference_mode=None, policy=None):
+    """
+    Time a set of gcc args with each of a list of Peers.  All of the peers
+    are run in each iteration, in the order given by sched (a
+    schedule.Schedule, which also determines how drift between iterations
+    is removed).
+    If condition is an outlier method from conditioning.METHODS, warm-up
+    iterations and outliers are flagged, logged and replaced by up to
+    num_iters / 2 extra iterations before comparing.
+    If interference_mode is one of interference.MODES, the host is
+    monitored during each sample, and iterations with a contaminated
+    sample are logged ("tag"), left out ("exclude"), or replaced by up to
+    num_iters / 2 extra iterations and then left out ("rerun").
+    If policy (an abort.Policy) is given, runs are killed at its timeouts
+    and left out, and peers it aborts are run no more; their samples are
+    set aside, and the rest are compared without them.
+    Return a list of lists of times, one list per peer
+    """
+    test_name = make_test_name(binary_name, args)
+
+    # Build the command lines up front, so that each timed launch is just
+    # a spawn and a wait.
+    launchers = dict((peer.name,
+                      launcher.Launcher([peer.get_binary(binary_name),
+                                         '-B', peer.path] + args))
+                     for peer in peers)
+
+    monitor = None
+    if interference_mode:
+        monitor = interference.Monitor()
+    readings = OrderedDict((peer.name, []) for peer in peers)
+
+    skip = ()
+    if policy is not None:
+        skip = policy.aborted
+    set_aside = {}
+
+    def measure(peer):
+        timeout = None
+        if policy is not None:
+            timeout = policy.get_timeout(peer.name)
+        if monitor is not None:
+            monitor.start()
+        the_launch = launchers[peer.name].launch(timeout)
+        time_taken = the_launch.elapsed
+        text = 'time_taken: %r' % time_taken
+        if monitor is not None:
+            reading = monitor.stop()
+            readings[peer.name].append(reading)
+            text += ' (%s)' % (reading,)
+        if policy is not None:
+            text += policy.record(peer.name, time_taken, the_launch.timed_out)
+        if the_launch.timed_out:
+            return None, text
+        return time_taken, text
+
+    def set_aside_aborted(peers, raw_data, iterations):
+        """
+        Leave out the iterations in which a remaining peer's run was
+        killed, so that the samples stay paired, and set aside the samples
+        of the aborted peers, returning the peers that remain, their
+        samples and the iterations of their samples
+        """
+        killed = set(iter_idx
+                     for peer, samples, sample_iters
+                     in zip(peers, raw_data, iterations)
+                     if peer.name not in skip
+                     for value, iter_idx in zip(samples, sample_iters)
+                     if value is None)
+        remaining = []
+        for peer, samples, sample_iters in zip(peers, raw_data, iterations):
+            kept = [(value, iter_idx)
+                    for value, iter_idx in zip(samples, sample_iters)
+                    if value is not None and iter_idx not in killed]
+            samples = [value for value, iter_idx in kept]
+            sample_iters = [iter_idx for value, iter_idx in kept]
+            if peer.name in skip:
+                set_aside[peer.name] = samples
+            else:
+                remaining.append((peer, samples, sample_iters))
+        return ([peer for peer, samples, sample_iters in remaining],
+                [samples for peer, samples, sample_iters in remaining],
+                [sample_iters for peer, samples, sample_iters in remaining])
+
+    all_peers = peers
+    print('compare_wallclock: %s' % test_name)
+    raw_data = run_interleaved(peers, test_name, num_iters, measure, sched,
+                               skip=skip)
+    # The iteration of each sample, for drift correction once some have
+    # been left out.
+    iterations = [list(range(num_iters)) for peer in peers]
+    peers, raw_data, iterations = set_aside_aborted(peers, raw_data,
+                                                    iterations)
+    num_run = num_iters
+
+    if interference_mode and peers:
+        bad = find_contaminated_iterations(
+            peers, [readings[peer.name] for peer in peers])
+        if bad and interference_mode == 'rerun':
+            extra = min(len(bad), num_iters // 2)
+            print('  interference: running %i extra iteration(s)' % extra)
+            more = run_interleaved(peers, test_name, extra, measure, sched,
+                                   first_iter=num_run, skip=skip)
+            raw_data = [a + b for a, b in zip(raw_data, more)]
+            iterations = [a + list(range(num_run, num_run + extra))
+                          for a in iterations]
+            num_run += extra
+            peers, raw_data, iterations = set_aside_aborted(peers, raw_data,
+                                                            iterations)
+            bad = find_contaminated_iterations(
+                peers, [readings[peer.name] for peer in peers],
+                log_from=num_iters)
+        if len(bad) == num_run:
+            print('  interference: every iteration was contaminated;'
+                  ' keeping them all')
+        elif bad and interference_mode != 'tag':
+            raw_data = [[value for iter_idx, value in zip(sample_iters,
+                                                          samples)
+                         if iter_idx not in bad]
+                        for samples, sample_iters in zip(raw_data,
+                                                         iterations)]
+            iterations = [[iter_idx for iter_idx in sample_iters
+                           if iter_idx not in bad]
+                          for sample_iters in iterations]
+
+    data = raw_data
+    if sched is not None and peers:
+        data = sched.correct(raw_data, iterations)
+
+    if condition and peers:
+        conditioned = conditioning.condition(data, condition)
+        extra = conditioning.get_extra_iterations(conditioned, num_iters,
+                                                  num_iters // 2)
+        if extra:
+            print('  conditioning: running %i extra iteration(s)' % extra)
+            more = run_interleaved(peers, test_name, extra, measure, sched,
+                                   first_iter=num_run, skip=skip)
+            raw_data = [a + b for a, b in zip(raw_data, more)]
+            iterations = [a + list(range(num_run, num_run + extra))
+                          for a in iterations]
+            peers, raw_data, iterations = set_aside_aborted(peers, raw_data,
+                                                            iterations)
+            data = raw_data
+            if sched is not None:
+                data = sched.correct(raw_data, iterations)
+            conditioned = conditioning.condition(data, condition)
+        for peer, c in zip(peers, conditioned):
+            print('  conditioning: %s: %s' % (peer.name, c))
+        data = conditioning.equalize(conditioned)
+
+    if set_aside:
+        by_name = dict(zip([peer.name for peer in peers], data))
+        by_name.update(set_aside)
+        data = [by_name[peer.name] for peer in all_peers]
+    return data
+
+def compare_wallclock_multi(control_path, experiment_paths, binary_name, args,
+                            num_iters=10, sched=None, condition=None,
+                            interference_mode=None, noise_floor=None,
+                            policy=None):
+    """
+    Take a path to a control gcc build and a list of paths to experiment
+    builds, and a set of other gcc args.  The builds are timed as by
+    measure_wallclock(), and every experiment is compared against the same
+    control samples.
+    If noise_floor (a noisefloor.NoiseFloor) has an A/A calibration of
+    these args, it sets the threshold for a significant change.
+    Return a Comparisons of perf.BenchmarkResult instances, and of
+    abort.AbortedResult instances for the pairs with a peer that policy
+    aborted
+    """
+    peers = make_peers(control_path, experiment_paths)
+    for peer in peers:
+        peer.use_snapshot()
+
+    test_name = make_test_name(binary_name, args)
+    data = measure_wallclock(peers, binary_name, args, num_iters, sched,
+                             condition, interference_mode, policy)
+
+    return Comparisons.from_data(peers, data, perf.CompareMultipleRuns,
+                                 'Wallclock time for %s' % test_name,
+                                 noise_floor, test_name,
+                                 policy.get_results() if policy else None)
+
 def compare_wallclock(control_path, experiment_path, binary_name, args,
-                      num_iters=10):
+                      num_iters=10, sched=None, condition=None,
+                      interference_mode=None, noise_floor=None, policy=None):
     """
     Take a pair of paths to gcc builds, and a set of other gcc args.
-    Return a perf.BenchmarkResult instance
+    Return a perf.BenchmarkResult instance (or an abort.AbortedResult)
     """
-    control = Peer('control', control_path)
-    experiment = Peer('experiment', experiment_path)
+    results = compare_wallclock_multi(control_path, [experiment_path],
+                                      binary_name, args, num_iters, sched,
+                                      condition, interference_mode,
+                                      noise_floor, policy)
+    return results[('control', 'experiment')]
 
-    data = []
-    for peer in [control, experiment]:
-        peer.strip_binaries()
-        data.append([])
+def calibrate_wallclock(control_path, binary_name, args, noise_floor,
+                        num_iters=10, sched=None, condition=None,
+                        interference_mode=None):
+    """
+    Time the control gcc build against itself with a set of other gcc
+    args, as by measure_wallclock(), and record the noise floor of those
+    args in noise_floor, a noisefloor.NoiseFloor.
+    Return the name of the configuration, as a key of noise_floor
+    """
+    peers = [Peer('control', control_path), Peer('control2', control_path)]
+    for peer in peers:
+        peer.use_snapshot()
 
     test_name = make_test_name(binary_name, args)
+    data = measure_wallclock(peers, binary_name, args, num_iters, sched,
+                             condition, interference_mode)
+    noise_floor.add(test_name, data[0], data[1])
+    return test_name
 
-    print('compare_wallclock: %s' % test_name)
-    for iter_idx in range(num_iters):
-        for peer_idx, peer in enumerate([control, experiment]):
-            sys.stdout.write('  iteration %i: %s: %s: '
-                             % (iter_idx, peer.name, test_name))
-            sys.stdout.flush()
-            actual_args = [peer.get_binary(binary_name), '-B', peer.path] + args
-            t1 = time.time()
-            subprocess.call(actual_args)
-            t2 = time.time()
-            time_taken = t2 - t1
-            sys.stdout.write('time_taken: %r\n' % time_taken)
-            sys.stdout.flush()
-            data[peer_idx].append(time_taken)
+# The number of wallclock iterations under each layout
+LAYOUT_ITERS = 3
 
-    options = Options('Wallclock time for %s' % test_name)
-    result = perf.CompareMultipleRuns(data[0],
-                                      data[1],
-                                      options)
-    return result
+def compare_wallclock_layouts(control_path, experiment_paths, binary_name,
+                              args, layouts, num_iters=LAYOUT_ITERS,
+                              sched=None, policy=None):
+    """
+    Take a path to a control gcc build and a list of paths to experiment
+    builds, a set of other gcc args, and a list of layout.Layouts.  Under
+    each layout in turn, all of the builds are run for num_iters
+    iterations, in the order given by sched; the per-layout mean times are
+    then compared, so that a change only counts as significant if it holds
+    across layouts.
+    If policy (an abort.Policy) is given, runs are killed at its timeouts
+    and left out of the means, and peers it aborts are run no more.
+    Return a Comparisons of perf.BenchmarkResult instances, and of
+    abort.AbortedResult instances for the pairs with an aborted peer
+    """
+    peers = make_peers(control_path, experiment_paths)
+    for peer in peers:
+        peer.use_snapshot()
+    variants = dict((peer.name, layout.find_variants(peer.path))
+                    for peer in peers)
+
+    test_name = make_test_name(binary_name, args)
+    args = layout.make_args_absolute(args)
+
+    print('compare_wallclock_layouts: %s' % test_name)
+    skip = ()
+    if policy is not None:
+        skip = policy.aborted
+    work_dirs = layout.WorkDirs()
+    # The mean time of each peer under each layout, None if it wasn't run.
+    data = [[None] * len(layouts) for peer in peers]
+    try:
+        for layout_idx, the_layout in enumerate(layouts):
+            print('  layout %i: %s' % (layout_idx, the_layout))
+            cwd = work_dirs.get(the_layout)
+            env = the_layout.get_env(cwd)
+            launchers = {}
+            for peer in peers:
+                argv = [peer.get_binary(binary_name)]
+                variant_dir = the_layout.get_variant_dir(variants[peer.name])
+                if variant_dir:
+                    argv += ['-B', variant_dir]
+                argv += ['-B', peer.path] + args
+                launchers[peer.name] = launcher.Launcher(argv, env, cwd=cwd)
+
+            def measure(peer):
+                timeout = None
+                if policy is not None:
+                    timeout = policy.get_timeout(peer.name)
+                the_launch = launchers[peer.name].launch(timeout)
+                time_taken = the_launch.elapsed
+                text = 'time_taken: %r' % time_taken
+                if policy is not None:
+                    text += policy.record(peer.name, time_taken,
+                                          the_launch.timed_out)
+                if the_launch.timed_out:
+                    return None, text
+                return time_taken, text
+
+            times = run_interleaved(peers, test_name, num_iters, measure,
+                                    sched, first_iter=layout_idx * num_iters,
+                                    skip=skip)
+            # Leave out the runs that were killed, and the aborted peers.
+            live = [peer_idx for peer_idx, peer in enumerate(peers)
+                    if peer.name not in skip
+                    and any(value is not None for value in times[peer_idx])]
+            iterations = [[iter_idx
+                           for iter_idx, value in enumerate(times[peer_idx])
+                           if value is not None]
+                          for peer_idx in live]
+            times = [[value for value in times[peer_idx] if value is not None]
+                     for peer_idx in live]
+            if sched is not None and live:
+                times = sched.correct(times, iterations)
+            for peer_idx, samples in zip(live, times):
+                data[peer_idx][layout_idx] = sum(samples) / float(len(samples))
+    finally:
+        work_dirs.cleanup()
+
+    for peer, means in zip(peers[1:], data[1:]):
+        pairs = [(base, changed) for base, changed in zip(data[0], means)
+                 if base is not None and changed is not None]
+        if peer.name not in skip and pairs:
+            print('  layouts: %s: %s'
+                  % (peer.name,
+                     layout.describe_changes(*zip(*pairs))))
+
+    # Only compare the layouts every remaining peer has a mean under, so
+    # that the means stay paired.
+    live = [means for peer, means in zip(peers, data)
+            if peer.name not in skip]
+    paired = [layout_idx for layout_idx in range(len(layouts))
+              if all(means[layout_idx] is not None for means in live)]
+    data = [[means[layout_idx] for layout_idx in paired
+             if means[layout_idx] is not None]
+            for means in data]
+    return Comparisons.from_data(peers, data, perf.CompareMultipleRuns,
+                                 'Wallclock time over %i layouts for %s'
+                                 % (len(layouts), test_name),
+                                 aborted=(policy.get_results() if policy
+                                          else None))
+
+def start_killable(actual_args, timeout=None):
+    """
+    Start a compilation with its stderr piped.  If timeout is given, it
+    runs in a process group of its own, which is killed after that many
+    seconds.
+    Return the subprocess.Popen and its launcher.Killer
+    """
+    p = subprocess.Popen(actual_args, stderr=subprocess.PIPE,
+                         preexec_fn=(os.setpgrp if timeout is not None
+                                     else None))
+    return p, launcher.Killer(p.pid, timeout)
+
+def compare_memory_multi(control_path, experiment_paths, binary_name, args,
+                         num_iters=3, sched=None, policy=None):
+    """
+    Take a path to a control gcc build and a list of paths to experiment
+    builds, and a set of other gcc args.  All of the builds are run in
+    each iteration, in the order given by sched.
+    If policy (an abort.Policy) is given, runs are killed at its timeouts,
+    and the peers it has aborted (e.g. while timing them) aren't run.
+    Return a Comparisons of perf.MemoryUsageResult instances, and of
+    abort.AbortedResult instances for the pairs with an aborted peer
+    """
+    peers = make_peers(control_path, experiment_paths)
+    for peer in peers:
+        peer.use_snapshot()
+
+    test_name = make_test_name(binary_name, args)
+
+    def measure(peer):
+        actual_args = [peer.get_binary(binary_name), '-B', peer.path] + args
+        actual_args.append('-ftime-report')
+        timeout = None
+        if policy is not None:
+            timeout = policy.get_timeout(peer.name)
+        t0 = launcher.clock()
+        p, killer = start_killable(actual_args, timeout)
+        out, err = p.communicate()
+        timed_out = killer.cancel()
+        if policy is not None:
+            note = policy.record(peer.name, launcher.clock() - t0, timed_out)
+            if timed_out:
+                return None, note.strip()
+        time_report = TimeReport.from_stderr(err)
+        total_ggc = time_report['TOTAL'].ggc
+        return total_ggc, 'total_ggc: %r KB' % total_ggc
+
+    print('compare_memory: %s' % test_name)
+    skip = ()
+    if policy is not None:
+        skip = policy.aborted
+    data = run_interleaved(peers, test_name, num_iters, measure, sched,
+                           skip=skip)
+    # Leave out the runs that were killed.
+    data = [[value for value in samples if value is not None]
+            for samples in data]
+
+    return Comparisons.from_data(peers, data, perf.CompareMemoryUsage,
+                                 'Total ggc memory usage for %s' % test_name,
+                                 aborted=(policy.get_results() if policy
+                                          else None))
 
 def compare_memory(control_path, experiment_path, binary_name, args,
-                   num_iters=3):
+                   num_iters=3, sched=None, policy=None):
+    """
+    Take a pair of paths to gcc builds, and a set of other gcc args.
+    Return a perf.MemoryUsageResult instance (or an abort.AbortedResult)
+    """
+    results = compare_memory_multi(control_path, [experiment_path],
+                                   binary_name, args, num_iters, sched,
+                                   policy)
+    return results[('control', 'experiment')]
+
+# The number of runs of each build in --energy mode
+ENERGY_ITERS = 5
+
+def compare_energy_multi(control_path, experiment_paths, binary_name, args,
+                         num_iters=ENERGY_ITERS, sched=None, root='/',
+                         condition=None, interference_mode=None, policy=None):
+    """
+    Take a path to a control gcc build and a list of paths to experiment
+    builds, and a set of other gcc args.  All of the builds are run in
+    each iteration, in the order given by sched, reading the RAPL
+    counters under root around each run.
+    If interference_mode is one of interference.MODES, the host is
+    monitored during each run, and the iterations it interfered with are
+    handled as by measure_wallclock().
+    If condition is an outlier method from conditioning.METHODS, warm-up
+    runs and outliers in the total joules are flagged, logged and left
+    out (without extra iterations to replace them).
+    If policy (an abort.Policy) is given, runs are killed at its timeouts,
+    the iterations with a killed run are left out, and peers it aborts are
+    run no more.
+    Return a Comparisons of energy.EnergyResult instances, and of
+    abort.AbortedResult instances for the pairs with an aborted peer
+    """
+    peers = make_peers(control_path, experiment_paths)
+    for peer in peers:
+        peer.use_snapshot()
+
+    test_name = make_test_name(binary_name, args)
+    launchers = dict((peer.name,
+                      launcher.Launcher([peer.get_binary(binary_name),
+                                         '-B', peer.path] + args))
+                     for peer in peers)
+    meter = energy.Meter(root)
+
+    monitor = None
+    if interference_mode:
+        monitor = interference.Monitor()
+    host_readings = OrderedDict((peer.name, []) for peer in peers)
+
+    skip = ()
+    if policy is not None:
+        skip = policy.aborted
+
+    def measure(peer):
+        timeout = None
+        if policy is not None:
+            timeout = policy.get_timeout(peer.name)
+        if monitor is not None:
+            monitor.start()
+        meter.start()
+        the_launch = launchers[peer.name].launch(timeout)
+        reading = meter.stop()
+        text = 'energy: %s' % energy.format_reading(reading)
+        if monitor is not None:
+            host_reading = monitor.stop()
+            host_readings[peer.name].append(host_reading)
+            text += ' (%s)' % (host_reading,)
+        if policy is not None:
+            text += policy.record(peer.name, the_launch.elapsed,
+                                  the_launch.timed_out)
+        if the_launch.timed_out:
+            return None, text
+        return reading, text
+
+    def get_live():
+        return [peer_idx for peer_idx, peer in enumerate(peers)
+                if peer.name not in skip]
+
+    print('compare_energy: %s' % test_name)
+    data = run_interleaved(peers, test_name, num_iters, measure, sched,
+                           skip=skip)
+    num_run = num_iters
+
+    bad = set()
+    if interference_mode and get_live():
+        bad = find_contaminated_iterations(
+            [peers[peer_idx] for peer_idx in get_live()],
+            [host_readings[peers[peer_idx].name] for peer_idx in get_live()])
+        if bad and interference_mode == 'rerun':
+            extra = min(len(bad), num_iters // 2)
+            print('  interference: running %i extra iteration(s)' % extra)
+            more = run_interleaved(peers, test_name, extra, measure, sched,
+                                   first_iter=num_run, skip=skip)
+            num_run += extra
+            data = [a + b for a, b in zip(data, more)]
+            bad = find_contaminated_iterations(
+                [peers[peer_idx] for peer_idx in get_live()],
+                [host_readings[peers[peer_idx].name]
+                 for peer_idx in get_live()],
+                log_from=num_iters)
+        if len(bad) == num_run:
+            print('  interference: every iteration was contaminated;'
+                  ' keeping them all')
+            bad = set()
+        elif interference_mode == 'tag':
+            bad = set()
+    data = drop_iterations(peers, data, skip, bad)
+
+    if condition and get_live():
+        for peer_idx in get_live():
+            conditioned = conditioning.ConditionedSamples(
+                [energy.get_total(reading) for reading in data[peer_idx]],
+                condition)
+            print('  conditioning: %s: %s' % (peers[peer_idx].name,
+                                              conditioned))
+            data[peer_idx] = [reading
+                              for idx, reading in enumerate(data[peer_idx])
+                              if idx not in conditioned.flagged]
+        length = min(len(data[peer_idx]) for peer_idx in get_live())
+        data = [samples[:length] for samples in data]
+
+    return Comparisons.from_data(peers, data, energy.compare,
+                                 'Energy per compile for %s' % test_name,
+                                 aborted=(policy.get_results() if policy
+                                          else None))
+
+# The number of cold (and of warm) runs of each build in --cold mode
+COLD_ITERS = 5
+
+def compare_wallclock_cold(control_path, experiment_paths, binary_name, args,
+                           num_iters=COLD_ITERS, sched=None,
+                           method='fadvise', policy=None):
+    """
+    Take a path to a control gcc build and a list of paths to experiment
+    builds, and a set of other gcc args.  In each iteration, each build
+    is run cold - after evicting its binaries, their shared libraries and
+    the sources from the page cache by method (one of coldcache.METHODS) -
+    and then warm, in the order given by sched.  A run that fails raises
+    RuntimeError.
+    If policy (an abort.Policy) is given, the peers it has aborted aren't
+    run, and the others are timed out by a policy of their own with the
+    same settings, since cold runs are slower than the control's warm
+    ones: each launch is killed at its timeout, and the time of the cold
+    and warm runs together is recorded.  The iterations with a killed run
+    are left out.
+    Return a Comparisons of coldcache.ColdStartResult instances, and of
+    abort.AbortedResult instances for the pairs with an aborted peer
+    """
+    peers = make_peers(control_path, experiment_paths)
+    for peer in peers:
+        peer.use_snapshot()
+
+    test_name = make_test_name(binary_name, args)
+    launchers = {}
+    files = {}
+    for peer in peers:
+        launchers[peer.name] = launcher.Launcher(
+            [peer.get_binary(binary_name), '-B', peer.path] + args)
+        files[peer.name] = coldcache.get_files(
+            [os.path.join(peer.path, name) for name in snapshot.BINARIES],
+            args)
+
+    cold_policy = None
+    skip = set()
+    if policy is not None:
+        cold_policy = abort.Policy(policy.factor, policy.runs, policy.timeout,
+                                   policy.control)
+        skip.update(policy.aborted)
+
+    def measure(peer):
+        timeout = None
+        if cold_policy is not None:
+            timeout = cold_policy.get_timeout(peer.name)
+        coldcache.evict(files[peer.name], method)
+        cold = launchers[peer.name].launch(timeout)
+        warm = None
+        if not cold.timed_out:
+            warm = launchers[peer.name].launch(timeout)
+        for the_launch in (cold, warm):
+            if (the_launch is not None and the_launch.status != 0
+                    and not the_launch.timed_out):
+                raise RuntimeError('%s exited with status %i'
+                                   % (' '.join(launchers[peer.name].argv),
+                                      the_launch.status))
+        timed_out = cold.timed_out or warm.timed_out
+        text = ''
+        if not timed_out:
+            text = ('cold: %r (%s major faults), warm: %r'
+                    % (cold.elapsed, cold.majflt, warm.elapsed))
+        if cold_policy is not None:
+            elapsed = cold.elapsed + (warm.elapsed if warm else 0.)
+            text += cold_policy.record(peer.name, elapsed, timed_out)
+            skip.update(cold_policy.aborted)
+        if timed_out:
+            return None, text.strip()
+        return (cold, warm), text
+
+    print('compare_wallclock_cold: %s' % test_name)
+    print('  evicting %i files per build by %s'
+          % (max(len(paths) for paths in files.values()), method))
+    data = run_interleaved(peers, test_name, num_iters, measure, sched,
+                           skip=skip)
+    data = drop_iterations(peers, data, skip)
+
+    aborted = None
+    if policy is not None:
+        aborted = policy.get_results()
+        aborted.update(cold_policy.get_results())
+    return Comparisons.from_data(peers, data, coldcache.compare,
+                                 'Cold-start wallclock time for %s'
+                                 % test_name, aborted=aborted)
+
+def compare_grind_plan(control_path, experiment_paths, binary_name, args_list,
+                       tool='cachegrind', num_workers=None):
+    """
+    Take a path to a control gcc build and a list of paths to experiment
+    builds, and a list of sets of other gcc args.  Run each build once
+    with each set of args under tool (one of grind.TOOLS), num_workers
+    simulations at a time, reusing cached results.
+    Return a list of Comparisons of grind.GrindResult instances, one per
+    set of args
+    """
+    peers = make_peers(control_path, experiment_paths)
+    for peer in peers:
+        peer.use_snapshot()
+
+    # Run the unstripped binaries, for the function names.
+    argvs = []
+    for args in args_list:
+        for peer in peers:
+            argvs.append([peer.get_debug_binary(binary_name),
+                          '-B', peer.debug_path, '-B', peer.path] + args)
+
+    print('compare_grind: %i runs under %s' % (len(argvs), tool))
+    results = grind.run_jobs(argvs, tool,
+                             os.path.join(snapshot.staging_dir, tool),
+                             num_workers)
+
+    comparisons = []
+    for args_idx, args in enumerate(args_list):
+        test_name = make_test_name(binary_name, args)
+        data = []
+        for peer_idx, peer in enumerate(peers):
+            profile, cached = results[args_idx * len(peers) + peer_idx]
+            print('  %s: %s: %s: %i%s'
+                  % (peer.name, test_name, profile.events[0]
+                     if profile.events else 'events',
+                     list(profile.totals.values())[0]
+                     if profile.events else 0,
+                     ' (cached)' if cached else ''))
+            data.append(profile)
+        comparisons.append(Comparisons.from_data(
+            peers, data, grind.compare,
+            '%s counts for %s' % (tool, test_name)))
+    return comparisons
+
+def compare_memory_timelines(control_path, experiment_path, binary_name,
+                             args, num_iters=3, timeline_dir=None,
+                             max_points=None, policy=None,
+                             experiment_name='experiment'):
     """
     Take a pair of paths to gcc builds, and a set of other gcc args.
-    Return a perf.MemoryUsageResult instance
+    Sample the memory usage of the whole compilation at full resolution,
+    attributing it to the phases from -ftime-report.
+    If max_points is given, each timeline is instead downsampled as it is
+    sampled, in constant memory (keeping the exact peak).
+    If timeline_dir is given, write every timeline there as CSV, along
+    with the merged envelope of each peer's iterations.
+    If policy (an abort.Policy) is given, runs are killed at its timeouts
+    and left out, and the experiment isn't run once it has aborted it.
+    Return a memtrace.MemoryTimelineResult instance, or an
+    abort.AbortedResult if the experiment was aborted
     """
     control = Peer('control', control_path)
-    experiment = Peer('experiment', experiment_path)
+    experiment = Peer(experiment_name, experiment_path)
 
     data = []
+    timelines = []
     for peer in [control, experiment]:
-        peer.strip_binaries()
+        peer.use_snapshot()
         data.append([])
+        timelines.append([])
 
     test_name = make_test_name(binary_name, args)
+    file_prefix = re.sub(r'[^A-Za-z0-9.+-]+', '_', test_name)
 
-    print('compare_memory: %s' % test_name)
+    print('compare_memory_timelines: %s' % test_name)
     for iter_idx in range(num_iters):
         for peer_idx, peer in enumerate([control, experiment]):
+            if policy is not None and peer.name in policy.aborted:
+                continue
             sys.stdout.write('  iteration %i: %s: %s: '
                              % (iter_idx, peer.name, test_name))
             sys.stdout.flush()
             actual_args = [peer.get_binary(binary_name), '-B', peer.path] + args
             actual_args.append('-ftime-report')
-            #print(actual_args)
-            p = subprocess.Popen(actual_args, stderr=subprocess.PIPE)
+            timeout = None
+            if policy is not None:
+                timeout = policy.get_timeout(peer.name)
+            t0 = launcher.clock()
+            p, killer = start_killable(actual_args, timeout)
+            future = perf.MemoryUsageFuture(p.pid, include_children=True,
+                                            max_points=max_points)
             out, err = p.communicate()
+            timed_out = killer.cancel()
+            timeline = memtrace.MemoryTimeline.from_future(future)
+            if policy is not None:
+                note = policy.record(peer.name, launcher.clock() - t0,
+                                     timed_out)
+                if timed_out:
+                    sys.stdout.write(note.strip() + '\n')
+                    sys.stdout.flush()
+                    continue
             time_report = TimeReport.from_stderr(err)
-            total_ggc = time_report['TOTAL'].ggc
-            sys.stdout.write('total_ggc: %r KB\n' % total_ggc)
+            phases = memtrace.phases_from_walltimes(time_report.get_phases(),
+                                                    timeline.compiler_start())
+            summary = memtrace.TimelineSummary.from_timeline(timeline, phases)
+            sys.stdout.write('peak: %r KB at %.3f s (%i samples)\n'
+                             % (summary.peak, summary.time_to_peak,
+                                len(timeline)))
             sys.stdout.flush()
-            data[peer_idx].append(total_ggc)
+            if timeline_dir:
+                filename = '%s-%s-%i.csv' % (peer.name, file_prefix, iter_idx)
+                with open(os.path.join(timeline_dir, filename), 'w') as f:
+                    timeline.write(f, phases)
+            data[peer_idx].append(summary)
+            timelines[peer_idx].append(timeline)
+
+    if not data[1]:
+        # Every run of the experiment was killed.
+        return abort.AbortedResult(experiment.name,
+                                   policy.killed[experiment.name],
+                                   policy.get_base_time())
+
+    if timeline_dir:
+        for peer, peer_timelines in zip([control, experiment], timelines):
+            merged = memtrace.MemoryTimeline.merge(peer_timelines)
+            filename = '%s-%s-merged.csv' % (peer.name, file_prefix)
+            with open(os.path.join(timeline_dir, filename), 'w') as f:
+                merged.write(f)
+
+    return memtrace.MemoryTimelineResult(
+        memtrace.TimelineSummary.median(data[0]),
+        memtrace.TimelineSummary.median(data[1]))
+
+def compare_mem_report(control_path, experiment_path, binary_name, args,
+                       policy=None, experiment_name='experiment'):
+    """
+    Take a pair of paths to gcc builds, and a set of other gcc args.
+    Run each once with -fmem-report, and diff the allocation tables.
+    If policy (an abort.Policy) is given, the runs are killed at its
+    timeouts.
+    Return a memreport.MemReportResult instance, or an abort.AbortedResult
+    if the experiment was killed
+    """
+    control = Peer('control', control_path)
+    experiment = Peer(experiment_name, experiment_path)
+
+    test_name = make_test_name(binary_name, args)
+
+    print('compare_mem_report: %s' % test_name)
+    data = []
+    for peer in [control, experiment]:
+        peer.use_snapshot()
+        sys.stdout.write('  %s: %s: ' % (peer.name, test_name))
+        sys.stdout.flush()
+        actual_args = [peer.get_binary(binary_name), '-B', peer.path] + args
+        actual_args.append('-fmem-report')
+        timeout = None
+        if policy is not None:
+            timeout = policy.get_timeout(peer.name)
+        t0 = launcher.clock()
+        p, killer = start_killable(actual_args, timeout)
+        out, err = p.communicate()
+        timed_out = killer.cancel()
+        if policy is not None:
+            elapsed = launcher.clock() - t0
+            note = policy.record(peer.name, elapsed, timed_out)
+            if timed_out:
+                sys.stdout.write(note.strip() + '\n')
+                sys.stdout.flush()
+                return abort.AbortedResult(peer.name, [elapsed],
+                                           policy.get_base_time())
+        records = memreport.parse_mem_report(err)
+        sys.stdout.write('%i records\n' % len(records))
+        sys.stdout.flush()
+        data.append(records)
 
-    options = Options('Total ggc memory usage for %s'
-                      % test_name)
-    result = perf.CompareMemoryUsage(data[0],
-                                     data[1],
-                                     options)
+    return memreport.MemReportResult(memreport.diff_mem_reports(data[0],
+                                                                data[1]))
+
+def compare_profiles(control_path, experiment_path, binary_name, args,
+                     profile_dir, experiment_name='experiment'):
+    """
+    Take a pair of paths to gcc builds, and a set of other gcc args.
+    Run each once under "perf record", using the unstripped binaries, and
+    write to profile_dir the perf.data and folded stacks of each, and a
+    differential flame graph.
+    Return a profdiff.ProfileDiffResult instance
+    """
+    control = Peer('control', control_path)
+    experiment = Peer(experiment_name, experiment_path)
+
+    test_name = make_test_name(binary_name, args)
+    file_prefix = re.sub(r'[^A-Za-z0-9.+-]+', '_', test_name)
+
+    print('compare_profiles: %s' % test_name)
+    folded = []
+    files = []
+    for peer in [control, experiment]:
+        peer.use_snapshot()
+        sys.stdout.write('  %s: %s: ' % (peer.name, test_name))
+        sys.stdout.flush()
+        actual_args = ([peer.get_debug_binary(binary_name),
+                        '-B', peer.debug_path, '-B', peer.path] + args)
+        perf_data = os.path.join(profile_dir, '%s-%s.perf.data'
+                                 % (peer.name, file_prefix))
+        profdiff.record(actual_args, perf_data)
+        peer_folded = profdiff.read_profile(perf_data)
+        folded_path = os.path.join(profile_dir, '%s-%s.folded'
+                                   % (peer.name, file_prefix))
+        profdiff.write_folded(peer_folded, folded_path)
+        sys.stdout.write('%i samples\n' % sum(peer_folded.values()))
+        sys.stdout.flush()
+        folded.append(peer_folded)
+        files.append(folded_path)
+
+    svg_path = os.path.join(profile_dir, '%s-vs-%s-%s.svg'
+                            % (control.name, experiment.name, file_prefix))
+    profdiff.write_diff_svg(folded[0], folded[1], svg_path,
+                            '%s: %s -> %s' % (test_name, control.name,
+                                              experiment.name))
+    files.append(svg_path)
+
+    return profdiff.ProfileDiffResult(
+        profdiff.diff_self_times(folded[0], folded[1]),
+        sum(folded[0].values()), sum(folded[1].values()), files)
+
+def compare_gc_sweep(control_path, experiment_path, binary_name, args,
+                     grid=gcsweep.DEFAULT_GRID, num_iters=3, policy=None,
+                     experiment_name='experiment'):
+    """
+    Take a pair of paths to gcc builds, and a set of other gcc args.
+    Run both at each (ggc-min-expand, ggc-min-heapsize) point of the grid,
+    measuring wallclock time and total ggc memory.
+    If policy (an abort.Policy) is given, each point gets a policy of its
+    own with the same settings, since collecting more often slows the
+    control too: runs are killed at its timeouts and left out, and a
+    point where it aborts the experiment is left out of the result.
+    Return a gcsweep.GCSweepResult instance
+    """
+    control = Peer('control', control_path)
+    experiment = Peer(experiment_name, experiment_path)
+
+    for peer in [control, experiment]:
+        peer.use_snapshot()
+
+    test_name = make_test_name(binary_name, args)
+
+    print('compare_gc_sweep: %s' % test_name)
+    result = gcsweep.GCSweepResult()
+    for point in grid:
+        param_args = gcsweep.get_param_args(point)
+        point_policy = None
+        if policy is not None:
+            point_policy = abort.Policy(policy.factor, policy.runs,
+                                        policy.timeout, policy.control)
+        data = [[], []]
+        for iter_idx in range(num_iters):
+            for peer_idx, peer in enumerate([control, experiment]):
+                if (point_policy is not None
+                        and peer.name in point_policy.aborted):
+                    continue
+                sys.stdout.write('  %i:%i: iteration %i: %s: %s: '
+                                 % (point[0], point[1], iter_idx, peer.name,
+                                    test_name))
+                sys.stdout.flush()
+                actual_args = ([peer.get_binary(binary_name), '-B', peer.path]
+                               + args + param_args + ['-ftime-report'])
+                timeout = None
+                if point_policy is not None:
+                    timeout = point_policy.get_timeout(peer.name)
+                t1 = time.time()
+                p, killer = start_killable(actual_args, timeout)
+                out, err = p.communicate()
+                t2 = time.time()
+                time_taken = t2 - t1
+                timed_out = killer.cancel()
+                if point_policy is not None:
+                    note = point_policy.record(peer.name, time_taken,
+                                               timed_out)
+                    if timed_out:
+                        sys.stdout.write(note.strip() + '\n')
+                        sys.stdout.flush()
+                        continue
+                total_ggc = TimeReport.from_stderr(err)['TOTAL'].ggc
+                sys.stdout.write('time_taken: %r total_ggc: %r KB\n'
+                                 % (time_taken, total_ggc))
+                sys.stdout.flush()
+                data[peer_idx].append((time_taken, total_ggc))
+        if not data[1]:
+            aborted = abort.AbortedResult(experiment.name,
+                                          point_policy.killed[experiment.name],
+                                          point_policy.get_base_time())
+            print('  %i:%i: %s' % (point[0], point[1], aborted))
+            continue
+        result.add(point, data[0], data[1])
     return result
 
+def get_relative_change(result):
+    """
+    Get the change from control to experiment of a perf result as a
+    fraction (e.g. 0.02 for 2% slower/larger), or None if there is none
+    """
+    if isinstance(result, perf.BenchmarkResult):
+        old, new = result.avg_base, result.avg_changed
+    elif isinstance(result, perf.SimpleBenchmarkResult):
+        old, new = result.base_time, result.changed_time
+    elif isinstance(result, perf.MemoryUsageResult):
+        old, new = result.max_base, result.max_changed
+    elif isinstance(result, grind.GrindResult):
+        old, new = result.base_total, result.changed_total
+    elif isinstance(result, energy.EnergyResult):
+        old, new = result.base_joules, result.changed_joules
+    else:
+        return None
+    if old == 0:
+        return None
+    return (new / float(old)) - 1.
+
+def is_regression(result):
+    """
+    Is a perf result a significant slowdown or growth?
+    """
+    change = get_relative_change(result)
+    return bool(getattr(result, 'always_display', False)
+                and change is not None and change > 0)
+
 #TODO: capture just the parsing phase
 
 
-def main():
-    control_path = sys.argv[1]
-    experiment_path = sys.argv[2]
-    args_list = ['-S test-sources/kdecore.cc -g',
-                 '-S test-sources/empty.c -g',
-                 '-S test-sources/big-code.c -g',
-                 '-S test-sources/influence.i -g'
-    ]
+def main(argv):
+    parser = optparse.OptionParser(
+        usage=("%prog [options] control_path experiment_path [experiment_path...]\n"
+           "       %prog [options] --calibrate FILE control_path"),
+        description=("Compare the compile-time performance of gcc build"
+                     " directories. Every experiment is run interleaved with"
+                     " the same control, and compared against it and against"
+                     " each other."))
+    parser.add_option("--memory_timelines", metavar="DIR", default=None,
+                      help=("Also sample the memory usage of every"
+                            " compilation at full resolution, reporting the"
+                            " peak of each -ftime-report phase, and write"
+                            " the timelines to DIR as CSV."))
+    parser.add_option("--memory_timeline_points", metavar="N", type="int",
+                      default=None,
+                      help=("Downsample each memory timeline to at most N"
+                            " points in constant memory while sampling,"
+                            " rather than keeping every sample."))
+    parser.add_option("--mem_report", action="store_true",
+                      help=("Also compare the allocation tables from"
+                            " -fmem-report, ranked by bytes. This includes"
+                            " per-call-site data if gcc was configured with"
+                            " --enable-gather-detailed-mem-stats."))
+    parser.add_option("--gc_sweep", action="store_true",
+                      help=("Also run each configuration across a grid of"
+                            " --param ggc-min-expand/ggc-min-heapsize values,"
+                            " reporting time and memory at each point."))
+    parser.add_option("--gc_grid", metavar="GRID", default=None,
+                      help=("Comma-separated expand:heapsize pairs for"
+                            " --gc_sweep, e.g. '0:0,30:4096'. The default"
+                            " crosses expand 0, 30 and 100 with heapsize 0,"
+                            " 4096 and 131072."))
+    parser.add_option("--sweep_config", metavar="FILE", default=None,
+                      help=("JSON file defining the axes (sources, flags,"
+                            " params...) to sweep over; see sweep.py. The"
+                            " default is every test source at -O0, -O1,"
+                            " -O2, -O3 and -Os."))
+    parser.add_option("--design", default=None,
+                      help=("How to sample points from the axes: one of %s."
+                            " Overrides the config file."
+                            % ', '.join(sweep.DESIGNS)))
+    parser.add_option("--samples", type="int", default=None,
+                      help="Number of points for the 'lhs' design.")
+    parser.add_option("--dry_run", action="store_true",
+                      help=("Print the plan and its estimated cost, without"
+                            " running anything."))
+    parser.add_option("--order", default="fixed",
+                      help=("How to order the peers within each iteration:"
+                            " one of %s. Default is '%%default'."
+                            % ', '.join(schedule.ORDERS)))
+    parser.add_option("--seed", type="int", default=None,
+                      help=("Seed for --order=random and --layouts; one"
+                            " is chosen and logged if not given."))
+    parser.add_option("--drift", default="none",
+                      help=("How to remove host drift between iterations"
+                            " from wallclock times: one of %s. Default is"
+                            " '%%default'." % ', '.join(schedule.DRIFT_MODELS)))
+    parser.add_option("--condition", metavar="METHOD", default=None,
+                      help=("Flag warm-up iterations and outliers in the"
+                            " wallclock samples (outliers by METHOD: one of"
+                            " %s), log them, and run extra iterations to"
+                            " replace them." % ', '.join(conditioning.METHODS)))
+    parser.add_option("--interference", metavar="MODE", default=None,
+                      help=("Monitor the host (foreign CPU load, CPU"
+                            " frequency, thermal throttling) during each"
+                            " wallclock sample; MODE is what to do with the"
+                            " iterations where it interfered: one of %s."
+                            % ', '.join(interference.MODES)))
+    parser.add_option("--preflight", metavar="MODE", default="warn",
+                      help=("What to do when the host's settings (governor,"
+                            " turbo, SMT, ASLR, THP, isolcpus) are noisy:"
+                            " one of %s ('apply' needs root). Default is"
+                            " '%%default'." % ', '.join(preflight.MODES)))
+    parser.add_option("--calibrate", metavar="FILE", default=None,
+                      help=("Instead of comparing builds, run the control"
+                            " against itself for every configuration, and"
+                            " write the noise floor of each to FILE, for"
+                            " --noise_floor."))
+    parser.add_option("--noise_floor", metavar="FILE", default=None,
+                      help=("Take the threshold for a significant wallclock"
+                            " change in each configuration from this"
+                            " --calibrate output, rather than a flat 2%,"
+                            " and report the minimum detectable effect."))
+    parser.add_option("--layouts", metavar="N", type="int", default=None,
+                      help=("Time each configuration under N random memory"
+                            " layouts (environment size, working directory"
+                            " name length and, where a build has"
+                            " layout-variants/*/ directories of relinked"
+                            " binaries, function order), %i iterations"
+                            " each, and compare the per-layout means."
+                            % LAYOUT_ITERS))
+    parser.add_option("--snapshot_dir", metavar="DIR", default=None,
+                      help=("Where to keep the stripped snapshots of the"
+                            " builds that are timed, reused while a build"
+                            " is unchanged. Default is %s."
+                            % snapshot.staging_dir))
+    parser.add_option("--profile_regressions", metavar="DIR", default=None,
+                      help=("For every configuration where an experiment's"
+                            " wallclock time regressed significantly, run"
+                            " it and the control under 'perf record' and"
+                            " write their folded stacks and a differential"
+                            " flame graph to DIR, reporting the functions"
+                            " whose self time changed most."))
+    parser.add_option("--grind", metavar="TOOL", default=None,
+                      help=("Instead of timing the builds, run each"
+                            " configuration once per build under valgrind"
+                            " (TOOL: one of %s) and compare the instruction"
+                            " and simulated cache counts, in total and per"
+                            " function. Results are cached by binary hash."
+                            % ', '.join(grind.TOOLS)))
+    parser.add_option("-j", "--jobs", type="int", default=None,
+                      help=("Number of --grind simulations to run at once;"
+                            " default is one per CPU."))
+    parser.add_option("--budgets", metavar="FILE", default=None,
+                      help=("JSON file of performance budgets (see"
+                            " budget.py) to check the results against;"
+                            " exit with status %i if any is exceeded."
+                            % budget.EXIT_VIOLATION))
+    parser.add_option("--verdict", metavar="FILE", default=None,
+                      help="Write the verdict of --budgets to FILE as JSON.")
+    parser.add_option("--smoke", action="store_true",
+                      help=("Only run the configurations in the smoke"
+                            " subset of --budgets."))
+    parser.add_option("--cold", action="store_true",
+                      help=("Also run each build %i times cold, after"
+                            " evicting its binaries, shared libraries and"
+                            " sources from the page cache, each followed by"
+                            " a warm run, and report the two side by side"
+                            " with their page faults and bytes read."
+                            % COLD_ITERS))
+    parser.add_option("--evict", metavar="METHOD", default=None,
+                      help=("How --cold evicts files: one of %s. Default"
+                            " is drop_caches when running as root, else"
+                            " fadvise." % ', '.join(coldcache.METHODS)))
+    parser.add_option("--energy", action="store_true",
+                      help=("Also run each build %i times reading the RAPL"
+                            " package and DRAM energy counters, and compare"
+                            " the joules per compile. Needs an otherwise"
+                            " idle host, and root on recent kernels."
+                            % ENERGY_ITERS))
+    parser.add_option("--timeout", metavar="SECONDS", type="float",
+                      default=None,
+                      help=("Kill any compilation still running after"
+                            " SECONDS, the control's included (which is an"
+                            " error)."))
+    parser.add_option("--abort_factor", metavar="F", type="float",
+                      default=abort.FACTOR,
+                      help=("Kill a run of an experiment once it has taken F"
+                            " times the control's median time in that"
+                            " configuration (but at least %g s), and after"
+                            " --abort_runs such runs, stop running it there"
+                            " and report a catastrophic regression. 0"
+                            " disables this. Default is %%default."
+                            % abort.MIN_TIME))
+    parser.add_option("--abort_runs", metavar="N", type="int",
+                      default=abort.RUNS,
+                      help=("Number of runs killed by --abort_factor or"
+                            " --timeout after which a build is aborted in a"
+                            " configuration. Default is %default."))
+    parser.add_option("--subset_history", metavar="LOG_DIR", action="append",
+                      default=[],
+                      help=("Use the benchmark.py logs in LOG_DIR (may be"
+                            " given more than once) to choose the"
+                            " configurations whose wallclock deltas best"
+                            " predict the rest, run only those, and report"
+                            " predicted deltas for the others."))
+    parser.add_option("--subset_size", metavar="N", type="int", default=None,
+                      help=("Run N configurations with --subset_history,"
+                            " rather than as few as explain"
+                            " --subset_target of the variance."))
+    parser.add_option("--subset_target", type="float",
+                      default=subset.DEFAULT_TARGET,
+                      help=("Fraction of the variance of the historical"
+                            " deltas that the --subset_history subset"
+                            " must explain. Default is %default."))
+    options, args = parser.parse_args(argv)
+    if len(args) < (1 if options.calibrate else 2):
+        parser.error("incorrect number of arguments")
+    control_path = args[0]
+    experiment_paths = args[1:]
+    if options.condition and options.condition not in conditioning.METHODS:
+        parser.error("unknown --condition method: %r" % options.condition)
+    if options.grind and options.grind not in grind.TOOLS:
+        parser.error("unknown --grind tool: %r" % options.grind)
+    evict_method = None
+    if options.cold:
+        try:
+            evict_method = coldcache.get_method(options.evict)
+        except ValueError as e:
+            parser.error(str(e))
+    if options.energy:
+        try:
+            energy.check_readable(energy.find_domains())
+        except RuntimeError as e:
+            parser.error(str(e))
+    if options.preflight not in preflight.MODES:
+        parser.error("unknown --preflight mode: %r" % options.preflight)
+    if (options.interference
+            and options.interference not in interference.MODES):
+        parser.error("unknown --interference mode: %r"
+                     % options.interference)
+    sched = None
+    if options.order != 'fixed' or options.drift != 'none':
+        try:
+            sched = schedule.Schedule(options.order, options.seed,
+                                      options.drift)
+        except ValueError as e:
+            parser.error(str(e))
+    gc_grid = gcsweep.DEFAULT_GRID
+    if options.gc_grid:
+        try:
+            gc_grid = gcsweep.parse_grid(options.gc_grid)
+        except ValueError as e:
+            parser.error(str(e))
+    if options.memory_timelines and not os.path.isdir(options.memory_timelines):
+        os.makedirs(options.memory_timelines)
+    if (options.profile_regressions
+            and not os.path.isdir(options.profile_regressions)):
+        os.makedirs(options.profile_regressions)
+
+    if options.snapshot_dir:
+        snapshot.staging_dir = options.snapshot_dir
+    budgets = None
+    if options.budgets:
+        try:
+            budgets = budget.Budgets.from_file(options.budgets)
+        except (IOError, ValueError, TypeError) as e:
+            parser.error("bad --budgets file: %s" % e)
+    if (options.smoke or options.verdict) and not budgets:
+        parser.error("--smoke and --verdict require --budgets")
+    if options.layouts and (options.condition or options.interference
+                            or options.noise_floor):
+        parser.error("--condition, --interference and --noise_floor can't be"
+                     " used with --layouts")
+    noise_floor = None
+    if options.noise_floor:
+        noise_floor = noisefloor.NoiseFloor.load(options.noise_floor)
+
+    try:
+        if options.sweep_config:
+            the_sweep = sweep.Sweep.from_file(options.sweep_config,
+                                              options.design, options.samples)
+        else:
+            the_sweep = sweep.Sweep(design=options.design or 'full',
+                                    samples=options.samples)
+    except ValueError as e:
+        parser.error(str(e))
+    plan = the_sweep.get_plan()
+    if options.smoke:
+        plan = [point for point in plan
+                if budgets.in_smoke(make_test_name('xgcc',
+                                                   the_sweep.get_args(point)))]
+    the_subset = None
+    if options.subset_history and not options.calibrate:
+        names = [make_test_name('xgcc', the_sweep.get_args(point))
+                 for point in plan]
+        configs, rows = subset.get_deltas(
+            history.read_logs(options.subset_history))
+        the_subset = subset.select([config for config in configs
+                                    if config in names], rows,
+                                   options.subset_size, options.subset_target)
+        print(the_subset)
+        # Configurations without history are run too.
+        plan = [point for point, name in zip(plan, names)
+                if name not in the_subset.fits]
+    num_wallclock = 10
+    if options.layouts:
+        num_wallclock = options.layouts * LAYOUT_ITERS
+    if options.cold:
+        num_wallclock += 2 * COLD_ITERS
+    if options.energy:
+        num_wallclock += ENERGY_ITERS
+    if options.calibrate:
+        # 10 wallclock iterations, for the control twice
+        estimate = the_sweep.estimate_cost(plan, 10 * 2)
+    else:
+        # The wallclock (and cold and energy) and 3 memory iterations, for
+        # each of the peers
+        estimate = the_sweep.estimate_cost(
+            plan, (num_wallclock + 3) * (len(experiment_paths) + 1))
+    print('plan: %i configurations (%s design), estimated cost: %.0f s'
+          % (len(plan), the_sweep.design, estimate))
+    if options.dry_run:
+        for point in plan:
+            print('  %s' % ' '.join(the_sweep.get_args(point)))
+        return
+
+    try:
+        fingerprint = preflight.run(options.preflight)
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    # Record when we started, so that history.py can order the logs, and
+    # what on, so that it only compares like with like
+    print('started: %s' % time.strftime('%Y-%m-%dT%H:%M:%S'))
+    print(preflight.format_fingerprint(fingerprint))
+    print('launcher overhead (%s): %s'
+          % (launcher.TRUE,
+             launcher.format_summary(launcher.measure_overhead())))
+    layouts = None
+    if options.layouts:
+        seed = options.seed
+        if seed is None:
+            seed = random.SystemRandom().randint(0, 2 ** 31 - 1)
+        num_variants = max(len(layout.find_variants(path))
+                           for path in [control_path] + experiment_paths)
+        layouts = layout.make_layouts(options.layouts, seed, num_variants)
+        print('layouts: %i (seed %i, %i relinked variants)'
+              % (len(layouts), seed, num_variants))
     t1 = time.time()
-    for args_str in args_list:
-        for opt in ['-O0', '-O1', '-O2', '-O3', '-Os']:
-            args = args_str.split()
-            args.append(opt)
-
-            result = compare_wallclock(control_path, experiment_path,
-                                       'xgcc', args)
-            print(result)
+    if options.calibrate:
+        calibration = noisefloor.NoiseFloor()
+        for point in plan:
+            args = the_sweep.get_args(point)
+            config = calibrate_wallclock(
+                control_path, 'xgcc', args, calibration, sched=sched,
+                condition=options.condition,
+                interference_mode=options.interference)
+            print(calibration.describe(config,
+                                       calibration[config]['samples']))
+            print('\n')
+            # Save as we go, so that an interrupted calibration isn't lost
+            calibration.save(options.calibrate)
+        print('total time taken: %r' % (time.time() - t1))
+        return
+
+    # Map (measurement, control name, experiment name) to an OrderedDict
+    # mapping points to relative changes, for the main effects report.
+    changes = OrderedDict()
+    # The (test name, peer name) pairs aborted as catastrophic regressions.
+    aborted = []
+    gate = budget.Gate(budgets) if budgets else None
+    timed_plan = plan
+    if options.grind:
+        # One deterministic run per build instead of timing them.
+        timed_plan = []
+        all_results = compare_grind_plan(
+            control_path, experiment_paths, 'xgcc',
+            [the_sweep.get_args(point) for point in plan], options.grind,
+            options.jobs)
+        for point, results in zip(plan, all_results):
+            print(results)
+            print('\n')
+            for pair, result in results.items():
+                key = ('Instructions',) + pair
+                changes.setdefault(key, OrderedDict())[point] = \
+                    get_relative_change(result)
+                # Budgets are for changes against the control, not between
+                # experiments.
+                if gate and pair[0] == 'control':
+                    gate.check(make_test_name('xgcc',
+                                              the_sweep.get_args(point)),
+                               result, pair)
+
+    for point in timed_plan:
+        args = the_sweep.get_args(point)
+        policy = abort.Policy(options.abort_factor, options.abort_runs,
+                              options.timeout)
+
+        if layouts:
+            wallclock_results = compare_wallclock_layouts(
+                control_path, experiment_paths, 'xgcc', args, layouts,
+                sched=sched, policy=policy)
+        else:
+            wallclock_results = compare_wallclock_multi(
+                control_path, experiment_paths, 'xgcc', args, sched=sched,
+                condition=options.condition,
+                interference_mode=options.interference,
+                noise_floor=noise_floor, policy=policy)
+        memory_results = compare_memory_multi(
+            control_path, experiment_paths, 'xgcc', args, sched=sched,
+            policy=policy)
+        measurements = [('Wallclock', wallclock_results),
+                        ('Total ggc', memory_results)]
+        if options.energy:
+            measurements.append(('Energy', compare_energy_multi(
+                control_path, experiment_paths, 'xgcc', args, sched=sched,
+                condition=options.condition,
+                interference_mode=options.interference, policy=policy)))
+        aborted.extend((make_test_name('xgcc', args), peer_name)
+                       for peer_name in sorted(policy.aborted))
+
+        if options.cold:
+            cold_results = compare_wallclock_cold(
+                control_path, experiment_paths, 'xgcc', args, sched=sched,
+                method=evict_method, policy=policy)
+            print(cold_results)
             print('\n')
+            for pair, result in cold_results.items():
+                key = ('Cold wallclock',) + pair
+                changes.setdefault(key, OrderedDict())[point] = \
+                    get_relative_change(getattr(result, 'cold', result))
+                if (isinstance(result, abort.AbortedResult)
+                        and (make_test_name('xgcc', args),
+                             result.name) not in aborted):
+                    aborted.append((make_test_name('xgcc', args),
+                                    result.name))
+                if gate and pair[0] == 'control':
+                    gate.check(make_test_name('xgcc', args), result, pair)
+        for title, results in measurements:
+            print(results)
+            print('\n')
+            for pair, result in results.items():
+                key = (title,) + pair
+                changes.setdefault(key, OrderedDict())[point] = \
+                    get_relative_change(result)
+                if gate and pair[0] == 'control':
+                    gate.check(make_test_name('xgcc', args), result, pair)
+
+        if options.profile_regressions:
+            for peer in make_peers(control_path, experiment_paths)[1:]:
+                # An aborted experiment would only be killed again.
+                if peer.name in policy.aborted:
+                    continue
+                if is_regression(wallclock_results[('control', peer.name)]):
+                    result = compare_profiles(
+                        control_path, peer.path, 'xgcc', args,
+                        options.profile_regressions, peer.name)
+                    print(result)
+                    print('\n')
+
+        for peer in make_peers(control_path, experiment_paths)[1:]:
+            if peer.name in policy.aborted:
+                continue
+            if options.mem_report:
+                result = compare_mem_report(control_path, peer.path,
+                                            'xgcc', args, policy, peer.name)
+                print(result)
+                print('\n')
 
-            result = compare_memory(control_path, experiment_path,
-                                       'xgcc', args)
-            print(result)
+            if options.gc_sweep:
+                result = compare_gc_sweep(control_path, peer.path,
+                                          'xgcc', args, grid=gc_grid,
+                                          policy=policy,
+                                          experiment_name=peer.name)
+                print(result)
+                print('\n')
+
+            if options.memory_timelines:
+                result = compare_memory_timelines(
+                    control_path, peer.path, 'xgcc', args,
+                    timeline_dir=options.memory_timelines,
+                    max_points=options.memory_timeline_points,
+                    policy=policy, experiment_name=peer.name)
+                print(result)
+                print('\n')
+
+    for (title, base_name, changed_name), point_changes in changes.items():
+        point_changes = OrderedDict((point, change)
+                                    for point, change in point_changes.items()
+                                    if change is not None)
+        print(sweep.format_effects('%s: %s -> %s'
+                                   % (title, base_name, changed_name),
+                                   the_sweep, point_changes))
+        print('\n')
+
+    if the_subset and the_subset.fits:
+        for (title, base_name, changed_name), point_changes in changes.items():
+            if title != 'Wallclock':
+                continue
+            measured = dict(
+                (make_test_name('xgcc', the_sweep.get_args(point)), change)
+                for point, change in point_changes.items())
+            print('Predicted wallclock: %s -> %s' % (base_name, changed_name))
+            for config, (representative, delta, interval) in \
+                    the_subset.predict(measured).items():
+                print('  %s: %+.2f%% +/- %.2f%% (from %s)'
+                      % (config, 100 * delta, 100 * interval, representative))
             print('\n')
 
+    if aborted:
+        print('Catastrophic regressions (aborted):')
+        for test_name, peer_name in aborted:
+            print('  %s: %s' % (test_name, peer_name))
+        print('\n')
+
     t2 = time.time()
     time_taken = t2 - t1
     print('total time taken: %r' % time_taken)
 
+    if gate:
+        print(gate)
+        if options.verdict:
+            gate.write(options.verdict)
+        if not gate.passed():
+            sys.exit(budget.EXIT_VIOLATION)
+
 if __name__ == '__main__':
-    main()
+    main(sys.argv[1:])
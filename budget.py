@@ -0,0 +1,214 @@
+"""
+A performance budget gate: results are checked against per-configuration
+budgets, a machine-readable verdict is written, and the exit status says
+whether any budget was exceeded.
+
+The budgets file is JSON:
+
+  {
+    "smoke": ["xgcc -S empty.c*", "nbody"],
+    "budgets": [
+      {"config": "*", "metric": "time", "max_relative": 0.02},
+      {"config": "xgcc *kdecore.cc*", "metric": "memory",
+       "max_absolute": 10240, "require_significance": false}
+    ]
+  }
+
+"config" is a shell-style pattern matched against the configuration name
+(the test name in benchmark.py, the benchmark name in perf.py; default
+"*"), and "metric" one of METRICS:
+  - time: the average time in seconds
+  - memory: the peak memory (KB of ggc memory in benchmark.py, MB in
+    perf.py)
+  - instructions: the instruction count from --grind
+  - energy: the average joules per compile from --energy
+A budget is exceeded when the metric grows by more than "max_relative"
+(a fraction of the control's value) or "max_absolute" (in the metric's
+units), and - unless "require_significance" is false - the change is
+statistically significant.  Memory and instruction counts are treated as
+always significant, as are single-sample times.  A build aborted as a
+catastrophic regression (see abort.py) fails the gate whatever the
+budgets, once per configuration.
+
+"smoke" lists patterns for the configurations to run with --smoke, a fast
+subset for pre-commit use.
+"""
+from __future__ import division
+
+from collections import OrderedDict
+import fnmatch
+import json
+
+import abort
+
+METRICS = ('time', 'memory', 'instructions', 'energy')
+
+# The exit status when a budget is exceeded.
+EXIT_VIOLATION = 1
+
+class Budget:
+    def __init__(self, config='*', metric='time', max_relative=None,
+                 max_absolute=None, require_significance=True):
+        if metric not in METRICS:
+            raise ValueError('unknown metric: %r' % metric)
+        if max_relative is None and max_absolute is None:
+            raise ValueError('budget for %s %s has no limit'
+                             % (config, metric))
+        self.config = config
+        self.metric = metric
+        self.max_relative = max_relative
+        self.max_absolute = max_absolute
+        self.require_significance = require_significance
+
+    def to_json(self):
+        result = OrderedDict([('config', self.config),
+                              ('metric', self.metric)])
+        for name in ('max_relative', 'max_absolute'):
+            if getattr(self, name) is not None:
+                result[name] = getattr(self, name)
+        result['require_significance'] = self.require_significance
+        return result
+
+    def matches(self, config, metric):
+        return metric == self.metric and fnmatch.fnmatchcase(config,
+                                                             self.config)
+
+    def check(self, base, changed, significant):
+        """
+        Get the reason a change from base to changed exceeds this budget,
+        or None if it doesn't
+        """
+        if self.require_significance and not significant:
+            return None
+        growth = changed - base
+        if self.max_absolute is not None and growth > self.max_absolute:
+            return ('grew by %g, over the budget of %g'
+                    % (growth, self.max_absolute))
+        if (self.max_relative is not None and base > 0
+                and growth / base > self.max_relative):
+            return ('grew by %.2f%%, over the budget of %.2f%%'
+                    % (100 * growth / base, 100 * self.max_relative))
+        return None
+
+class Budgets:
+    """
+    The budgets and smoke subset read from a budgets file
+    """
+    def __init__(self, budgets=(), smoke=()):
+        self.budgets = list(budgets)
+        self.smoke = list(smoke)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            obj = json.load(f)
+        return cls([Budget(**dict((str(key), value)
+                                  for key, value in item.items()))
+                    for item in obj.get('budgets', [])],
+                   obj.get('smoke', []))
+
+    def in_smoke(self, config):
+        return any(fnmatch.fnmatchcase(config, pattern)
+                   for pattern in self.smoke)
+
+def get_measurement(result):
+    """
+    Get the (metric, base, changed, significant) of a result from perf.py,
+    benchmark.py or grind.py, or None for other kinds of result
+    """
+    if hasattr(result, 'base_joules'):
+        return 'energy', result.base_joules, result.changed_joules, \
+            result.always_display
+    if hasattr(result, 'avg_base'):
+        return 'time', result.avg_base, result.avg_changed, \
+            result.always_display
+    if getattr(result, 'base_time', None) is not None:
+        return 'time', result.base_time, result.changed_time, True
+    if hasattr(result, 'max_base'):
+        return 'memory', result.max_base, result.max_changed, True
+    if hasattr(result, 'base_total'):
+        return 'instructions', result.base_total, result.changed_total, True
+    return None
+
+class Gate:
+    """
+    Checks results against Budgets, recording a verdict for every check
+    """
+    def __init__(self, budgets):
+        self.budgets = budgets
+        self.checks = []
+
+    def check(self, config, result, pair=('control', 'experiment')):
+        """
+        Check a result for a configuration against every budget that
+        applies to it, returning the list of the reasons it exceeded them
+        """
+        if isinstance(result, abort.AbortedResult):
+            return self.check_aborted(config, result, pair)
+        measurement = get_measurement(result)
+        if measurement is None:
+            return []
+        metric, base, changed, significant = measurement
+        reasons = []
+        for budget in self.budgets.budgets:
+            if not budget.matches(config, metric):
+                continue
+            reason = budget.check(base, changed, significant)
+            self.checks.append(OrderedDict([
+                ('config', config), ('control', pair[0]),
+                ('experiment', pair[1]), ('metric', metric), ('base', base),
+                ('changed', changed), ('significant', bool(significant)),
+                ('budget', budget.to_json()), ('passed', reason is None),
+                ('reason', reason)]))
+            if reason:
+                reasons.append(reason)
+        return reasons
+
+    def check_aborted(self, config, result, pair):
+        """
+        Record an aborted build as a violation, whether or not the
+        control's time is known, unless it already has been for this
+        configuration and pair
+        """
+        reason = ('after %i killed run(s), as a catastrophic regression'
+                  % len(result.killed))
+        for check in self.checks:
+            if (check['config'], check['control'], check['experiment'],
+                    check['metric']) == (config, pair[0], pair[1], 'aborted'):
+                return [reason]
+        self.checks.append(OrderedDict([
+            ('config', config), ('control', pair[0]),
+            ('experiment', pair[1]), ('metric', 'aborted'),
+            ('base', result.base_time), ('changed', result.changed_time),
+            ('significant', True), ('budget', None), ('passed', False),
+            ('reason', reason)]))
+        return [reason]
+
+    def get_violations(self):
+        return [check for check in self.checks if not check['passed']]
+
+    def passed(self):
+        return not self.get_violations()
+
+    def to_json(self):
+        return OrderedDict([('passed', self.passed()),
+                            ('num_checks', len(self.checks)),
+                            ('num_violations', len(self.get_violations())),
+                            ('checks', self.checks)])
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+            f.write('\n')
+
+    def __str__(self):
+        violations = self.get_violations()
+        lines = ['Budget gate: %s (%i checks, %i violations)'
+                 % ('PASSED' if not violations else 'FAILED',
+                    len(self.checks), len(violations))]
+        for check in violations:
+            lines.append('  %s: %s -> %s: %s %s'
+                         % (check['config'], check['control'],
+                            check['experiment'], check['metric'],
+                            check['reason']))
+        return '\n'.join(lines)
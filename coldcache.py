@@ -0,0 +1,198 @@
+"""
+Cold-start compilations, with the compiler and its inputs evicted from
+the page cache.
+
+After the first iteration, every run of a build finds cc1plus, its shared
+libraries and the source in the page cache; on a freshly started machine
+or container they have to be read from storage, and changes to the size
+or layout of the binaries only show there.
+
+Before each cold run, the files a build will read are evicted: the build's
+binaries, the shared libraries they link against (as found by ldd) and
+the source files on the command line.  There are two METHODS:
+  - fadvise: posix_fadvise(POSIX_FADV_DONTNEED) on each of those files,
+    which needs no privileges but Python 3.3 or later, and doesn't reach
+    the headers the sources include
+  - drop_caches: writing to /proc/sys/vm/drop_caches, which drops the
+    whole page cache, but needs root
+
+Each cold run is followed by a warm run of the same build, so that
+ColdStartResult can report the two side by side, with the page faults and
+the bytes read from storage of each.
+
+All paths are relative to a root directory, so that a fake /proc can be
+used instead of the host's.
+"""
+from __future__ import division
+
+import os
+import re
+import subprocess
+
+import perf
+import stats
+
+METHODS = ('fadvise', 'drop_caches')
+
+DROP_CACHES = 'proc/sys/vm/drop_caches'
+
+# What to write to drop_caches: only the page cache, not dentries and
+# inodes.
+DROP_PAGE_CACHE = '1'
+
+# The size of the blocks that getrusage counts in ru_inblock.
+BLOCK_SIZE = 512
+
+def can_drop_caches(root='/'):
+    return os.access(os.path.join(root, DROP_CACHES), os.W_OK)
+
+def get_method(method=None, root='/'):
+    """
+    Check that an eviction method can be used, or choose one: drop_caches
+    where we're privileged, else fadvise.  Raise ValueError if neither can
+    """
+    if method is None:
+        method = 'drop_caches' if can_drop_caches(root) else 'fadvise'
+    if method not in METHODS:
+        raise ValueError('unknown eviction method: %r' % method)
+    if method == 'drop_caches' and not can_drop_caches(root):
+        raise ValueError('drop_caches needs root')
+    if method == 'fadvise' and not hasattr(os, 'posix_fadvise'):
+        raise ValueError('fadvise needs Python 3.3 or later; run as root'
+                         ' to use drop_caches instead')
+    return method
+
+def parse_ldd(text):
+    """
+    Get the paths of the shared libraries in the output of ldd
+    """
+    paths = []
+    for line in text.splitlines():
+        # e.g. "libz.so.1 => /lib/x86_64-linux-gnu/libz.so.1 (0x...)"
+        # or "/lib64/ld-linux-x86-64.so.2 (0x...)"
+        m = re.match(r'^\s*(?:\S+ => )?(/\S+) \(0x[0-9a-f]+\)$', line)
+        if m:
+            paths.append(m.group(1))
+    return paths
+
+def get_shared_libraries(binary):
+    try:
+        with open(os.devnull, 'w') as devnull:
+            text = subprocess.check_output(['ldd', binary], stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        # Not dynamically linked, or no ldd.
+        return []
+    return parse_ldd(text.decode('utf-8', 'replace'))
+
+def get_files(binaries, args):
+    """
+    Get the files that a compilation will read: the binaries (following
+    symlinks, as into a snapshot), their shared libraries, and the files
+    among args
+    """
+    files = []
+    for binary in binaries:
+        if os.path.isfile(binary):
+            files.append(os.path.realpath(binary))
+            files += get_shared_libraries(binary)
+    files += [os.path.realpath(arg) for arg in args if os.path.isfile(arg)]
+    result = []
+    for path in files:
+        if path not in result:
+            result.append(path)
+    return result
+
+def evict(paths, method, root='/'):
+    """
+    Evict files from the page cache by one of METHODS (drop_caches evicts
+    everything, not just paths)
+    """
+    if method == 'drop_caches':
+        # Dirty pages can't be dropped until they're written back.
+        subprocess.call(['sync'])
+        with open(os.path.join(root, DROP_CACHES), 'w') as f:
+            f.write(DROP_PAGE_CACHE)
+        return
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def _format_counts(base, changed, scale=1, units=''):
+    if base is None or changed is None:
+        return 'n/a'
+    return '%.0f -> %.0f%s' % (base / scale, changed / scale, units)
+
+def _format_times(result):
+    if hasattr(result, 'avg_base'):
+        base, changed = result.avg_base, result.avg_changed
+    else:
+        base, changed = result.base_time, result.changed_time
+    change = ' %+.1f%%' % (100 * (changed - base) / base) if base else ''
+    return '%.4f -> %.4f s%s' % (base, changed, change)
+
+def _format_significance(result):
+    if not result.always_display:
+        return 'no'
+    return getattr(result, 't_msg', 'yes').strip()
+
+class ColdStartResult(object):
+    """
+    The comparison of the cold and of the warm runs of control and
+    experiment, as perf results, with the mean page faults and bytes read
+    of each
+    """
+    def __init__(self, cold, warm, base_launches, changed_launches):
+        self.cold = cold
+        self.warm = warm
+        self.base_launches = base_launches
+        self.changed_launches = changed_launches
+        self.always_display = cold.always_display or warm.always_display
+
+    def get_mean(self, launches, idx, field):
+        """
+        Get the mean of a field of the cold (idx 0) or warm (idx 1)
+        launch.Launches, or None if the backend didn't record it
+        """
+        values = [getattr(pair[idx], field) for pair in launches]
+        if not values or None in values:
+            return None
+        return stats.mean(values)
+
+    def __str__(self):
+        rows = [('', 'warm', 'cold'),
+                ('time (avg)', _format_times(self.warm),
+                 _format_times(self.cold)),
+                ('significant', _format_significance(self.warm),
+                 _format_significance(self.cold))]
+        for label, field, scale, units in (
+                ('major faults', 'majflt', 1, ''),
+                ('minor faults', 'minflt', 1, ''),
+                ('read', 'inblock', 1024 / BLOCK_SIZE, ' KB')):
+            warm, cold = [
+                _format_counts(self.get_mean(self.base_launches, idx, field),
+                               self.get_mean(self.changed_launches, idx,
+                                             field),
+                               scale, units)
+                for idx in (1, 0)]
+            rows.append((label, warm, cold))
+        return '\n'.join('%-14s%-34s%s' % row for row in rows)
+
+def compare(base_launches, changed_launches, options):
+    """
+    Compare two lists of (cold launch.Launch, warm launch.Launch) pairs,
+    in the manner of perf.CompareMultipleRuns
+    """
+    results = [perf.CompareMultipleRuns([pair[idx].elapsed
+                                         for pair in base_launches],
+                                        [pair[idx].elapsed
+                                         for pair in changed_launches],
+                                        options)
+               for idx in (0, 1)]
+    return ColdStartResult(results[0], results[1], base_launches,
+                           changed_launches)
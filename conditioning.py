@@ -0,0 +1,154 @@
+"""
+Conditioning of the samples of a benchmark before comparing them.
+
+Two kinds of sample are flagged:
+  - warm-up samples at the start of a run (cold caches, CPU frequency
+    ramping up), found with the Marginal Standard Error Rule (MSER,
+    White 1997) and confirmed with a robust test of whether they differ
+    from the steady state that follows them;
+  - outliers (one-off hiccups), found with the modified z-score based on
+    the median absolute deviation (Iglewicz and Hoaglin, 1993), or with
+    Tukey's fences on the interquartile range.
+
+Flagged samples are reported, not silently dropped, and the number of
+replacement iterations needed to get back to the requested sample count
+is computed so that the caller can run them.
+"""
+from __future__ import division
+
+import stats
+
+METHODS = ('mad', 'iqr')
+
+# Modified z-scores above this are outliers (Iglewicz and Hoaglin).
+MAD_THRESHOLD = 3.5
+
+# How many robust standard errors the warm-up must differ by.
+WARMUP_THRESHOLD = 3.
+
+# Conditioning needs enough samples to know what "normal" looks like.
+MIN_SAMPLES = 5
+
+def mad(values):
+    """
+    The median absolute deviation from the median
+    """
+    m = stats.median(values)
+    return stats.median([abs(x - m) for x in values])
+
+def quartiles(values):
+    values = sorted(values)
+    n = len(values)
+    return stats.median(values[:n // 2]), stats.median(values[(n + 1) // 2:])
+
+def detect_warmup(samples, max_fraction=0.5):
+    """
+    Get the number of warm-up samples at the start of a series: the MSER
+    truncation point, if the truncated samples differ significantly from
+    the rest.
+    """
+    n = len(samples)
+    if n < MIN_SAMPLES:
+        return 0
+    best_d = 0
+    best_stat = None
+    for d in range(int(n * max_fraction) + 1):
+        tail = samples[d:]
+        mean = sum(tail) / len(tail)
+        stat = sum((x - mean) ** 2 for x in tail) / len(tail) ** 2
+        if best_stat is None or stat < best_stat:
+            best_d, best_stat = d, stat
+    if best_d == 0:
+        return 0
+
+    # Steady-state test: is the mean of the truncated samples outside
+    # the noise of the remainder?
+    head = samples[:best_d]
+    tail = samples[best_d:]
+    sigma = 1.4826 * mad(tail)
+    diff = abs(sum(head) / len(head) - stats.median(tail))
+    if sigma == 0:
+        return best_d if diff > 0 else 0
+    if diff / (sigma / len(head) ** 0.5) > WARMUP_THRESHOLD:
+        return best_d
+    return 0
+
+def find_outliers(samples, method='mad'):
+    """
+    Get the indices of the outliers among the samples
+    """
+    if method not in METHODS:
+        raise ValueError('unknown outlier method: %r' % method)
+    if len(samples) < MIN_SAMPLES:
+        return []
+    if method == 'mad':
+        m = stats.median(samples)
+        deviation = mad(samples)
+        if deviation == 0:
+            return []
+        return [idx for idx, x in enumerate(samples)
+                if 0.6745 * abs(x - m) / deviation > MAD_THRESHOLD]
+    q1, q3 = quartiles(samples)
+    iqr = q3 - q1
+    low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    return [idx for idx, x in enumerate(samples) if not low <= x <= high]
+
+class ConditionedSamples:
+    """
+    The result of conditioning one series of samples.
+
+    "warmup" is the number of leading warm-up samples, "outliers" the
+    indices of the outliers among the rest, "flagged" the set of the
+    indices of both, and "kept" the remaining samples in their original
+    order.
+    """
+    def __init__(self, samples, method='mad'):
+        self.samples = list(samples)
+        self.method = method
+        self.warmup = detect_warmup(self.samples)
+        steady = self.samples[self.warmup:]
+        self.outliers = [self.warmup + idx
+                         for idx in find_outliers(steady, method)]
+        self.flagged = set(range(self.warmup)) | set(self.outliers)
+        self.kept = [x for idx, x in enumerate(self.samples)
+                     if idx not in self.flagged]
+
+    def num_flagged(self):
+        return len(self.samples) - len(self.kept)
+
+    def __str__(self):
+        parts = []
+        if self.warmup:
+            parts.append('warm-up: %s'
+                         % ' '.join('%.5g' % x
+                                    for x in self.samples[:self.warmup]))
+        if self.outliers:
+            parts.append('outliers (%s): %s'
+                         % (self.method,
+                            ' '.join('%.5g' % self.samples[idx]
+                                     for idx in self.outliers)))
+        return '; '.join(parts) or 'none flagged'
+
+def condition(data, method='mad'):
+    """
+    Condition a list of series (e.g. one per peer), returning a list of
+    ConditionedSamples instances
+    """
+    return [ConditionedSamples(samples, method) for samples in data]
+
+def get_extra_iterations(conditioned, target, max_extra):
+    """
+    How many more iterations are needed so that every series has at
+    least "target" kept samples, given that flagged samples will be
+    replaced, capped at max_extra
+    """
+    shortfall = max(target - len(c.kept) for c in conditioned)
+    return min(max(shortfall, 0), max_extra)
+
+def equalize(conditioned):
+    """
+    Get the kept samples of each series, truncated to the same length
+    (as the pairwise comparisons require)
+    """
+    length = min(len(c.kept) for c in conditioned)
+    return [c.kept[:length] for c in conditioned]
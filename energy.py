@@ -0,0 +1,197 @@
+"""
+Energy used by compilations, from the Linux powercap interface to the
+RAPL (Running Average Power Limit) counters.
+
+Each RAPL zone under /sys/class/powercap has a cumulative energy_uj
+counter, in microjoules, which wraps around at max_energy_range_uj.  A
+Meter reads the counters of the package zones ("package-0", ...) and of
+their DRAM subzones ("dram") before and after each compilation, and the
+differences give the joules used, per domain and in total.
+
+The counters cover the whole package, so anything else running on the
+host is counted too: the samples are only as good as the host is quiet
+(see interference.py and preflight.py).  Reading energy_uj needs root on
+kernels since 5.10.
+
+compare() reports the joules per compile of control and experiment with
+the statistics that perf.CompareMultipleRuns applies to times.
+
+All paths are relative to a root directory, so that a fake /sys can be
+used instead of the host's.
+"""
+from __future__ import division
+
+from collections import OrderedDict
+import glob
+import os
+
+import perf
+
+POWERCAP = 'sys/class/powercap'
+
+# The kinds of zone that are read: whole packages, and the DRAM attached
+# to them.  Core and uncore are part of the package.
+KINDS = ('package', 'dram')
+
+class Domain:
+    """
+    One RAPL zone: "label" names it (e.g. "package-0", "dram-0") and
+    "path" is its directory
+    """
+    def __init__(self, label, path):
+        self.label = label
+        self.path = path
+        self.max_range = int(_read_file(os.path.join(path,
+                                                     'max_energy_range_uj')))
+
+    def __repr__(self):
+        return 'Domain(%r, %r)' % (self.label, self.path)
+
+    def read(self):
+        """
+        Read the counter, in microjoules
+        """
+        return int(_read_file(os.path.join(self.path, 'energy_uj')))
+
+    def get_delta(self, start, end):
+        """
+        Get the microjoules between two readings, allowing for the counter
+        having wrapped around (once) in between: it counts from 0 to
+        max_range inclusive
+        """
+        if end < start:
+            end += self.max_range + 1
+        return end - start
+
+def _read_file(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def find_domains(root='/'):
+    """
+    Find the package and DRAM zones, as a list of Domains (empty if the
+    host has no RAPL)
+    """
+    domains = []
+    pattern = os.path.join(root, POWERCAP, 'intel-rapl:*')
+    for path in sorted(glob.glob(pattern)):
+        try:
+            name = _read_file(os.path.join(path, 'name'))
+        except (IOError, OSError):
+            continue
+        # e.g. "intel-rapl:0" is "package-0", "intel-rapl:0:1" its "dram"
+        indices = os.path.basename(path).split(':')[1:]
+        kind = name.split('-')[0]
+        if kind not in KINDS:
+            continue
+        label = name if name != kind else '%s-%s' % (kind, indices[0])
+        domains.append(Domain(label, path))
+    return domains
+
+def check_readable(domains):
+    """
+    Raise RuntimeError if there are no domains or they can't be read
+    """
+    if not domains:
+        raise RuntimeError('no RAPL domains under /%s' % POWERCAP)
+    for domain in domains:
+        try:
+            domain.read()
+        except (IOError, OSError) as e:
+            raise RuntimeError('cannot read the RAPL counters (%s); they'
+                               ' need root on recent kernels' % e)
+
+class Meter:
+    """
+    Measures the energy used between start() and stop(), any number of
+    times
+    """
+    def __init__(self, root='/'):
+        self.domains = find_domains(root)
+        self._start = None
+
+    def start(self):
+        self._start = [domain.read() for domain in self.domains]
+
+    def stop(self):
+        """
+        Get an OrderedDict mapping the domain labels to the joules used
+        since start()
+        """
+        end = [domain.read() for domain in self.domains]
+        return OrderedDict(
+            (domain.label, domain.get_delta(start, stop) / 1e6)
+            for domain, start, stop in zip(self.domains, self._start, end))
+
+def get_total(reading):
+    return sum(reading.values())
+
+def format_reading(reading):
+    """
+    Describe a reading as e.g. "12.345 J (package-0 11.000 J, dram-0
+    1.345 J)"
+    """
+    return '%.3f J (%s)' % (get_total(reading),
+                            ', '.join('%s %.3f J' % item
+                                      for item in reading.items()))
+
+class EnergyResult(object):
+    """
+    The joules per compile of control and experiment: in total, as the
+    statistics of perf.BenchmarkResult, and per domain, as means
+    """
+    def __init__(self, base_readings, changed_readings, options):
+        self.base_readings = base_readings
+        self.changed_readings = changed_readings
+        base = [get_total(reading) for reading in base_readings]
+        changed = [get_total(reading) for reading in changed_readings]
+        self.min_base, self.min_changed = min(base), min(changed)
+        self.base_joules = perf.avg(base)
+        self.changed_joules = perf.avg(changed)
+        self.std_base = self.std_changed = 0.
+        if len(base) > 1:
+            self.std_base = perf.SampleStdDev(base)
+            self.std_changed = perf.SampleStdDev(changed)
+
+        self.t_msg = 'Not significant'
+        self.always_display = False
+        threshold = (getattr(options, 'significance_threshold', None)
+                     or perf.DEFAULT_SIGNIFICANCE_THRESHOLD)
+        if (len(base) > 1
+                and abs(self.base_joules - self.changed_joules)
+                > threshold * (self.base_joules + self.changed_joules) / 2):
+            try:
+                self.always_display, t_score = perf.IsSignificant(base,
+                                                                  changed)
+            except ZeroDivisionError:
+                # No variance at all, but different means.
+                self.always_display, t_score = True, float('inf')
+            if self.always_display:
+                self.t_msg = 'Significant (t=%.2f)' % t_score
+
+    def __str__(self):
+        lines = ['Min: %.3f J -> %.3f J: %s'
+                 % (self.min_base, self.min_changed,
+                    perf.QuantityDelta(self.min_base, self.min_changed)),
+                 'Avg: %.3f J -> %.3f J: %s'
+                 % (self.base_joules, self.changed_joules,
+                    perf.QuantityDelta(self.base_joules,
+                                       self.changed_joules)),
+                 self.t_msg,
+                 'Stddev: %.5f -> %.5f: %s'
+                 % (self.std_base, self.std_changed,
+                    perf.QuantityDelta(self.std_base, self.std_changed))]
+        for label in self.base_readings[0]:
+            lines.append('  %s: %.3f J -> %.3f J'
+                         % (label,
+                            perf.avg([r[label] for r in self.base_readings]),
+                            perf.avg([r[label]
+                                      for r in self.changed_readings])))
+        return '\n'.join(lines)
+
+def compare(base_readings, changed_readings, options):
+    """
+    Compare two lists of Meter readings, in the manner of
+    perf.CompareMultipleRuns
+    """
+    return EnergyResult(base_readings, changed_readings, options)
@@ -0,0 +1,76 @@
+"""
+Sweeping gcc's garbage collector parameters.
+
+GGC collects when the heap has grown by ggc-min-expand percent since the
+last collection, and not before it reaches ggc-min-heapsize kB; both
+defaults are derived from the host's RAM, so the same build collects at
+different times on different hosts.  Running every peer at fixed points
+on the grid compares them at equal GC pressure, whatever the host.
+"""
+from __future__ import division
+
+from collections import OrderedDict, namedtuple
+import re
+
+import perf
+import stats
+
+# (ggc-min-expand, ggc-min-heapsize) pairs.  (0, 0) collects at every
+# opportunity; the largest values are the upper ends of gcc's defaults.
+DEFAULT_GRID = [(expand, heapsize)
+                for expand in (0, 30, 100)
+                for heapsize in (0, 4096, 131072)]
+
+def parse_grid(text):
+    """
+    Parse a grid given as e.g. "0:0,30:4096,100:131072", raising
+    ValueError if it's malformed
+    """
+    grid = []
+    for item in text.split(','):
+        m = re.match(r'^\s*([0-9]+):([0-9]+)\s*$', item)
+        if not m:
+            raise ValueError('bad gc grid point: %r (expected'
+                             ' EXPAND:HEAPSIZE, e.g. "30:4096")' % item)
+        grid.append((int(m.group(1)), int(m.group(2))))
+    return grid
+
+def get_param_args(point):
+    expand, heapsize = point
+    return ['--param', 'ggc-min-expand=%i' % expand,
+            '--param', 'ggc-min-heapsize=%i' % heapsize]
+
+SweepPoint = namedtuple('SweepPoint', ('time', 'ggc'))
+
+class GCSweepResult(object):
+    """
+    The time/memory trade-off curve of control and experiment, as an
+    ordered mapping from grid points to (control, experiment) pairs of
+    SweepPoint instances, each the median over the iterations.
+    """
+
+    always_display = True
+
+    def __init__(self):
+        self.points = OrderedDict()
+
+    def add(self, point, control_samples, experiment_samples):
+        """
+        Record the (time, ggc) samples of each peer at one grid point
+        """
+        self.points[point] = tuple(
+            SweepPoint(stats.median([s[0] for s in samples]),
+                       stats.median([s[1] for s in samples]))
+            for samples in (control_samples, experiment_samples))
+
+    def __str__(self):
+        lines = ['%-18s %-33s %s'
+                 % ('expand:heapsize', 'Wallclock (s)', 'Total ggc (KB)')]
+        for (expand, heapsize), (base, changed) in self.points.items():
+            lines.append('%-18s %8.3f -> %8.3f %-12s %10i -> %10i %-12s'
+                         % ('%i:%i' % (expand, heapsize),
+                            base.time, changed.time,
+                            perf.TimeDelta(base.time, changed.time),
+                            base.ggc, changed.ggc,
+                            perf.QuantityDelta(base.ggc, changed.ggc)))
+        return '\n'.join(lines)
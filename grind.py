@@ -0,0 +1,281 @@
+"""
+Deterministic measurement of compilations under valgrind's cachegrind or
+callgrind.
+
+The compilation is run once under the tool (following the driver into
+cc1/cc1plus), and the event counts it writes - instructions executed
+(Ir) and, with the cache simulation, data reads and writes and the
+simulated cache misses - are read back per function.  The counts don't
+depend on the host's load, so a single run per peer is enough, and even
+a 0.1% change is real.
+
+As the simulations are slow, run_jobs() runs several of them in parallel,
+and each result is cached as JSON under a hash of the tool, the valgrind
+version, the command line and its directory, and the contents of its
+inputs: the files on the command line (the driver and the sources) and
+the compilers in the directories given to -B.  Editing a source or
+rebuilding a compiler in place thus misses the cache, though editing a
+header that a source includes doesn't.
+"""
+from __future__ import division
+
+from collections import OrderedDict
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+import snapshot
+
+TOOLS = ('cachegrind', 'callgrind')
+
+# The processes whose counts are kept: the compilers proper, rather than
+# the driver.
+PROGRAMS = ('cc1', 'cc1plus')
+
+def get_valgrind_version():
+    return subprocess.check_output(['valgrind', '--version']).decode().strip()
+
+class Profile:
+    """
+    The event counts of a run: "events" is the list of event names,
+    "totals" an OrderedDict mapping them to counts, and "functions" a dict
+    mapping function names to lists of self counts, one per event
+    """
+    def __init__(self, events=(), totals=None, functions=None):
+        self.events = list(events)
+        self.totals = totals or OrderedDict((event, 0) for event in events)
+        self.functions = functions or {}
+
+    def to_json(self):
+        return {'events': self.events, 'totals': list(self.totals.items()),
+                'functions': self.functions}
+
+    @classmethod
+    def from_json(cls, obj):
+        return cls(obj['events'], OrderedDict(obj['totals']),
+                   obj['functions'])
+
+    def add(self, other):
+        """
+        Add the counts of another Profile with the same events
+        """
+        if not self.events:
+            self.events = list(other.events)
+            self.totals = OrderedDict((event, 0) for event in self.events)
+        for event, count in other.totals.items():
+            self.totals[event] = self.totals.get(event, 0) + count
+        for function, counts in other.functions.items():
+            mine = self.functions.setdefault(function, [0] * len(counts))
+            for idx, count in enumerate(counts):
+                mine[idx] += count
+
+def _parse_name(text, names):
+    """
+    Get a function name, where callgrind compresses repeated names as
+    "(id) name" the first time, then "(id)"
+    """
+    m = re.match(r'^\((\d+)\)(?:\s+(.*))?$', text)
+    if not m:
+        return text
+    if m.group(2) is not None:
+        names[m.group(1)] = m.group(2)
+    return names.get(m.group(1), m.group(1))
+
+def parse_output(text):
+    """
+    Parse a cachegrind.out or callgrind.out file, returning a (command,
+    Profile) pair
+    """
+    command = None
+    events = []
+    num_positions = 1
+    names = {}
+    function = None
+    functions = {}
+    skip_next = False
+    for line in text.splitlines():
+        if not line:
+            continue
+        if line.startswith('cmd:'):
+            command = line[4:].strip()
+        elif line.startswith('events:'):
+            events = line[7:].split()
+        elif line.startswith('positions:'):
+            num_positions = len(line[10:].split())
+        elif line.startswith('fn='):
+            function = _parse_name(line[3:], names)
+        elif line.startswith('cfn='):
+            # Only for the names it may define.
+            _parse_name(line[4:], names)
+        elif line.startswith('calls='):
+            # The next line is the inclusive cost of a call, which belongs
+            # to the callee.
+            skip_next = True
+        elif line[0].isdigit() or line[0] in '+-*':
+            if skip_next:
+                skip_next = False
+                continue
+            if function is None:
+                continue
+            fields = line.split()[num_positions:]
+            counts = functions.setdefault(function, [0] * len(events))
+            for idx, field in enumerate(fields[:len(events)]):
+                counts[idx] += int(field)
+    totals = OrderedDict((event, sum(counts[idx]
+                                     for counts in functions.values()))
+                         for idx, event in enumerate(events))
+    return command, Profile(events, totals, functions)
+
+def get_tool_args(tool, out_dir):
+    if tool not in TOOLS:
+        raise ValueError('unknown tool: %r' % tool)
+    return ['valgrind', '--tool=%s' % tool, '--trace-children=yes',
+            '--cache-sim=yes',
+            '--%s-out-file=%s' % (tool, os.path.join(out_dir, 'out.%p'))]
+
+def run(argv, tool='cachegrind', programs=PROGRAMS):
+    """
+    Run a command under tool, returning the Profile of the processes
+    among programs that it ran
+    """
+    out_dir = tempfile.mkdtemp(prefix='grind-')
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(get_tool_args(tool, out_dir) + list(argv),
+                                  stderr=devnull)
+        result = Profile()
+        for path in sorted(glob.glob(os.path.join(out_dir, 'out.*'))):
+            with open(path) as f:
+                command, profile = parse_output(f.read())
+            if command and os.path.basename(command.split()[0]) in programs:
+                result.add(profile)
+        return result
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+# The digests of the files hashed so far, by (path, size, mtime), so that
+# the compilers shared by many jobs are only read once.
+_digests = {}
+
+def get_digest(path):
+    statinfo = os.stat(path)
+    key = (path, statinfo.st_size, statinfo.st_mtime)
+    if key not in _digests:
+        hasher = hashlib.sha1()
+        snapshot.hash_file(path, hasher)
+        _digests[key] = hasher.hexdigest()
+    return _digests[key]
+
+def get_inputs(argv):
+    """
+    Get the paths of the files that a command line's result depends on:
+    the files among argv, and the snapshot.BINARIES in the directories
+    given to -B
+    """
+    paths = []
+    for idx, arg in enumerate(argv):
+        candidates = [arg]
+        if arg == '-B' and idx + 1 < len(argv):
+            candidates = [os.path.join(argv[idx + 1], name)
+                          for name in snapshot.BINARIES]
+        for path in candidates:
+            if os.path.isfile(path) and path not in paths:
+                paths.append(path)
+    return paths
+
+def get_cache_path(cache_dir, tool, argv, version):
+    inputs = [[path, get_digest(path)] for path in get_inputs(argv)]
+    text = json.dumps([tool, version, os.getcwd(), list(argv), inputs])
+    return os.path.join(cache_dir,
+                        hashlib.sha1(text.encode('utf-8')).hexdigest()
+                        + '.json')
+
+def run_cached(argv, tool, cache_dir, version):
+    """
+    As run(), but reusing the result of an identical run from cache_dir
+    """
+    path = get_cache_path(cache_dir, tool, argv, version)
+    if os.path.exists(path):
+        with open(path) as f:
+            return Profile.from_json(json.load(f)), True
+    profile = run(argv, tool)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(profile.to_json(), f)
+    os.rename(path + '.tmp', path)
+    return profile, False
+
+def run_jobs(argvs, tool, cache_dir, num_workers=None):
+    """
+    Run each of a list of command lines under tool, num_workers at a time
+    (default: one per CPU), returning a list of (Profile, cached) pairs in
+    the same order
+    """
+    version = get_valgrind_version()
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    pool = ThreadPool(num_workers)
+    try:
+        return pool.map(lambda argv: run_cached(argv, tool, cache_dir,
+                                                version),
+                        argvs)
+    finally:
+        pool.close()
+        pool.join()
+
+class GrindResult(object):
+    """
+    The change in the event counts of control and experiment, in total
+    and for the functions whose instruction counts changed most
+    """
+    def __init__(self, base, changed, max_rows=20):
+        self.base = base
+        self.changed = changed
+        self.max_rows = max_rows
+        self.always_display = self.base_total != self.changed_total
+
+    @property
+    def base_total(self):
+        return list(self.base.totals.values())[0] if self.base.events else 0
+
+    @property
+    def changed_total(self):
+        return (list(self.changed.totals.values())[0]
+                if self.changed.events else 0)
+
+    def __str__(self):
+        if not self.base.events:
+            return 'No events recorded'
+        lines = []
+        for event in self.base.events:
+            old = self.base.totals[event]
+            new = self.changed.totals.get(event, 0)
+            change = ' %+.3f%%' % (100. * (new - old) / old) if old else ''
+            lines.append('%s: %i -> %i: %+i%s'
+                         % (event, old, new, new - old, change))
+        diffs = []
+        for function in set(self.base.functions) | set(self.changed.functions):
+            old = self.base.functions.get(function, [0])[0]
+            new = self.changed.functions.get(function, [0])[0]
+            if old != new:
+                diffs.append((new - old, function, old, new))
+        diffs.sort(key=lambda d: (-abs(d[0]), d[1]))
+        if diffs:
+            lines.append('Largest changes in %s:' % self.base.events[0])
+            for delta, function, old, new in diffs[:self.max_rows]:
+                lines.append('  %i -> %i: %+i  %s'
+                             % (old, new, delta, function))
+        return '\n'.join(lines)
+
+def compare(base, changed, options=None):
+    """
+    Compare two Profiles, in the manner of perf.CompareMultipleRuns
+    """
+    return GrindResult(base, changed)
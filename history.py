@@ -0,0 +1,298 @@
+"""
+Change-point detection over historical benchmark.py results.
+
+Usage:
+  python history.py [options] LOG_DIR_OR_FILE [LOG_DIR_OR_FILE...]
+
+Every benchmark.py log found is read once, in date order, and the median
+of each (measurement, test, peer) configuration is appended to a per-
+configuration time series.  Each series is then segmented with PELT
+(Killick et al, 2012) using a Gaussian change-in-mean cost.  PELT's
+pruning makes it linear in the length of a series when the changes are
+spread through it, but a long series with no change at all is quadratic:
+a year or two of nightly runs takes well under a second, but 5000 points
+take seconds.
+
+Logs from different environments (see preflight.py) are not compared
+unless asked to be.
+"""
+from __future__ import division, print_function
+
+from collections import OrderedDict, namedtuple
+import math
+import optparse
+import os
+import re
+import sys
+import time
+
+import stats
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+class BenchmarkLog:
+    """
+    The samples from one benchmark.py log, as an ordered mapping from
+    (kind, test_name, peer_name) to lists of floats, where kind is
+    either "compare_wallclock" or "compare_memory".
+    """
+    def __init__(self, path):
+        self.path = path
+        self.date = None
+        self.fingerprint = None
+        self.samples = OrderedDict()
+        kind = test_name = None
+        with open(path) as f:
+            for line in f:
+                m = re.match('started: (.+)', line)
+                if m:
+                    self.date = time.mktime(
+                        time.strptime(m.group(1).strip(), DATE_FORMAT))
+                    continue
+
+                m = re.match('fingerprint: ([0-9a-f]+)', line)
+                if m:
+                    self.fingerprint = m.group(1)
+                    continue
+
+                m = re.match('(compare_[a-z_]+): (.+)', line)
+                if m:
+                    kind, test_name = m.groups()
+                    test_name = test_name.replace('test-sources/', '')
+                    continue
+
+                # e.g. "  iteration 3: control: xgcc ...: time_taken: 1.25"
+                m = re.match(r'  iteration [0-9]+: ([^:]+): .*: '
+                             r'(time_taken|total_ggc): ([0-9.e+-]+)', line)
+                if m and kind:
+                    peer_name, _, value = m.groups()
+                    key = (kind, test_name, peer_name)
+                    self.samples.setdefault(key, []).append(float(value))
+        if self.date is None:
+            # Older logs don't record when they were started.
+            self.date = os.path.getmtime(path)
+
+def iter_log_paths(paths):
+    """
+    Expand a list of files and directories into the log files within them
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith('.txt') or filename.endswith('.log'):
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+class Series:
+    """
+    The history of a single configuration: parallel lists of dates (as
+    seconds since the epoch), medians and log paths.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.dates = []
+        self.values = []
+        self.paths = []
+
+    def append(self, date, value, path):
+        self.dates.append(date)
+        self.values.append(value)
+        self.paths.append(path)
+
+def read_logs(paths):
+    """
+    Read each log exactly once, returning a list of BenchmarkLog instances
+    in date order
+    """
+    return sorted((BenchmarkLog(path) for path in iter_log_paths(paths)),
+                  key=lambda log: log.date)
+
+def get_fingerprints(logs):
+    """
+    Get an OrderedDict mapping the environment fingerprints of the logs
+    (those that record one) to the number of logs with each
+    """
+    counts = OrderedDict()
+    for log in logs:
+        if log.fingerprint is not None:
+            counts[log.fingerprint] = counts.get(log.fingerprint, 0) + 1
+    return counts
+
+def build_series(logs):
+    """
+    Return an OrderedDict mapping configuration keys to Series instances,
+    each in date order, given a list of BenchmarkLogs in date order.
+    """
+    series = OrderedDict()
+    for log in logs:
+        for key, samples in log.samples.items():
+            if key not in series:
+                series[key] = Series(key)
+            series[key].append(log.date, stats.median(samples), log.path)
+    return series
+
+def estimate_variance(values):
+    """
+    Robustly estimate the noise variance of a series from the median
+    absolute difference between neighbours, so that step changes don't
+    inflate the estimate.
+    """
+    if len(values) < 3:
+        return 0.
+    diffs = [abs(b - a) for a, b in zip(values, values[1:])]
+    sigma = stats.median(diffs) / (0.6745 * math.sqrt(2))
+    return sigma ** 2
+
+def pelt(values, penalty=None, min_size=2):
+    """
+    Find change points in the mean of a series using PELT.
+
+    Returns a list of indices; each is the index of the first value of a
+    new segment.
+    """
+    n = len(values)
+    if n < 2 * min_size:
+        return []
+    if penalty is None:
+        variance = estimate_variance(values)
+        if variance == 0.:
+            # Use the overall variance so that a perfectly flat history
+            # with a single step is still handled.
+            mean = sum(values) / n
+            variance = sum((x - mean) ** 2 for x in values) / n
+            if variance == 0.:
+                return []
+        penalty = 3 * variance * math.log(n)
+
+    # Prefix sums give the cost of any segment in constant time.
+    s1 = [0.]
+    s2 = [0.]
+    for x in values:
+        s1.append(s1[-1] + x)
+        s2.append(s2[-1] + x * x)
+
+    def cost(start, end):
+        count = end - start
+        total = s1[end] - s1[start]
+        return (s2[end] - s2[start]) - total * total / count
+
+    best = [-penalty] + [0.] * n
+    last_change = [0] * (n + 1)
+    candidates = [0]
+    for end in range(min_size, n + 1):
+        scores = [(best[start] + cost(start, end) + penalty, start)
+                  for start in candidates if end - start >= min_size]
+        best[end], last_change[end] = min(scores)
+        # Prune candidates that can never be optimal again: splitting a
+        # segment never increases this cost, so a start whose cost is
+        # already worse than the best, before the penalty, stays worse.
+        candidates = [start for start in candidates
+                      if end - start < min_size
+                      or best[start] + cost(start, end) <= best[end]]
+        if end - min_size + 1 >= min_size:
+            candidates.append(end - min_size + 1)
+
+    changes = []
+    end = n
+    while end > 0:
+        start = last_change[end]
+        if start > 0:
+            changes.append(start)
+        end = start
+    return sorted(changes)
+
+Change = namedtuple('Change', ('key', 'before', 'after',
+                               'earliest', 'latest', 'path'))
+
+def find_changes(series, penalty=None, min_size=2):
+    """
+    Run change-point detection on one Series, returning a list of Change
+    instances.  "before" and "after" are the means of the neighbouring
+    segments, and the change happened between the dates "earliest" and
+    "latest".
+    """
+    values = series.values
+    indices = pelt(values, penalty, min_size)
+    bounds = [0] + indices + [len(values)]
+    result = []
+    for prev_start, idx, next_end in zip(bounds, bounds[1:], bounds[2:]):
+        before = values[prev_start:idx]
+        after = values[idx:next_end]
+        result.append(Change(series.key,
+                             sum(before) / len(before),
+                             sum(after) / len(after),
+                             series.dates[idx - 1],
+                             series.dates[idx],
+                             series.paths[idx]))
+    return result
+
+def format_change(change):
+    kind, test_name, peer_name = change.key
+    if kind == 'compare_memory':
+        units = 'KB'
+    else:
+        units = 's'
+    # A series can be 0 until a step, e.g. of memory or a counter.
+    pc = ''
+    if change.before:
+        pc = ' (%+.1f%%)' % ((100. * change.after / change.before) - 100.)
+    return ('%s: %s: %s: %.5g -> %.5g %s%s between %s and %s (%s)'
+            % (kind, peer_name, test_name, change.before, change.after,
+               units, pc,
+               time.strftime(DATE_FORMAT, time.localtime(change.earliest)),
+               time.strftime(DATE_FORMAT, time.localtime(change.latest)),
+               change.path))
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [options] LOG_DIR_OR_FILE [LOG_DIR_OR_FILE...]",
+        description=("Detect step changes and drift across many"
+                     " benchmark.py logs."))
+    parser.add_option("--penalty", type="float", default=None,
+                      help=("PELT penalty per change point. Default is"
+                            " 3*sigma^2*log(n), with sigma estimated from"
+                            " each series."))
+    parser.add_option("--min_size", type="int", default=2,
+                      help=("Minimum number of runs between change points."
+                            " Default is %default."))
+    parser.add_option("--peer", default=None,
+                      help="Only analyze the given peer, e.g. 'control'.")
+    parser.add_option("--fingerprint", default=None,
+                      help=("Only analyze the logs from the environment with"
+                            " this fingerprint (and older logs that don't"
+                            " record one)."))
+    parser.add_option("--allow_mismatch", action="store_true",
+                      help=("Analyze logs from different environments"
+                            " together."))
+    options, args = parser.parse_args(argv)
+    if not args:
+        parser.error("no logs given")
+
+    logs = read_logs(args)
+    if options.fingerprint:
+        logs = [log for log in logs
+                if log.fingerprint in (None, options.fingerprint)]
+    fingerprints = get_fingerprints(logs)
+    if len(fingerprints) > 1 and not options.allow_mismatch:
+        parser.error("the logs come from %i different environments (%s);"
+                     " choose one with --fingerprint, or use"
+                     " --allow_mismatch"
+                     % (len(fingerprints),
+                        ', '.join('%s: %i logs' % item
+                                  for item in fingerprints.items())))
+
+    series = build_series(logs)
+    num_changes = 0
+    for key, s in series.items():
+        if options.peer and key[2] != options.peer:
+            continue
+        for change in find_changes(s, options.penalty, options.min_size):
+            print(format_change(change))
+            num_changes += 1
+    print('%i change(s) in %i series' % (num_changes, len(series)))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
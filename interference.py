@@ -0,0 +1,219 @@
+"""
+Monitoring of the host for interference while a sample is being taken.
+
+While a Monitor is running, a background thread polls the CPU frequencies
+(cpufreq's scaling_cur_freq) and the thermal zones; /proc/stat, the
+thermal throttle counters and the CPU time of this process and its
+children are read at the start and end.  The resulting Reading gives the
+CPU time used by other processes ("foreign" load), the load average, the
+mean frequency of the fastest CPU, the hottest temperature and the number
+of thermal throttling events.
+
+find_contaminated() then marks the samples taken during throttling, a
+frequency dip, or foreign CPU load, so that they can be excluded or rerun.
+
+All paths are relative to a root directory, so that a fake /proc and /sys
+can be used instead of the host's.
+"""
+from __future__ import division
+
+from collections import namedtuple
+import glob
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# A sample is contaminated if other processes used more than this many
+# CPUs on average while it was taken...
+MAX_FOREIGN_CPUS = 0.5
+
+# ...or if the CPU frequency was below this fraction of the highest seen
+# during the run.
+MIN_FREQ_RATIO = 0.9
+
+# What to do with contaminated samples: only report them, leave them out
+# of the comparison, or run replacement iterations and then leave them out.
+MODES = ('tag', 'exclude', 'rerun')
+
+# How often the background thread polls frequencies and temperatures.
+POLL_INTERVAL = 0.1
+
+class Reading(namedtuple('Reading', ('elapsed', 'foreign_cpus', 'loadavg',
+                                       'freq', 'temp', 'throttles'))):
+    """
+    What the host was doing while one sample was taken.  "freq" is in
+    kHz and "temp" in degrees Celsius; either may be None if the host
+    doesn't report it.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        parts = ['foreign load %.2f CPUs' % self.foreign_cpus]
+        if self.loadavg is not None:
+            parts.append('loadavg %.2f' % self.loadavg)
+        if self.freq is not None:
+            parts.append('freq %.2f GHz' % (self.freq / 1e6))
+        if self.temp is not None:
+            parts.append('temp %.0fC' % self.temp)
+        if self.throttles:
+            parts.append('%i throttling events' % self.throttles)
+        return ', '.join(parts)
+
+def _read_file(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+class Monitor:
+    """
+    Watches the host between start() and stop(), at low overhead.
+    A Monitor can be started and stopped any number of times.
+    """
+    def __init__(self, root='/', interval=POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.freq_paths = self._glob(
+            'sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq')
+        self.temp_paths = self._glob('sys/class/thermal/thermal_zone*/temp')
+        self.throttle_paths = self._glob(
+            'sys/devices/system/cpu/cpu[0-9]*/thermal_throttle/'
+            '*_throttle_count')
+        try:
+            self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        except (AttributeError, ValueError, OSError):
+            self.clock_ticks = 100
+        self._thread = None
+
+    def _path(self, relpath):
+        return os.path.join(self.root, relpath)
+
+    def _glob(self, pattern):
+        return sorted(glob.glob(self._path(pattern)))
+
+    def read_busy_time(self):
+        """
+        Get the CPU time in seconds spent by all CPUs outside the idle
+        and iowait states, from /proc/stat
+        """
+        text = _read_file(self._path('proc/stat'))
+        if text is None:
+            return None
+        fields = [int(field) for field in text.splitlines()[0].split()[1:]]
+        # user nice system idle iowait irq softirq steal ...
+        busy = sum(fields) - fields[3] - (fields[4] if len(fields) > 4 else 0)
+        return busy / self.clock_ticks
+
+    def read_loadavg(self):
+        text = _read_file(self._path('proc/loadavg'))
+        if text is None:
+            return None
+        return float(text.split()[0])
+
+    def read_freq(self):
+        """
+        The frequency of the fastest CPU in kHz: that of the CPU running
+        the benchmark, if the others are idle
+        """
+        freqs = [_read_file(path) for path in self.freq_paths]
+        freqs = [int(freq) for freq in freqs if freq]
+        return max(freqs) if freqs else None
+
+    def read_temp(self):
+        """
+        The temperature of the hottest thermal zone in degrees Celsius
+        """
+        temps = [_read_file(path) for path in self.temp_paths]
+        temps = [int(temp) / 1000. for temp in temps if temp]
+        return max(temps) if temps else None
+
+    def read_throttles(self):
+        counts = [_read_file(path) for path in self.throttle_paths]
+        return sum(int(count) for count in counts if count)
+
+    def _own_time(self):
+        if resource is None:
+            return 0.
+        total = 0.
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+            usage = resource.getrusage(who)
+            total += usage.ru_utime + usage.ru_stime
+        return total
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self._poll_once()
+
+    def _poll_once(self):
+        freq = self.read_freq()
+        if freq is not None:
+            self._freqs.append(freq)
+        temp = self.read_temp()
+        if temp is not None:
+            self._temps.append(temp)
+
+    def start(self):
+        self._freqs = []
+        self._temps = []
+        self._poll_once()
+        self._throttles = self.read_throttles()
+        self._own = self._own_time()
+        self._busy = self.read_busy_time()
+        self._t0 = time.time()
+        if self.freq_paths or self.temp_paths:
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._poll)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop monitoring, returning a Reading covering the time since start()
+        """
+        elapsed = time.time() - self._t0
+        busy = self.read_busy_time()
+        own = self._own_time()
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self._poll_once()
+        foreign_cpus = 0.
+        if busy is not None and self._busy is not None and elapsed > 0:
+            # Allow for the resolution of /proc/stat: a couple of ticks.
+            foreign = ((busy - self._busy) - (own - self._own)
+                       - 2. / self.clock_ticks)
+            foreign_cpus = max(foreign, 0.) / elapsed
+        return Reading(elapsed, foreign_cpus, self.read_loadavg(),
+                       (sum(self._freqs) / len(self._freqs)
+                        if self._freqs else None),
+                       max(self._temps) if self._temps else None,
+                       self.read_throttles() - self._throttles)
+
+def find_contaminated(readings, max_foreign_cpus=MAX_FOREIGN_CPUS,
+                      min_freq_ratio=MIN_FREQ_RATIO):
+    """
+    Judge a list of Readings from one run, returning a list with, for each
+    reading, None if its sample is clean or else the reason it is not
+    """
+    freqs = [r.freq for r in readings if r.freq is not None]
+    reference = max(freqs) if freqs else None
+    reasons = []
+    for r in readings:
+        if r.throttles:
+            reasons.append('thermal throttling')
+        elif reference and r.freq is not None \
+                and r.freq < reference * min_freq_ratio:
+            reasons.append('CPU frequency at %.0f%% of maximum'
+                           % (100. * r.freq / reference))
+        elif r.foreign_cpus > max_foreign_cpus:
+            reasons.append('foreign load of %.2f CPUs' % r.foreign_cpus)
+        else:
+            reasons.append(None)
+    return reasons
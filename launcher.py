@@ -0,0 +1,292 @@
+"""
+A low-overhead process launcher, for benchmarks made of many short runs
+(compiling empty.c, "python -c ''") where the harness's own cost of
+starting a process is a visible fraction of the result.
+
+The argv and environment are prepared once, up front.  Each launch then
+uses os.posix_spawn where it exists (Python 3.8 and later) or a bare
+fork/execve, and reaps the child with os.wait4, so that the resource
+usage of every launch comes for free.  posix_spawn can't change the
+child's directory without changing ours, which isn't thread-safe, so a
+launch in another directory uses fork/execve.  subprocess is only used
+where neither is available.
+
+A launch can be given a timeout, after which the child's whole process
+group (the driver and the compilers it runs) is killed.
+
+The launcher's own cost can be measured by launching /bin/true, once per
+process.
+"""
+from __future__ import division, print_function
+
+from collections import namedtuple, OrderedDict
+import optparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+clock = getattr(time, 'perf_counter', time.time)
+
+BACKENDS = ('spawn', 'fork', 'subprocess')
+
+if hasattr(os, 'posix_spawn'):
+    DEFAULT_BACKEND = 'spawn'
+elif hasattr(os, 'fork'):
+    DEFAULT_BACKEND = 'fork'
+else:
+    DEFAULT_BACKEND = 'subprocess'
+
+TRUE = '/bin/true'
+
+STDERR_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+
+PERCENTILES = (50, 90, 99)
+
+# measure_overhead()'s results, by (count, backend).
+_overhead = {}
+
+# "elapsed" is the wallclock time of the launch; "utime" the user CPU time,
+# "minflt" and "majflt" the page faults and "inblock" the 512-byte blocks
+# read from storage by the child (None if the backend can't get them);
+# "status" is its exit status, negative if it was killed by a signal, as
+# for subprocess; "timed_out" is true if it was killed for running past
+# its timeout.
+Launch = namedtuple('Launch', ('elapsed', 'status', 'utime', 'minflt',
+                               'majflt', 'inblock', 'timed_out'))
+
+def find_executable(name, env=None):
+    """
+    Find a program on the PATH of env (default: os.environ), as execvp would
+    """
+    if os.sep in name:
+        return name
+    path = (env if env is not None else os.environ).get('PATH', os.defpath)
+    for dirname in path.split(os.pathsep):
+        candidate = os.path.join(dirname, name)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    raise OSError('%s: not found on PATH' % name)
+
+class Killer:
+    """
+    Kills the process group led by a child once timeout seconds have
+    passed (never, if timeout is None), unless cancelled first
+    """
+    def __init__(self, pid, timeout):
+        self.pid = pid
+        self.fired = False
+        self._lock = threading.Lock()
+        self._timer = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._kill)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _kill(self):
+        with self._lock:
+            if self.pid is None:
+                return
+            self.fired = True
+            try:
+                os.killpg(self.pid, signal.SIGKILL)
+            except OSError:
+                # It has already gone.
+                pass
+
+    def cancel(self):
+        """
+        Stop the timer once the child has been reaped, returning whether it
+        killed the child
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            # Don't leave the thread behind, e.g. at interpreter shutdown.
+            self._timer.join()
+        with self._lock:
+            self.pid = None
+        return self.fired
+
+def _decode_status(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+class Launcher:
+    """
+    Launches one command line over and over again.
+
+    "env" is the complete environment of the child (default: a copy of
+    os.environ); if "quiet", the child's stdout goes to /dev/null; if
+    "stderr_path" is given, each launch overwrites that file with its
+    stderr; if "cwd" is given, the child runs there (which the spawn
+    backend can't do).
+    """
+    def __init__(self, argv, env=None, quiet=False, backend=None,
+                 stderr_path=None, cwd=None):
+        if backend is None:
+            backend = DEFAULT_BACKEND
+            if cwd and backend == 'spawn':
+                backend = 'fork'
+        if backend not in BACKENDS:
+            raise ValueError('unknown backend: %r' % backend)
+        if cwd and backend == 'spawn':
+            raise ValueError('the spawn backend cannot set the directory')
+        self.argv = list(argv)
+        self.env = dict(env if env is not None else os.environ)
+        self.path = find_executable(self.argv[0], self.env)
+        self.quiet = quiet
+        self.stderr_path = stderr_path
+        self.cwd = cwd
+        self.backend = backend
+        self._file_actions = []
+        if backend == 'spawn':
+            if quiet:
+                self._file_actions.append((os.POSIX_SPAWN_OPEN, 1, os.devnull,
+                                           os.O_WRONLY, 0))
+            if stderr_path:
+                self._file_actions.append((os.POSIX_SPAWN_OPEN, 2, stderr_path,
+                                           STDERR_FLAGS, 0o600))
+
+    def __repr__(self):
+        return 'Launcher(%r, backend=%r)' % (self.argv, self.backend)
+
+    def launch(self, timeout=None):
+        """
+        Run the command once, returning a Launch.  If a timeout (in
+        seconds) is given, the child runs in a process group of its own,
+        which is killed if it's still running by then.
+        """
+        if self.backend == 'subprocess':
+            return self._launch_subprocess(timeout)
+        if self.backend == 'spawn':
+            kwargs = {}
+            if self._file_actions:
+                kwargs['file_actions'] = self._file_actions
+            if timeout is not None:
+                kwargs['setpgroup'] = 0
+            t0 = clock()
+            pid = os.posix_spawn(self.path, self.argv, self.env, **kwargs)
+        else:
+            t0 = clock()
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    if timeout is not None:
+                        os.setpgid(0, 0)
+                    if self.cwd:
+                        os.chdir(self.cwd)
+                    if self.quiet:
+                        os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+                    if self.stderr_path:
+                        os.dup2(os.open(self.stderr_path, STDERR_FLAGS,
+                                        0o600), 2)
+                    os.execve(self.path, self.argv, self.env)
+                finally:
+                    os._exit(127)
+            if timeout is not None:
+                # Also from this side, so that the group exists before the
+                # killer can need it.
+                try:
+                    os.setpgid(pid, pid)
+                except OSError:
+                    pass
+        killer = Killer(pid, timeout)
+        _, status, rusage = os.wait4(pid, 0)
+        t1 = clock()
+        return Launch(t1 - t0, _decode_status(status), rusage.ru_utime,
+                      rusage.ru_minflt, rusage.ru_majflt, rusage.ru_inblock,
+                      killer.cancel())
+
+    def _launch_subprocess(self, timeout=None):
+        stdout = open(os.devnull, 'wb') if self.quiet else None
+        stderr = open(self.stderr_path, 'wb') if self.stderr_path else None
+        try:
+            t0 = clock()
+            p = subprocess.Popen(self.argv, env=self.env, stdout=stdout,
+                                 stderr=stderr, cwd=self.cwd,
+                                 preexec_fn=(os.setpgrp if timeout is not None
+                                             else None))
+            killer = Killer(p.pid, timeout)
+            status = p.wait()
+            t1 = clock()
+        finally:
+            for f in (stdout, stderr):
+                if f is not None:
+                    f.close()
+        return Launch(t1 - t0, status, None, None, None, None,
+                      killer.cancel())
+
+    def run(self, count, check=True):
+        """
+        Launch the command "count" times, returning a list of Launch
+        instances.  If "check", a nonzero exit status raises RuntimeError.
+        """
+        launches = []
+        for _ in range(count):
+            launch = self.launch()
+            if check and launch.status != 0:
+                raise RuntimeError('%s exited with status %i'
+                                   % (' '.join(self.argv), launch.status))
+            launches.append(launch)
+        return launches
+
+def percentile(values, p):
+    """
+    The p-th percentile of the values, by the nearest-rank method
+    """
+    values = sorted(values)
+    rank = int(-(-p * len(values) // 100))
+    return values[max(rank, 1) - 1]
+
+def summarize(times):
+    """
+    Get an OrderedDict of the percentiles and maximum of a list of times
+    """
+    summary = OrderedDict(('p%i' % p, percentile(times, p))
+                          for p in PERCENTILES)
+    summary['max'] = max(times)
+    return summary
+
+def format_summary(times):
+    """
+    Describe a list of times (in seconds) as e.g.
+    "p50 1.234 ms, p90 1.301 ms, p99 1.502 ms, max 2.013 ms"
+    """
+    return ', '.join('%s %.3f ms' % (name, 1000. * value)
+                     for name, value in summarize(times).items())
+
+def measure_overhead(count=100, backend=None):
+    """
+    Launch /bin/true "count" times, returning the list of times: the floor
+    under which no launch through this backend can go.  This is only
+    measured the first time for each count and backend.
+    """
+    key = (count, backend)
+    if key not in _overhead:
+        launcher = Launcher([TRUE], backend=backend)
+        _overhead[key] = [launch.elapsed for launch in launcher.run(count)]
+    return _overhead[key]
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [options] [command...]",
+        description=("Report the per-launch time of a command (default: %s)"
+                     " with each available backend." % TRUE))
+    parser.add_option("-n", "--count", type="int", default=200,
+                      help="Number of launches per backend")
+    parser.disable_interspersed_args()
+    options, args = parser.parse_args(argv)
+    argv = args or [TRUE]
+    for backend in BACKENDS:
+        if ((backend == 'spawn' and not hasattr(os, 'posix_spawn'))
+                or (backend == 'fork' and not hasattr(os, 'fork'))):
+            continue
+        launcher = Launcher(argv, quiet=True, backend=backend)
+        times = [launch.elapsed for launch in launcher.run(options.count)]
+        print('%-10s %s' % (backend, format_summary(times)))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,140 @@
+"""
+Randomization of the memory layout that the compiler runs with.
+
+A change of 1-2% in compile time can come from nothing more than where
+code and the stack end up: the size of the environment and of the
+working directory's name shift the initial stack, and the link order of
+cc1plus decides which functions share cache lines and pages.  Measuring
+each peer under several random layouts, and comparing the per-layout
+means, turns that layout luck into visible noise instead of a bias.
+
+A Layout pads the environment with LAYOUT_PADDING, runs the compiler in a
+directory whose name has a given length, and may pick one of a peer's
+relinked variants of the compiler.  The variants, if any, are the
+directories PEER/layout-variants/*/, each containing e.g. a cc1plus
+relinked with a randomized function order (for instance with
+-ffunction-sections and lld's -Wl,--shuffle-sections=SEED); passing such a
+directory to gcc with -B before the peer's own makes gcc use the binaries
+there and everything else from the peer.
+"""
+from __future__ import division
+
+from collections import namedtuple
+import glob
+import os
+import random
+import shutil
+import tempfile
+
+import stats
+
+VARIANTS_DIR = 'layout-variants'
+
+# The environment padding and directory name lengths are drawn uniformly
+# from these ranges: a page's worth of stack shift, and enough to cross
+# several cache lines.
+MAX_ENV_PADDING = 4096
+MAX_CWD_LENGTH = 200
+
+class Layout(namedtuple('Layout', ('env_padding', 'cwd_length', 'variant'))):
+    """
+    One layout: the number of bytes of environment padding, the length of
+    the working directory's name, and the index of the relinked variant to
+    use (None for the peer's own binaries)
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        text = 'env +%i bytes, cwd name %i chars' % (self.env_padding,
+                                                      self.cwd_length)
+        if self.variant is not None:
+            text += ', variant %i' % self.variant
+        return text
+
+    def get_env(self, cwd, env=None):
+        """
+        Get a copy of env (default: os.environ) for running in cwd under
+        this layout
+        """
+        env = dict(env if env is not None else os.environ)
+        env['LAYOUT_PADDING'] = 'x' * self.env_padding
+        env['PWD'] = cwd
+        return env
+
+    def make_cwd(self, parent):
+        """
+        Make (if need be) and return the working directory for this layout
+        under parent
+        """
+        path = os.path.join(parent, 'd' * self.cwd_length)
+        if not os.path.isdir(path):
+            os.mkdir(path)
+        return path
+
+    def get_variant_dir(self, variants):
+        """
+        Get the directory of this layout's variant from a peer's list of
+        variant directories, or None to use the peer's own binaries
+        """
+        if self.variant is None or not variants:
+            return None
+        return variants[self.variant % len(variants)]
+
+def find_variants(path):
+    """
+    Get the sorted list of the relinked variant directories of a build
+    directory
+    """
+    return sorted(dirname for dirname
+                  in glob.glob(os.path.join(path, VARIANTS_DIR, '*'))
+                  if os.path.isdir(dirname))
+
+def make_layouts(count, seed, num_variants=0):
+    """
+    Get a list of count random Layouts from a seed.  If there are relinked
+    variants, the layouts use each of them in turn, and the peers' own
+    binaries too.
+    """
+    rng = random.Random(seed)
+    layouts = []
+    for idx in range(count):
+        variant = None
+        if idx % (num_variants + 1):
+            variant = idx % (num_variants + 1) - 1
+        layouts.append(Layout(rng.randrange(MAX_ENV_PADDING),
+                              rng.randint(1, MAX_CWD_LENGTH), variant))
+    return layouts
+
+def make_args_absolute(args):
+    """
+    Make the paths of existing files among args absolute, so that they can
+    be used from a layout's working directory
+    """
+    return [os.path.abspath(arg)
+            if not arg.startswith('-') and os.path.exists(arg) else arg
+            for arg in args]
+
+def describe_changes(base_means, changed_means):
+    """
+    Describe the spread over the layouts of the relative change between
+    two lists of per-layout means
+    """
+    changes = sorted(changed / base - 1. for base, changed
+                     in zip(base_means, changed_means))
+    return ('change %+.2f%% .. %+.2f%% over %i layouts (median %+.2f%%)'
+            % (100 * changes[0], 100 * changes[-1], len(changes),
+               100 * stats.median(changes)))
+
+class WorkDirs:
+    """
+    A temporary parent directory for the layouts' working directories,
+    removed by cleanup()
+    """
+    def __init__(self):
+        self.parent = tempfile.mkdtemp(prefix='layout-')
+
+    def get(self, layout):
+        return layout.make_cwd(self.parent)
+
+    def cleanup(self):
+        shutil.rmtree(self.parent, ignore_errors=True)
@@ -0,0 +1,198 @@
+"""
+Parsing of gcc's -fmem-report output into structured records, and
+diffing of those records between control and experiment.
+
+The tables recognized are:
+  - "ggc-size": the GGC page usage per object size at the end of the
+    compilation ("Memory still allocated at the end of ...")
+  - "line-table", "string-pool": the name/value statistics sections
+  - the per-node tables ("Kind  Nodes  Bytes" and so on)
+  - the dashed tables emitted by a gcc configured with
+    --enable-gather-detailed-mem-stats ("GGC memory", "Heap vectors",
+    "Bitmaps" etc), whose keys are call sites such as
+    "cp/lex.c:613 (build_lang_decl_loc)"
+"""
+from __future__ import division
+
+from collections import OrderedDict, namedtuple
+import re
+
+MemRecord = namedtuple('MemRecord', ('table', 'key', 'fields'))
+
+SIZE = r'-?[0-9]+(?:\.[0-9]+)?[kMG]?'
+
+# The field used to rank records within a table, in order of preference
+BYTES_FIELDS = ('Allocated', 'Bytes', 'Leak', 'Peak', 'Size')
+
+def parse_size(text):
+    """
+    Convert e.g. "1572k" into bytes
+    """
+    multiplier = {'k': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}.get(text[-1])
+    if multiplier:
+        return float(text[:-1]) * multiplier
+    return float(text)
+
+def is_call_site(key):
+    """
+    Is this record key a source location, as gathered by
+    --enable-gather-detailed-mem-stats?
+    """
+    return re.match(r'^\S+:[0-9]+ \(.*\)$', key) is not None
+
+def _is_dashes(line):
+    return line.startswith('----')
+
+def _split_header(text):
+    """
+    Split a table header on runs of spaces, disambiguating repeated
+    column names (e.g. the two "Times" of the GGC memory table)
+    """
+    columns = []
+    for column in re.split(r'\s{2,}', text.strip()):
+        name = column
+        count = 2
+        while name in columns:
+            name = '%s %i' % (column, count)
+            count += 1
+        columns.append(name)
+    return columns
+
+def _parse_row(line, columns):
+    parts = re.split(r'\s{2,}', line.strip(), 1)
+    if len(parts) != 2:
+        return None
+    name, rest = parts
+    # Drop the percentages that some tables pair with each figure.
+    rest = re.sub(r':\s*-?[0-9.]+%|\(\s*-?[0-9.]+%\)', ' ', rest)
+    values = re.findall(r'(?:^|\s)(' + SIZE + r')(?=\s|$)', rest)
+    if not values:
+        return None
+    fields = OrderedDict()
+    for column, value in zip(columns, values):
+        fields[column] = parse_size(value)
+    return name, fields
+
+def parse_mem_report(err):
+    """
+    Parse the stderr of a compilation run with -fmem-report.
+    Returns a list of MemRecord instances, in the order they appeared.
+    """
+    records = []
+    lines = err.splitlines()
+    section = None
+    table = None
+    columns = None
+    for idx, line in enumerate(lines):
+        stripped = line.strip()
+        next_line = lines[idx + 1] if idx + 1 < len(lines) else ''
+        prev_line = lines[idx - 1] if idx > 0 else ''
+
+        if not stripped:
+            section = table = None
+            continue
+
+        if line.startswith('Memory still allocated at the end'):
+            section, table, columns = 'table', 'ggc-size', None
+            continue
+        if line.startswith('Line Table allocations'):
+            section, table = 'stats', 'line-table'
+            continue
+        if line.startswith('String pool'):
+            section, table = 'stats', 'string-pool'
+            continue
+
+        # The dashed tables: a header line between two lines of dashes.
+        if (_is_dashes(prev_line) and _is_dashes(next_line)
+                and not _is_dashes(line)):
+            header = _split_header(stripped)
+            section, table, columns = 'table', header[0], header[1:]
+            continue
+        if _is_dashes(line):
+            continue
+
+        # e.g. "Kind                   Nodes      Bytes"
+        m = re.match(r'^(Kind|Code)\s+(.*)$', line)
+        if m:
+            section, table = 'table', 'per-%s' % m.group(1).lower()
+            columns = re.split(r'\s+', m.group(2).strip())
+            continue
+
+        if section == 'table':
+            if columns is None:
+                # The header of the ggc-size table.
+                columns = re.split(r'\s+', stripped)[1:]
+                continue
+            row = _parse_row(line, columns)
+            if row:
+                records.append(MemRecord(table, row[0], row[1]))
+        elif section == 'stats':
+            m = re.match(r'^([^:]+?):?\s+(' + SIZE + r')\b', stripped)
+            if m:
+                fields = OrderedDict([('Value', parse_size(m.group(2)))])
+                records.append(MemRecord(table, m.group(1), fields))
+    return records
+
+def get_bytes(record):
+    """
+    The figure used to rank a record, or None if it has none
+    """
+    for name in BYTES_FIELDS:
+        if name in record.fields:
+            return record.fields[name]
+    if record.table in ('line-table', 'string-pool'):
+        return record.fields['Value']
+    return None
+
+MemDiff = namedtuple('MemDiff', ('table', 'key', 'old', 'new'))
+
+def diff_mem_reports(old_records, new_records):
+    """
+    Match up the records from two -fmem-reports by table and key, and
+    return a list of MemDiff instances for the records that changed,
+    largest absolute change first.
+    """
+    def index(records):
+        result = OrderedDict()
+        for record in records:
+            value = get_bytes(record)
+            if value is not None:
+                result[(record.table, record.key)] = value
+        return result
+    old = index(old_records)
+    new = index(new_records)
+    diffs = []
+    for key in list(old) + [k for k in new if k not in old]:
+        old_value = old.get(key, 0)
+        new_value = new.get(key, 0)
+        if old_value != new_value:
+            diffs.append(MemDiff(key[0], key[1], old_value, new_value))
+    diffs.sort(key=lambda d: abs(d.new - d.old), reverse=True)
+    return diffs
+
+class MemReportResult(object):
+    """
+    The differences between the -fmem-report of control and experiment,
+    ranked by bytes
+    """
+
+    always_display = True
+
+    def __init__(self, diffs, max_rows=30):
+        self.diffs = diffs
+        self.max_rows = max_rows
+
+    def __str__(self):
+        if not self.diffs:
+            return 'No difference in -fmem-report'
+        lines = []
+        call_sites = [d for d in self.diffs if is_call_site(d.key)]
+        for title, diffs in (('Largest changes:', self.diffs),
+                             ('Largest changes by call site:', call_sites)):
+            if not diffs:
+                continue
+            lines.append(title)
+            for d in diffs[:self.max_rows]:
+                lines.append('  %s: %s: %i -> %i: %+i'
+                             % (d.table, d.key, d.old, d.new, d.new - d.old))
+        return '\n'.join(lines)
@@ -0,0 +1,200 @@
+"""
+Full-resolution memory timelines, and their attribution to the phases
+reported by -ftime-report.
+"""
+from __future__ import division
+
+from array import array
+from collections import OrderedDict, namedtuple
+
+import perf
+import stats
+import timeseries
+
+Phase = namedtuple('Phase', ('name', 'start', 'end'))
+
+class MemoryTimeline(object):
+    """
+    Every memory usage sample of a process (or process tree) together
+    with when it was taken.
+
+    "times" are in seconds since the process was launched, "usage" is in
+    kilobytes, and "events" maps the names of child processes
+    (e.g. "cc1plus") to the time at which each was first seen.  The
+    samples are held in arrays unless other sequences are given.
+    """
+    def __init__(self, times=None, usage=None, events=None):
+        self.times = times if times is not None else array('d')
+        self.usage = usage if usage is not None else array('I')
+        self.events = events if events is not None else OrderedDict()
+
+    @classmethod
+    def from_future(cls, future):
+        """
+        Build a MemoryTimeline from a finished perf.MemoryUsageFuture
+        """
+        events = OrderedDict()
+        for name, t in future.GetChildEvents():
+            events.setdefault(name, t)
+        times, usage = future.GetSamples().points()
+        return cls(times, usage, events)
+
+    @classmethod
+    def merge(cls, timelines, points=1000):
+        """
+        Combine the timelines of several runs into the min/max envelope
+        of all of them, downsampled to at most "points" samples
+        """
+        downsamplers = []
+        for timeline in timelines:
+            d = timeseries.StreamingDownsampler(points)
+            for t, kb in zip(timeline.times, timeline.usage):
+                d.append(t, kb)
+            downsamplers.append(d)
+        merged = timeseries.StreamingDownsampler.merge(downsamplers)
+        times, usage = merged.points()
+        return cls(times, usage)
+
+    def compiler_start(self):
+        """
+        When the compiler proper (cc1, cc1plus, lto1 etc) was first seen,
+        or 0 if it wasn't seen as a child process
+        """
+        for name, t in self.events.items():
+            if name.startswith('cc1') or name == 'lto1':
+                return t
+        return 0.
+
+    def __len__(self):
+        return len(self.usage)
+
+    def append(self, t, kb):
+        self.times.append(t)
+        self.usage.append(kb)
+
+    def peak(self):
+        if not self.usage:
+            return 0
+        return max(self.usage)
+
+    def time_to_peak(self):
+        if not self.usage:
+            return 0.
+        return self.times[self.usage.index(self.peak())]
+
+    def area(self):
+        """
+        Area under the curve, in kB*s, using the trapezium rule
+        """
+        total = 0.
+        for i in range(1, len(self.usage)):
+            dt = self.times[i] - self.times[i - 1]
+            total += dt * (self.usage[i] + self.usage[i - 1]) / 2.
+        return total
+
+    def phase_peaks(self, phases):
+        """
+        Get the peak usage within each of the given Phase instances, as an
+        OrderedDict mapping phase names to kilobytes.  A phase too short
+        to contain a sample gets the last sample before it.
+        """
+        result = OrderedDict()
+        for phase in phases:
+            peak = None
+            before = 0
+            for t, kb in zip(self.times, self.usage):
+                if t < phase.start:
+                    before = kb
+                elif t < phase.end:
+                    peak = max(peak, kb) if peak is not None else kb
+                else:
+                    break
+            result[phase.name] = peak if peak is not None else before
+        return result
+
+    def write(self, f, phases=()):
+        """
+        Write the timeline as CSV to a file-like object, preceded by
+        comment lines giving the process events and phase boundaries.
+        """
+        for name, t in self.events.items():
+            f.write('# started: %s: %f\n' % (name, t))
+        for phase in phases:
+            f.write('# phase: %s: %f %f\n' % phase)
+        f.write('time,kb\n')
+        for t, kb in zip(self.times, self.usage):
+            f.write('%f,%i\n' % (t, kb))
+
+def phases_from_walltimes(walltimes, start=0.):
+    """
+    Lay out the sequential phases of a compilation, given an iterable
+    of (name, wall_seconds) pairs in the order that the compiler ran them,
+    starting at "start".  Returns a list of Phase instances.
+    """
+    phases = []
+    t = start
+    for name, wall in walltimes:
+        phases.append(Phase(name, t, t + wall))
+        t += wall
+    return phases
+
+class TimelineSummary(namedtuple('TimelineSummary',
+                                 ('peak', 'area', 'time_to_peak',
+                                  'phase_peaks'))):
+    """
+    The figures of interest from a MemoryTimeline
+    """
+    @classmethod
+    def from_timeline(cls, timeline, phases):
+        return cls(timeline.peak(), timeline.area(), timeline.time_to_peak(),
+                   timeline.phase_peaks(phases))
+
+    @classmethod
+    def median(cls, summaries):
+        """
+        Combine the summaries of several iterations, taking the median of
+        each figure
+        """
+        phase_peaks = OrderedDict()
+        for name in summaries[0].phase_peaks:
+            phase_peaks[name] = stats.median(s.phase_peaks.get(name, 0)
+                                             for s in summaries)
+        return cls(stats.median(s.peak for s in summaries),
+                   stats.median(s.area for s in summaries),
+                   stats.median(s.time_to_peak for s in summaries),
+                   phase_peaks)
+
+def _kb_delta(old, new):
+    return '%+i KB (%s)' % (new - old, perf.QuantityDelta(old, new))
+
+class MemoryTimelineResult(object):
+    """
+    A comparison of the memory timelines of control and experiment
+    """
+
+    always_display = True
+
+    def __init__(self, base, changed):
+        self.base = base
+        self.changed = changed
+
+    def __str__(self):
+        lines = ['Mem peak: %i -> %i: %s'
+                 % (self.base.peak, self.changed.peak,
+                    _kb_delta(self.base.peak, self.changed.peak)),
+                 'Mem area: %.1f -> %.1f KB*s: %s'
+                 % (self.base.area, self.changed.area,
+                    perf.QuantityDelta(self.base.area, self.changed.area)),
+                 'Time to peak: %.3f -> %.3f s: %s'
+                 % (self.base.time_to_peak, self.changed.time_to_peak,
+                    perf.TimeDelta(self.base.time_to_peak,
+                                   self.changed.time_to_peak))]
+        for name, base_peak in self.base.phase_peaks.items():
+            changed_peak = self.changed.phase_peaks.get(name, 0)
+            lines.append('  %s peak: %i -> %i: %s'
+                         % (name, base_peak, changed_peak,
+                            _kb_delta(base_peak, changed_peak)))
+        return '\n'.join(lines)
+
+    def as_csv(self):
+        return ['%i' % self.base.peak, '%i' % self.changed.peak]
@@ -0,0 +1,88 @@
+"""
+A/A calibration of the noise floor of each configuration.
+
+When the control build is run against itself (two peers pointing at the
+same build), any difference between the two sets of samples is noise.
+From such A/A runs we store, per configuration, the coefficient of
+variation (CV) of a single sample and the A/A change that was observed.
+The significance threshold and the minimum detectable effect (MDE) of a
+comparison of n iterations per peer then follow:
+
+  threshold(n) = max(Z_ALPHA * cv * sqrt(2 / n), |A/A change|)
+  mde(n)       = (Z_ALPHA + Z_POWER) * cv * sqrt(2 / n)
+
+i.e. a two-sided test at the 5% level, with 80% power for the MDE.
+
+The calibration file is JSON, mapping configurations (benchmark.py test
+names) to {"cv": ..., "aa_change": ..., "samples": ...}.
+"""
+from __future__ import division
+
+from collections import OrderedDict
+import json
+import math
+
+import stats
+
+Z_ALPHA = 1.96
+Z_POWER = 0.8416
+
+def _variance(values):
+    mean = stats.mean(values)
+    return sum((x - mean) ** 2 for x in values) / (len(values) - 1)
+
+class NoiseFloor(OrderedDict):
+    """
+    An ordered mapping from configuration names to dicts with the "cv",
+    "aa_change" and "samples" of their A/A calibration
+    """
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(sorted(json.load(f).items()))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self, f, indent=2, sort_keys=True)
+
+    def add(self, key, samples_a, samples_b):
+        """
+        Record the A/A calibration of a configuration from two lists of
+        samples of the same build
+        """
+        if min(len(samples_a), len(samples_b)) < 2:
+            raise ValueError('need at least two samples per side')
+        mean_a = stats.mean(samples_a)
+        mean = stats.mean(samples_a + samples_b)
+        pooled = (_variance(samples_a) + _variance(samples_b)) / 2
+        self[key] = {'cv': math.sqrt(pooled) / mean,
+                     'aa_change': (stats.mean(samples_b) - mean_a) / mean_a,
+                     'samples': min(len(samples_a), len(samples_b))}
+
+    def threshold(self, key, n):
+        """
+        The smallest relative change of the mean that is significant with
+        n samples per side, or None if the configuration wasn't calibrated
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        return max(Z_ALPHA * entry['cv'] * math.sqrt(2. / n),
+                   abs(entry['aa_change']))
+
+    def mde(self, key, n):
+        """
+        The minimum detectable effect with n samples per side, or None if
+        the configuration wasn't calibrated
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        return (Z_ALPHA + Z_POWER) * entry['cv'] * math.sqrt(2. / n)
+
+    def describe(self, key, n):
+        entry = self[key]
+        return ('noise floor: %s: CV %.2f%%, A/A change %+.2f%%;'
+                ' at %i iterations: threshold %.2f%%, MDE %.2f%%'
+                % (key, 100 * entry['cv'], 100 * entry['aa_change'], n,
+                   100 * self.threshold(key, n), 100 * self.mde(key, n)))
@@ -56,8 +56,10 @@ from __future__ import division, with_statement, print_function
 
 __author__ = "jyasskin@google.com (Jeffrey Yasskin)"
 
+import copy
 import csv
 import contextlib
+import itertools
 import json
 import logging
 import math
@@ -80,6 +82,10 @@ try:
     import multiprocessing
 except ImportError:
     multiprocessing = None
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 try:
     import win32api
     import win32con
@@ -88,6 +94,14 @@ try:
 except ImportError:
     win32api = None
 
+import budget
+import conditioning
+import interference
+import launcher
+import preflight
+import schedule
+import timeseries
+
 
 info = logging.info
 
@@ -307,6 +321,39 @@ def CanGetMemoryUsage():
     return False
 
 
+def _ReadChildPids(pid):
+    """Find the child processes of a Linux process.
+
+    Args:
+        pid: the process id whose children to list.
+
+    Returns:
+        A list of process ids. This is empty if the kernel was built without
+        CONFIG_PROC_CHILDREN.
+    """
+    children = []
+    try:
+        tids = os.listdir("/proc/%d/task" % pid)
+    except OSError:
+        return children
+    for tid in tids:
+        try:
+            with open("/proc/%d/task/%s/children" % (pid, tid)) as f:
+                children.extend(int(child) for child in f.read().split())
+        except IOError:
+            pass
+    return children
+
+
+def _ReadProcessName(pid):
+    """Get the command name of a Linux process, or None if it has exited."""
+    try:
+        with open("/proc/%d/comm" % pid) as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
 class MemoryUsageFuture(threading.Thread):
     """Continuously sample a process's memory usage for its lifetime.
 
@@ -319,26 +366,65 @@ class MemoryUsageFuture(threading.Thread):
     Note that calls to GetMemoryUsage() will block until the process exits.
     """
 
-    def __init__(self, pid):
+    def __init__(self, pid, include_children=False, max_points=None):
+        """Start sampling.
+
+        Args:
+            pid: the process id to sample.
+            include_children: optional; on Linux, whether to add the memory
+                usage of the process's descendants (e.g. the cc1plus run by
+                a gcc driver) to each sample.
+            max_points: optional; if given, summarize the samples in constant
+                memory as they arrive, keeping at most this many (including
+                the exact peak), rather than storing every sample.
+        """
         super(MemoryUsageFuture, self).__init__()
         self._pid = pid
-        self._usage = []
+        self._include_children = include_children
+        if max_points:
+            self._samples = timeseries.StreamingDownsampler(max_points)
+        else:
+            self._samples = timeseries.SampleBuffer()
+        self._child_events = []
         self._done = threading.Event()
+        self._start_time = time.time()
         self.start()
 
+    def _SampleDescendants(self, pid, seen):
+        total = 0
+        for child in _ReadChildPids(pid):
+            if child not in seen:
+                seen.add(child)
+                name = _ReadProcessName(child)
+                if name is not None:
+                    self._child_events.append(
+                        (name, time.time() - self._start_time))
+            try:
+                total += _ParseSmapsData(_ReadSmapsFile(child))
+            except IOError:
+                # The child exited while we were looking at it.
+                continue
+            total += self._SampleDescendants(child, seen)
+        return total
+
     def run(self):
         if win32api:
             with _OpenWin32Process(self._pid) as process_handle:
                 while (win32process.GetExitCodeProcess(process_handle) ==
                        win32con.STILL_ACTIVE):
                     sample = _GetWin32MemorySample(process_handle)
-                    self._usage.append(sample)
+                    self._samples.append(time.time() - self._start_time,
+                                         sample)
                     time.sleep(0.001)
         else:
+            seen = set()
             while True:
                 try:
                     sample = _ParseSmapsData(_ReadSmapsFile(self._pid))
-                    self._usage.append(sample)
+                    if self._include_children:
+                        sample += self._SampleDescendants(self._pid, seen)
+                    self._samples.append(time.time() - self._start_time,
+                                         sample)
                 except IOError:
                     # Once the process exits, its smaps file will go away,
                     # leading _ReadSmapsFile() to raise IOError.
@@ -351,10 +437,43 @@ class MemoryUsageFuture(threading.Thread):
         This will block until the process has exited.
 
         Returns:
-            A list of all memory usage samples, in kilobytes.
+            A sequence of all memory usage samples, in kilobytes (or of the
+            retained samples, if max_points was given).
+        """
+        self._done.wait()
+        return self._samples.points()[1]
+
+    def GetTimestamps(self):
+        """Get the time at which each memory usage sample was taken.
+
+        This will block until the process has exited.
+
+        Returns:
+            A sequence of floats, parallel to GetMemoryUsage(), each the
+            number of seconds since sampling started.
+        """
+        self._done.wait()
+        return self._samples.points()[0]
+
+    def GetSamples(self):
+        """Get the timeseries.SampleBuffer or StreamingDownsampler.
+
+        This will block until the process has exited.
+        """
+        self._done.wait()
+        return self._samples
+
+    def GetChildEvents(self):
+        """Get the descendant processes seen when include_children is set.
+
+        This will block until the process has exited.
+
+        Returns:
+            A list of (name, seconds since sampling started) 2-tuples, one for
+            each descendant process, in the order they were first seen.
         """
         self._done.wait()
-        return self._usage
+        return self._child_events
 
 
 class RawData(object):
@@ -362,15 +481,27 @@ class RawData(object):
 
     Attributes:
         runtimes: list of floats, one per iteration.
-        mem_usage: list of ints, memory usage in kilobytes.
+        mem_usage: sequence (list or array) of ints, memory usage in
+            kilobytes.
         inst_output: output from Unladen's --with-instrumentation build. This is
             the empty string if there was no instrumentation output.
+        launches: list of launcher.Launch instances, one per process launched,
+            for benchmarks that time individual launches; otherwise None.
+        clock: the field of the launches that the runtimes were taken from,
+            "elapsed" or "utime".
+        chunks: list of the number of runtimes in each chunk, for benchmarks
+            whose trials were split into chunks (see --interleave_chunks);
+            otherwise None.
     """
 
-    def __init__(self, runtimes, mem_usage, inst_output=""):
+    def __init__(self, runtimes, mem_usage, inst_output="", launches=None,
+                 chunks=None, clock="elapsed"):
         self.runtimes = runtimes
         self.mem_usage = mem_usage
         self.inst_output = inst_output
+        self.launches = launches
+        self.clock = clock
+        self.chunks = chunks
 
 
 class BenchmarkResult(object):
@@ -378,7 +509,8 @@ class BenchmarkResult(object):
 
     def __init__(self, min_base, min_changed, delta_min, avg_base,
                  avg_changed, delta_avg, t_msg, std_base, std_changed,
-                 delta_std, is_significant, timeline_link):
+                 delta_std, is_significant, timeline_link,
+                 conditioning_msg=""):
         self.min_base      = min_base
         self.min_changed   = min_changed
         self.delta_min     = delta_min
@@ -390,6 +522,7 @@ class BenchmarkResult(object):
         self.std_changed   = std_changed
         self.delta_std     = delta_std
         self.timeline_link = timeline_link
+        self.conditioning_msg = conditioning_msg
         self.always_display = is_significant
 
     def get_timeline(self):
@@ -401,7 +534,7 @@ class BenchmarkResult(object):
         return (("Min: %(min_base)f -> %(min_changed)f:" +
                  " %(delta_min)s\n" +
                  "Avg: %(avg_base)f -> %(avg_changed)f:" +
-                 " %(delta_avg)s\n" + self.t_msg +
+                 " %(delta_avg)s\n%(t_msg)s%(conditioning_msg)s" +
                  "Stddev: %(std_base).5f -> %(std_changed).5f:" +
                  " %(delta_std)s" + self.get_timeline())
                  % self.__dict__)
@@ -411,6 +544,59 @@ class BenchmarkResult(object):
         return ["%f" % self.min_base, "%f" % self.min_changed]
 
 
+class StartupResult(BenchmarkResult):
+    """A BenchmarkResult for a startup benchmark, also showing the
+    distribution of the per-launch times, the first (cold) launch and the
+    page faults of the launches. The times are taken from the same field of
+    the launches ("elapsed" or "utime") as the runtimes were."""
+
+    CLOCK_LABELS = {"elapsed": "Latency", "utime": "User time"}
+
+    def __init__(self, result, base_launches, changed_launches,
+                 clock="elapsed"):
+        self.__dict__.update(result.__dict__)
+        self.base_launches = base_launches
+        self.changed_launches = changed_launches
+        self.clock = clock
+
+    def get_latencies(self):
+        base_cold, base_warm = self.base_launches[0], self.base_launches[1:]
+        changed_cold = self.changed_launches[0]
+        changed_warm = self.changed_launches[1:]
+        label = self.CLOCK_LABELS[self.clock]
+        lines = []
+        base_summary = launcher.summarize(
+            [getattr(l, self.clock) for l in base_warm])
+        changed_summary = launcher.summarize(
+            [getattr(l, self.clock) for l in changed_warm])
+        for name, base in base_summary.items():
+            changed = changed_summary[name]
+            lines.append("%s %s: %.3f ms -> %.3f ms: %s"
+                         % (label, name, 1000 * base, 1000 * changed,
+                            TimeDelta(base, changed)))
+        base_time = getattr(base_cold, self.clock)
+        changed_time = getattr(changed_cold, self.clock)
+        lines.append("Cold launch: %.3f ms -> %.3f ms: %s"
+                     % (1000 * base_time, 1000 * changed_time,
+                        TimeDelta(base_time, changed_time)))
+        if base_cold.minflt is not None and changed_cold.minflt is not None:
+            for field, label in (("minflt", "Minor faults"),
+                                 ("majflt", "Major faults")):
+                base = launcher.percentile(
+                    [getattr(l, field) for l in base_warm], 50)
+                changed = launcher.percentile(
+                    [getattr(l, field) for l in changed_warm], 50)
+                lines.append("%s: cold %d -> %d, warm median %d -> %d: %s"
+                             % (label, getattr(base_cold, field),
+                                getattr(changed_cold, field), base, changed,
+                                QuantityDelta(base, changed)
+                                if base != changed else "no change"))
+        return "\n".join(lines)
+
+    def __str__(self):
+        return BenchmarkResult.__str__(self) + "\n" + self.get_latencies()
+
+
 class BenchmarkError(object):
     """Object representing the error from a failed benchmark run."""
 
@@ -714,16 +900,85 @@ def SimpleBenchmark(benchmark_function, base_python, changed_python, options,
         A BenchmarkError object if either benchmark run failed.
     """
     try:
-        changed_data = benchmark_function(changed_python, options,
-                                          *args, **kwargs)
-        base_data = benchmark_function(base_python, options,
-                                       *args, **kwargs)
+        if options.interleave_chunks > 1:
+            base_data, changed_data = _RunInterleaved(
+                benchmark_function, base_python, changed_python, options,
+                *args, **kwargs)
+        else:
+            changed_data = benchmark_function(changed_python, options,
+                                              *args, **kwargs)
+            base_data = benchmark_function(base_python, options,
+                                           *args, **kwargs)
     except subprocess.CalledProcessError as e:
         return BenchmarkError(e)
 
     return CompareBenchmarkData(base_data, changed_data, options)
 
 
+def MergeRawData(parts):
+    """Concatenate the RawData instances from the chunks of a benchmark.
+
+    The chunk boundaries are recorded in the chunks attribute of the result,
+    and the instrumentation data is taken from the final chunk.
+    """
+    runtimes = []
+    mem_usage = None
+    for part in parts:
+        runtimes.extend(part.runtimes)
+        if part.mem_usage is not None:
+            # Each part's samples may be a list or an array.
+            if mem_usage is None:
+                mem_usage = []
+            mem_usage.extend(part.mem_usage)
+    return RawData(runtimes, mem_usage, inst_output=parts[-1].inst_output,
+                   chunks=[len(part.runtimes) for part in parts])
+
+
+def _RunInterleaved(benchmark_function, base_python, changed_python, options,
+                    *args, **kwargs):
+    """Run a benchmark's trials in options.interleave_chunks chunks,
+    alternating between the binaries (changed first, then base first, and
+    so on), so that host drift hits both alike; then remove the drift
+    between chunks according to options.drift.
+
+    Benchmark functions that don't split their trials (those not built on
+    MeasureGeneric()) return all of them from the first call; the other
+    binary is then run in one go too, as without interleaving.
+
+    Returns:
+        (base_data, changed_data) pair of RawData instances.
+    """
+    num_chunks = options.interleave_chunks
+    chunk_options = copy.copy(options)
+    chunk_options.num_chunks = num_chunks
+    pythons = [changed_python, base_python]
+    parts = [[], []]
+    sched = schedule.Schedule("counterbalanced", drift=options.drift)
+    info("Interleaving %d chunks of trials", num_chunks)
+    for order in sched.iter_blocks(2, num_chunks):
+        for idx in order:
+            data = benchmark_function(pythons[idx], chunk_options,
+                                      *args, **kwargs)
+            if data.chunks is None:
+                other = benchmark_function(pythons[1 - idx], options,
+                                           *args, **kwargs)
+                if idx == 0:
+                    return other, data
+                return data, other
+            parts[idx].append(data)
+
+    changed_data, base_data = [MergeRawData(p) for p in parts]
+    runtimes = [base_data.runtimes, changed_data.runtimes]
+    chunks = [base_data.chunks, changed_data.chunks]
+    effects = schedule.get_chunk_effects(runtimes, chunks)
+    mean = avg(base_data.runtimes + changed_data.runtimes)
+    info("Drift between chunks: %.2f%% of the mean runtime (drift: %s)",
+         100 * (max(effects) - min(effects)) / mean, options.drift)
+    base_data.runtimes, changed_data.runtimes = \
+        sched.correct_chunks(runtimes, chunks)
+    return base_data, changed_data
+
+
 def _FormatData(num):
     return str(round(num, 2))
 
@@ -820,10 +1075,11 @@ def SummarizeData(data, points=100, summary_func=max):
     using `summary_func` to summarize each window into a single point.
 
     Args:
-        data: the original data set, as a list.
+        data: the original data set, as a list or array.
         points: optional; how many summary points to take. Default is 100.
-        summary_func: optional; function to use when summarizing each window.
-            Default is the max() built-in.
+        summary_func: optional; function to use when summarizing each window,
+            which is passed an iterator over the window. Default is the max()
+            built-in.
 
     Returns:
         List of summary data points.
@@ -832,12 +1088,11 @@ def SummarizeData(data, points=100, summary_func=max):
     if window_size == 1:
         return data
 
+    # Walk the data once, rather than copying a slice per window.
     summary_points = []
-    start = 0
-    while start < len(data):
-        end = min(start + window_size, len(data))
-        summary_points.append(summary_func(data[start:end]))
-        start = end
+    it = iter(data)
+    for _ in range(0, len(data), window_size):
+        summary_points.append(summary_func(itertools.islice(it, window_size)))
     return summary_points
 
 
@@ -953,6 +1208,11 @@ def BuildEnv(env=None, inherit_env=[]):
     return fixed_env
 
 
+# Relative change of the mean below which a difference is never
+# significant, for benchmarks without an A/A calibration.
+DEFAULT_SIGNIFICANCE_THRESHOLD = 0.02
+
+
 def CompareMultipleRuns(base_times, changed_times, options):
     """Compare multiple control vs experiment runs of the same benchmark.
 
@@ -974,6 +1234,17 @@ def CompareMultipleRuns(base_times, changed_times, options):
         time_delta = TimeDelta(base_time, changed_time)
         return SimpleBenchmarkResult(base_time, changed_time, time_delta)
 
+    conditioning_msg = ""
+    method = getattr(options, "condition_samples", None)
+    if method:
+        # Warm-up runs and outliers are reported, then left out of the
+        # statistics below; IsSignificant() needs equal-length samples.
+        conditioned = conditioning.condition([base_times, changed_times],
+                                             method)
+        for label, c in zip(("Base", "Changed"), conditioned):
+            conditioning_msg += "%s flagged: %s\n" % (label, c)
+        base_times, changed_times = conditioning.equalize(conditioned)
+
     # Create a chart showing iteration times over time. We round the times so
     # as not to exceed the GET limit for Google's chart server.
     timeline_link = GetChart(SummarizeData(base_times),
@@ -996,17 +1267,28 @@ def CompareMultipleRuns(base_times, changed_times, options):
 
     t_msg = "Not significant\n"
     significant = False
-    # Due to inherent measurement imprecisions, variations of less than 1%
-    # are automatically considered insignificant. This helps present
-    # a clear picture to the user.
-    if abs(avg_base - avg_changed) > (avg_base + avg_changed) * 0.01:
+    # Due to inherent measurement imprecisions, variations smaller than the
+    # noise floor of the benchmark are automatically considered
+    # insignificant. This helps present a clear picture to the user. The
+    # noise floor comes from an A/A calibration (see noisefloor.py) if
+    # there was one, else it is a flat 2% of the mean.
+    threshold = getattr(options, "significance_threshold", None)
+    if threshold is None:
+        threshold = DEFAULT_SIGNIFICANCE_THRESHOLD
+    if abs(avg_base - avg_changed) > threshold * (avg_base + avg_changed) / 2:
         significant, t_score = IsSignificant(base_times, changed_times)
         if significant:
             t_msg = "Significant (t=%.2f)\n" % t_score
+    mde = getattr(options, "min_detectable_effect", None)
+    if mde is not None:
+        t_msg += ("Noise floor: %.2f%%; minimum detectable effect at %d"
+                  " iterations: %.2f%%\n"
+                  % (threshold * 100, len(base_times), mde * 100))
 
     return BenchmarkResult(min_base, min_changed, delta_min, avg_base,
                            avg_changed, delta_avg, t_msg, std_base,
-                           std_changed, delta_std, significant, timeline_link)
+                           std_changed, delta_std, significant, timeline_link,
+                           conditioning_msg)
 
 
 def CompareBenchmarkData(base_data, exp_data, options):
@@ -1021,6 +1303,8 @@ def CompareBenchmarkData(base_data, exp_data, options):
         Something that implements a __str__() method:
 
         - BenchmarkResult: summarizes the difference between the two runs.
+        - StartupResult: a BenchmarkResult that also summarizes the
+          individual launches, for the startup benchmarks.
         - SimpleBenchmarkResult: if there was only one data point per run.
         - InstrumentationResult: if --diff_instrumentation was given.
         - MemoryUsageResult: if --track_memory was given.
@@ -1039,7 +1323,13 @@ def CompareBenchmarkData(base_data, exp_data, options):
                                         exp_data.inst_output)
         return InstrumentationResult(inst_diff, options)
 
-    return CompareMultipleRuns(base_data.runtimes, exp_data.runtimes, options)
+    result = CompareMultipleRuns(base_data.runtimes, exp_data.runtimes, options)
+    if (base_data.launches and exp_data.launches
+        and base_data.clock == exp_data.clock
+        and isinstance(result, BenchmarkResult)):
+        return StartupResult(result, base_data.launches, exp_data.launches,
+                             base_data.clock)
+    return result
 
 
 def CallAndCaptureOutput(command, env=None, track_memory=False, inherit_env=[]):
@@ -1055,8 +1345,8 @@ def CallAndCaptureOutput(command, env=None, track_memory=False, inherit_env=[]):
 
     Returns:
         (stdout, stderr, mem_usage), where stdout is the captured stdout as a
-        string; stderr is the captured stderr as a string; mem_usage is a list
-        of memory usage samples in kilobytes (if track_memory is False,
+        string; stderr is the captured stderr as a string; mem_usage is an
+        array of memory usage samples in kilobytes (if track_memory is False,
         mem_usage is None).
 
     Raises:
@@ -1084,7 +1374,8 @@ def MeasureGeneric(python, options, bm_path, bm_env=None,
 
     Based on the values of options.fast/rigorous, will pass -n {5,50,100} to
     the benchmark script. MeasureGeneric takes care of parsing out the running
-    times from the memory usage data.
+    times from the memory usage data. If options.num_chunks is set, only that
+    fraction of the trials is run, as one chunk of an interleaved benchmark.
 
     Args:
         python: start of the argv list for running Python.
@@ -1109,6 +1400,9 @@ def MeasureGeneric(python, options, bm_path, bm_env=None,
     elif options.fast:
         trials = 5
     trials = max(1, int(trials * iteration_scaling))
+    num_chunks = getattr(options, "num_chunks", None)
+    if num_chunks:
+        trials = max(1, -(-trials // num_chunks))
 
     RemovePycs()
     command = python + [bm_path, "-n", trials] + extra_args
@@ -1117,7 +1411,10 @@ def MeasureGeneric(python, options, bm_path, bm_env=None,
                                   inherit_env=options.inherit_env)
     stdout, stderr, mem_usage = output
     times = [float(line) for line in stdout.splitlines()]
-    return RawData(times, mem_usage, inst_output=stderr)
+    chunks = None
+    if num_chunks:
+        chunks = [len(times)]
+    return RawData(times, mem_usage, inst_output=stderr, chunks=chunks)
 
 
 ### Benchmarks
@@ -1216,6 +1513,42 @@ def BM_PyBench(base_python, changed_python, options):
         return BenchmarkError(result)
 
 
+def _MeasureCommandLaunches(command, iterations, env):
+    """MeasureCommand() without memory tracking, through the launcher.
+
+    Each run is timed by the user time of the child, as in MeasureCommand(),
+    or by its elapsed time where the launcher's backend can't get the user
+    time; the launches are returned too, with the clock that was used.
+    """
+    RemovePycs()
+
+    an_s = "s"
+    if iterations == 1:
+        an_s = ""
+    info("Running `%s` %d time%s", command, iterations, an_s)
+
+    with TemporaryFilename("perf_stderr") as stderr_path:
+        command_launcher = launcher.Launcher(command, env, quiet=True,
+                                             stderr_path=stderr_path)
+        launches = []
+        # One more launch than asked for: the priming run (create pyc
+        # files, etc).
+        for _ in range(iterations + 1):
+            launch = command_launcher.launch()
+            if launch.status != 0:
+                with open(stderr_path, "rb") as f:
+                    raise RuntimeError("Benchmark died: " +
+                                       f.read().decode("latin1"))
+            launches.append(launch)
+        with open(stderr_path, "rb") as f:
+            stderr = f.read()
+
+    clock = "elapsed" if launches[0].utime is None else "utime"
+    times = [getattr(launch, clock) for launch in launches[1:]]
+    return RawData(times, None, inst_output=stderr, launches=launches,
+                   clock=clock)
+
+
 def MeasureCommand(command, iterations, env, track_memory):
     """Helper function to run arbitrary commands multiple times.
 
@@ -1233,11 +1566,16 @@ def MeasureCommand(command, iterations, env, track_memory):
     Returns:
         RawData instance. Note that we take instrumentation data from the final
         run; merging instrumentation data between multiple runs is
-        prohibitively difficult at this point.
+        prohibitively difficult at this point. Unless track_memory is set,
+        the launches are recorded too, the priming run being the first
+        (cold) one.
 
     Raises:
         RuntimeError: if the command failed.
     """
+    if not track_memory:
+        return _MeasureCommandLaunches(command, iterations, env)
+
     with open(os.devnull, "wb") as dev_null:
         RemovePycs()
 
@@ -1835,6 +2173,13 @@ def _StartupPython(command, mem_usage, track_memory, inherit_env):
 
 
 def MeasureStartup(python, cmd_opts, num_loops, track_memory, inherit_env):
+    """Launch the interpreter num_loops * 20 times.
+
+    Returns:
+        RawData instance. Unless track_memory is set, runtimes holds the
+        time of each warm launch, and launches the launcher.Launch of every
+        launch, starting with the first (cold) one.
+    """
     times = []
     work = ""
     if track_memory:
@@ -1845,33 +2190,23 @@ def MeasureStartup(python, cmd_opts, num_loops, track_memory, inherit_env):
     command = python + cmd_opts + ["-c", work]
     mem_usage = []
     info("Running `%s` %d times", command, num_loops * 20)
-    for _ in range(num_loops):
-        t0 = time.time()
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        _StartupPython(command, mem_usage, track_memory, inherit_env)
-        t1 = time.time()
-        times.append(t1 - t0)
-    if not track_memory:
-      mem_usage = None
-    return RawData(times, mem_usage)
+    if track_memory:
+        for _ in range(num_loops):
+            t0 = time.time()
+            for _ in range(20):
+                _StartupPython(command, mem_usage, track_memory, inherit_env)
+            t1 = time.time()
+            times.append(t1 - t0)
+        return RawData(times, mem_usage)
+
+    startup = launcher.Launcher(command, BuildEnv(inherit_env=inherit_env))
+    launches = startup.run(num_loops * 20)
+    info("Per-launch times: %s",
+         launcher.format_summary([launch.elapsed for launch in launches]))
+    info("Launcher overhead (%s): %s", launcher.TRUE,
+         launcher.format_summary(launcher.measure_overhead()))
+    times = [launch.elapsed for launch in launches[1:]]
+    return RawData(times, None, launches=launches)
 
 
 def BM_normal_startup(base_python, changed_python, options):
@@ -2280,6 +2615,208 @@ def ParseOutputStyle(option, opt_str, value, parser):
     parser.values.output_style = value
 
 
+# Assumed memory footprint of a benchmark (both binaries) not listed in the
+# --footprints file, in MB.
+DEFAULT_FOOTPRINT = 256
+
+
+def ParseCpuList(text):
+    """Parse a kernel CPU list such as "0-3,8,10-11" into a list of ints."""
+    cpus = []
+    for item in text.strip().split(","):
+        if not item:
+            continue
+        if "-" in item:
+            first, last = item.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(item))
+    return cpus
+
+
+def GetBenchmarkCpus():
+    """Get the CPUs to run benchmarks on: the isolated CPUs (isolcpus=) if
+    there are any, otherwise all of those this process may run on."""
+    try:
+        with open("/sys/devices/system/cpu/isolated") as f:
+            isolated = ParseCpuList(f.read())
+    except IOError:
+        isolated = []
+    if isolated:
+        return isolated
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+def GetNumaNodes():
+    """Get a list of the CPU lists of the NUMA nodes, in node order, from
+    sysfs; empty if the kernel doesn't report any."""
+    node_root = "/sys/devices/system/node"
+    try:
+        node_ids = sorted(int(m.group(1)) for m in
+                          (re.match(r"node([0-9]+)$", name)
+                           for name in os.listdir(node_root)) if m)
+    except OSError:
+        return []
+    nodes = []
+    for node_id in node_ids:
+        try:
+            with open("%s/node%d/cpulist" % (node_root, node_id)) as f:
+                nodes.append(ParseCpuList(f.read()))
+        except IOError:
+            pass
+    return nodes
+
+
+def SpreadOverNumaNodes(cpus, nodes):
+    """Reorder a list of CPUs to take one from each NUMA node in turn, so
+    that the first N of them are spread evenly over the nodes and share as
+    little memory bandwidth as possible. CPUs on no known node go last."""
+    per_node = [[cpu for cpu in node if cpu in cpus] for node in nodes]
+    spread = []
+    while any(per_node):
+        for node_cpus in per_node:
+            if node_cpus:
+                spread.append(node_cpus.pop(0))
+    return spread + [cpu for cpu in cpus if cpu not in spread]
+
+
+def SetCpuAffinity(cpu):
+    """Pin this process (and so every process it starts) to one CPU."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, [cpu])
+    else:
+        with open(os.devnull, "wb") as dev_null:
+            subprocess.check_call(["taskset", "-p", "-c", str(cpu),
+                                   str(os.getpid())], stdout=dev_null)
+
+
+def GetAvailableMemory():
+    """Get MemAvailable from /proc/meminfo in MB, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except IOError:
+        pass
+    return None
+
+
+def _RunPinnedBenchmark(result_queue, cpu, name, func, base_cmd_prefix,
+                        changed_cmd_prefix, options):
+    SetCpuAffinity(cpu)
+    options.benchmark_name = name
+    try:
+        result = func(base_cmd_prefix, changed_cmd_prefix, options)
+    except Exception as e:
+        result = BenchmarkError(e)
+    result_queue.put((name, result))
+
+
+def RunBenchmarksInParallel(names, bench_funcs, base_cmd_prefix,
+                            changed_cmd_prefix, options):
+    """Run independent benchmarks concurrently, each on its own CPU.
+
+    Each benchmark runs in a worker process pinned to one CPU, so the base
+    and changed runs of a benchmark share a core, and with the kernel's
+    default first-touch policy its memory is on that CPU's NUMA node. The
+    CPUs are spread over the NUMA nodes (see SpreadOverNumaNodes()). A
+    benchmark is only started while the footprints of the running ones,
+    plus its own, fit in the memory budget.
+
+    Args:
+        names: names of the benchmarks to run, in order.
+        bench_funcs: mapping from names to benchmark functions.
+        base_cmd_prefix, changed_cmd_prefix: as passed to the benchmarks.
+        options: optparse.Values instance; uses options.parallel,
+            options.footprints and options.memory_budget.
+
+    Returns:
+        List of (name, result) pairs, in the order of names.
+    """
+    cpus = SpreadOverNumaNodes(GetBenchmarkCpus(),
+                               GetNumaNodes())[:options.parallel]
+    footprints = {}
+    if options.footprints:
+        with open(options.footprints) as f:
+            footprints = json.load(f)
+    memory_budget = options.memory_budget or GetAvailableMemory()
+    info("Running up to %d benchmarks at once on CPUs %s, memory budget %s MB",
+         len(cpus), ",".join(map(str, cpus)), memory_budget)
+
+    result_queue = multiprocessing.Queue()
+    pending = list(names)
+    running = {}  # Map CPUs to (name, process, footprint) triples.
+    results = {}
+    while pending or running:
+        for cpu in cpus:
+            if not pending:
+                break
+            if cpu in running:
+                continue
+            footprint = footprints.get(pending[0], DEFAULT_FOOTPRINT)
+            in_use = sum(fp for (_, _, fp) in running.values())
+            if (running and memory_budget
+                and in_use + footprint > memory_budget):
+                break
+            name = pending.pop(0)
+            print("Running %s on CPU %d..." % (name, cpu))
+            proc = multiprocessing.Process(
+                target=_RunPinnedBenchmark,
+                args=(result_queue, cpu, name, bench_funcs[name], base_cmd_prefix,
+                      changed_cmd_prefix, options))
+            proc.start()
+            running[cpu] = (name, proc, footprint)
+
+        try:
+            name, result = result_queue.get(timeout=1)
+            results[name] = result
+        except queue.Empty:
+            pass
+        for cpu, (name, proc, _) in list(running.items()):
+            if name in results:
+                proc.join()
+                del running[cpu]
+            elif not proc.is_alive() and result_queue.empty():
+                results[name] = BenchmarkError(
+                    "Worker for %s died with exit code %s"
+                    % (name, proc.exitcode))
+                del running[cpu]
+    return [(name, results[name]) for name in names]
+
+
+def FormatCalibration(serial_results, parallel_results):
+    """Compare the results of the serial and parallel runs of benchmarks.
+
+    Args:
+        serial_results, parallel_results: lists of (name, result) pairs.
+
+    Returns:
+        A string describing, for each benchmark with a BenchmarkResult in
+        both runs, the average base time and the changed/base ratio in each,
+        and how far the parallel ratio is from the serial one.
+    """
+    parallel = dict(parallel_results)
+    lines = ["Calibration of parallel vs serial runs:",
+             "%-24s %-25s %-19s %s" % ("Benchmark", "Avg base (serial, par.)",
+                                       "Changed/base", "Shift")]
+    for name, serial in serial_results:
+        result = parallel.get(name)
+        if not (isinstance(serial, BenchmarkResult)
+                and isinstance(result, BenchmarkResult)):
+            lines.append("%-24s (no timings)" % name)
+            continue
+        serial_ratio = serial.avg_changed / serial.avg_base
+        parallel_ratio = result.avg_changed / result.avg_base
+        lines.append("%-24s %10f -> %-11f %.4f -> %.4f   %+.2f%%"
+                     % (name, serial.avg_base, result.avg_base, serial_ratio,
+                        parallel_ratio,
+                        100 * (parallel_ratio / serial_ratio - 1)))
+    return "\n".join(lines)
+
+
 def CreateBenchGroups(bench_funcs=BENCH_FUNCS, bench_groups=BENCH_GROUPS):
     bench_groups = bench_groups.copy()
     all_benchmarks = bench_funcs.keys()
@@ -2374,6 +2911,61 @@ def main(argv, bench_funcs=BENCH_FUNCS, bench_groups=BENCH_GROUPS):
                             " Unladen Swallow binaries. This is useful for"
                             " examining many benchmarks for optimization"
                             " effects."))
+    parser.add_option("--condition_samples", metavar="METHOD", type="choice",
+                      choices=conditioning.METHODS, default=None,
+                      help=("Flag warm-up runs and outliers (by METHOD: 'mad'"
+                            " or 'iqr') and leave them out of the statistics."
+                            " The flagged times are reported."))
+    parser.add_option("-j", "--parallel", metavar="N", type="int", default=1,
+                      help=("Run up to N benchmarks at once, each pinned to"
+                            " its own CPU (the isolated CPUs if there are"
+                            " any, spread over the NUMA nodes); both"
+                            " binaries of a benchmark share the CPU. Default"
+                            " is %default."))
+    parser.add_option("--footprints", metavar="FILE", default=None,
+                      help=("JSON file mapping benchmark names to their"
+                            " memory footprint in MB, for --parallel (default"
+                            " %d MB)." % DEFAULT_FOOTPRINT))
+    parser.add_option("--memory_budget", metavar="MB", type="int",
+                      default=None,
+                      help=("Only start a benchmark under --parallel while"
+                            " the footprints of those running fit in MB"
+                            " (default: MemAvailable)."))
+    parser.add_option("--calibrate_parallel", action="store_true",
+                      help=("Also run the benchmarks serially, and report"
+                            " how running them in parallel changed each"
+                            " result."))
+    parser.add_option("--preflight", metavar="MODE", type="choice",
+                      choices=preflight.MODES, default="warn",
+                      help=("What to do when the host's settings (governor,"
+                            " turbo, SMT, ASLR, THP, isolcpus) are noisy:"
+                            " one of %s ('apply' needs root). Default is"
+                            " '%%default'." % ", ".join(preflight.MODES)))
+    parser.add_option("--monitor_interference", action="store_true",
+                      help=("Monitor the host (foreign CPU load, CPU"
+                            " frequency, thermal throttling) while each"
+                            " benchmark runs serially, and report the"
+                            " benchmarks it may have skewed."))
+    parser.add_option("--interleave_chunks", metavar="N", type="int",
+                      default=0,
+                      help=("Split the trials of each benchmark script into"
+                            " N chunks, alternating between the base and"
+                            " changed binaries chunk by chunk."))
+    parser.add_option("--drift", type="choice",
+                      choices=schedule.DRIFT_MODELS, default="none",
+                      help=("How to remove host drift between the chunks of"
+                            " --interleave_chunks: one of %s. Default is"
+                            " '%%default'." % ", ".join(schedule.DRIFT_MODELS)))
+    parser.add_option("--budgets", metavar="FILE", default=None,
+                      help=("JSON file of performance budgets (see"
+                            " budget.py) to check the results against;"
+                            " exit with status %d if any is exceeded."
+                            % budget.EXIT_VIOLATION))
+    parser.add_option("--verdict", metavar="FILE", default=None,
+                      help="Write the verdict of --budgets to FILE as JSON.")
+    parser.add_option("--smoke", action="store_true",
+                      help=("Only run the benchmarks in the smoke subset of"
+                            " --budgets."))
 
 
     options, args = parser.parse_args(argv)
@@ -2408,21 +3000,58 @@ def main(argv, bench_funcs=BENCH_FUNCS, bench_groups=BENCH_GROUPS):
     if options.diff_instrumentation:
         info("Suppressing performance data due to --diff_instrumentation")
 
+    if options.parallel > 1 and (multiprocessing is None
+                                 or not hasattr(os, "fork")):
+        parser.error("--parallel requires multiprocessing and fork()")
+
+    budgets = None
+    if options.budgets:
+        try:
+            budgets = budget.Budgets.from_file(options.budgets)
+        except (IOError, ValueError, TypeError) as e:
+            parser.error("bad --budgets file: %s" % e)
+    if (options.smoke or options.verdict) and not budgets:
+        parser.error("--smoke and --verdict require --budgets")
+
+    try:
+        fingerprint = preflight.run(options.preflight)
+    except RuntimeError as e:
+        parser.error(str(e))
+
     should_run = ParseBenchmarksOption(options.benchmarks, bench_groups,
                                        options.fast)
-
-    results = []
-    for name in sorted(should_run):
-        func = bench_funcs[name]
-        print("Running %s..." % name)
-        options.benchmark_name = name  # Easier than threading this everywhere.
-        results.append((name, func(base_cmd_prefix, changed_cmd_prefix,
-                                   options)))
+    if options.smoke:
+        should_run = set(name for name in should_run
+                         if budgets.in_smoke(name))
+
+    serial_results = []
+    readings = []
+    monitor = None
+    if options.monitor_interference:
+        monitor = interference.Monitor()
+    if options.parallel <= 1 or options.calibrate_parallel:
+        for name in sorted(should_run):
+            func = bench_funcs[name]
+            print("Running %s..." % name)
+            # Easier than threading this everywhere.
+            options.benchmark_name = name
+            if monitor:
+                monitor.start()
+            serial_results.append((name, func(base_cmd_prefix,
+                                              changed_cmd_prefix, options)))
+            if monitor:
+                readings.append((name, monitor.stop()))
+    results = serial_results
+    if options.parallel > 1:
+        results = RunBenchmarksInParallel(sorted(should_run), bench_funcs,
+                                          base_cmd_prefix, changed_cmd_prefix,
+                                          options)
 
     print()
     print("Report on %s" % " ".join(platform.uname()))
     if multiprocessing:
         print("Total CPU cores:", multiprocessing.cpu_count())
+    print("Environment %s" % preflight.format_fingerprint(fingerprint))
     hidden = []
     if not options.verbose:
         shown = []
@@ -2458,6 +3087,32 @@ def main(argv, bench_funcs=BENCH_FUNCS, bench_groups=BENCH_GROUPS):
         print("The following not significant results are hidden, "
               "use -v to show them:")
         print(", ".join(name for (name, result) in hidden) + ".")
+
+    if readings:
+        print()
+        print("Interference during the serial runs:")
+        reasons = interference.find_contaminated(
+            [reading for (_, reading) in readings])
+        for (name, reading), reason in zip(readings, reasons):
+            print("%s: %s%s" % (name, reading,
+                                "; CONTAMINATED: %s" % reason if reason
+                                else ""))
+
+    if options.calibrate_parallel and options.parallel > 1:
+        print()
+        print(FormatCalibration(serial_results, results))
+
+    if budgets:
+        gate = budget.Gate(budgets)
+        for name, result in results:
+            gate.check(name, result, (options.control_label,
+                                      options.experiment_label))
+        print()
+        print(gate)
+        if options.verdict:
+            gate.write(options.verdict)
+        if not gate.passed():
+            sys.exit(budget.EXIT_VIOLATION)
     return results
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+"""
+Preflight checks of the host's benchmarking settings, and the
+environment fingerprint recorded with every result.
+
+The settings checked, via sysfs and procfs, are:
+  - governor: the cpufreq scaling governor of every CPU ("performance")
+  - turbo: turbo/boost frequencies (disabled)
+  - smt: simultaneous multithreading (off)
+  - aslr: address space layout randomization (disabled)
+  - thp: transparent hugepages (never)
+  - isolcpus: CPUs isolated from the scheduler (some)
+Settings the host doesn't expose are reported as None and not judged.
+
+Running as root, apply_profile() writes the recommended values, except
+for isolcpus, which can only be set on the kernel command line.
+
+The fingerprint is those settings plus the kernel, the CPU model and the
+number of CPUs; fingerprint_hash() gives a short canonical hash of it,
+which benchmark.py and perf.py print with their results, and which
+history.py uses to refuse to compare runs from different environments.
+
+All paths are relative to a root directory, so that a fake /proc and /sys
+can be used instead of the host's.
+"""
+from __future__ import division, print_function
+
+from collections import OrderedDict
+import glob
+import hashlib
+import json
+import os
+import platform
+import re
+
+MODES = ('warn', 'refuse', 'apply')
+
+class Check:
+    """
+    One setting: its current value (None if the host doesn't expose it),
+    the recommended value, and the files to write "fix" to in order to get
+    it.  "ok", if given, overrides comparing the value with the
+    recommended one.
+    """
+    def __init__(self, name, value, recommended, paths=(), fix=None,
+                 ok=None):
+        self.name = name
+        self.value = value
+        self.recommended = recommended
+        self.paths = list(paths)
+        self.fix = fix
+        self.ok = ok
+
+    def is_ok(self):
+        if self.value is None:
+            return True
+        if self.ok is not None:
+            return self.ok
+        return self.value == self.recommended
+
+    def __str__(self):
+        if self.value is None:
+            return '%s: unknown' % self.name
+        if self.is_ok():
+            return '%s: %s' % (self.name, self.value)
+        return ('%s: %s (recommended: %s)'
+                % (self.name, self.value, self.recommended))
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+def _selected(text):
+    """
+    Get the selected value of a sysfs choice, e.g. "always [madvise] never"
+    """
+    m = re.search(r'\[(\S+)\]', text)
+    return m.group(1) if m else text
+
+class Host:
+    """
+    The settings of a host, read from under root
+    """
+    def __init__(self, root='/'):
+        self.root = root
+
+    def _path(self, relpath):
+        return os.path.join(self.root, relpath)
+
+    def _read(self, relpath):
+        return _read(self._path(relpath))
+
+    def check_governor(self):
+        paths = sorted(glob.glob(self._path(
+            'sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_governor')))
+        governors = sorted(set(_read(path) for path in paths) - set([None]))
+        value = ','.join(governors) if governors else None
+        return Check('governor', value, 'performance', paths, 'performance')
+
+    def check_turbo(self):
+        no_turbo = self._path('sys/devices/system/cpu/intel_pstate/no_turbo')
+        boost = self._path('sys/devices/system/cpu/cpufreq/boost')
+        if _read(no_turbo) is not None:
+            value = 'off' if _read(no_turbo) == '1' else 'on'
+            return Check('turbo', value, 'off', [no_turbo], '1')
+        if _read(boost) is not None:
+            value = 'off' if _read(boost) == '0' else 'on'
+            return Check('turbo', value, 'off', [boost], '0')
+        return Check('turbo', None, 'off')
+
+    def check_smt(self):
+        path = self._path('sys/devices/system/cpu/smt/control')
+        value = _read(path)
+        if value in ('off', 'forceoff', 'notsupported', 'notimplemented'):
+            value = 'off'
+        return Check('smt', value, 'off', [path], 'off')
+
+    def check_aslr(self):
+        path = self._path('proc/sys/kernel/randomize_va_space')
+        value = _read(path)
+        if value is not None:
+            value = 'off' if value == '0' else 'on'
+        return Check('aslr', value, 'off', [path], '0')
+
+    def check_thp(self):
+        path = self._path('sys/kernel/mm/transparent_hugepage/enabled')
+        value = _read(path)
+        if value is not None:
+            value = _selected(value)
+        return Check('thp', value, 'never', [path], 'never')
+
+    def check_isolcpus(self):
+        value = self._read('sys/devices/system/cpu/isolated')
+        if value is not None:
+            value = value or 'none'
+        # Any non-empty list of isolated CPUs will do.
+        return Check('isolcpus', value, 'some', ok=value != 'none')
+
+    def run_checks(self):
+        """
+        Get a list of Check instances for the settings of the host
+        """
+        return [self.check_governor(), self.check_turbo(), self.check_smt(),
+                self.check_aslr(), self.check_thp(), self.check_isolcpus()]
+
+    def get_cpu_model(self):
+        text = self._read('proc/cpuinfo') or ''
+        m = re.search(r'^model name\s*:\s*(.+)$', text, re.M)
+        return m.group(1).strip() if m else platform.machine()
+
+    def get_kernel(self):
+        return (self._read('proc/sys/kernel/osrelease')
+                or platform.release())
+
+    def get_num_cpus(self):
+        text = self._read('sys/devices/system/cpu/online')
+        if not text:
+            return None
+        count = 0
+        for item in text.split(','):
+            first, _, last = item.partition('-')
+            count += int(last or first) - int(first) + 1
+        return count
+
+    def fingerprint(self, checks=None):
+        """
+        Get the environment fingerprint, as an OrderedDict
+        """
+        if checks is None:
+            checks = self.run_checks()
+        result = OrderedDict()
+        result['kernel'] = self.get_kernel()
+        result['machine'] = platform.machine()
+        result['cpu'] = self.get_cpu_model()
+        result['cpus'] = self.get_num_cpus()
+        for check in checks:
+            result[check.name] = check.value
+        return result
+
+def apply_profile(checks):
+    """
+    Write the recommended value of every failing check that can be fixed.
+    Returns a list of (check, error) pairs for those that couldn't be.
+    """
+    failures = []
+    for check in checks:
+        if check.is_ok():
+            continue
+        if check.fix is None:
+            failures.append((check, 'must be set at boot'))
+            continue
+        for path in check.paths:
+            try:
+                with open(path, 'w') as f:
+                    f.write(check.fix)
+            except (IOError, OSError) as e:
+                failures.append((check, str(e)))
+                break
+    return failures
+
+def fingerprint_hash(fingerprint):
+    """
+    A short hash of the canonical JSON form of a fingerprint
+    """
+    text = json.dumps(fingerprint, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+def format_fingerprint(fingerprint):
+    """
+    The "fingerprint: " line recorded with results
+    """
+    return 'fingerprint: %s %s' % (fingerprint_hash(fingerprint),
+                                   json.dumps(fingerprint, sort_keys=True))
+
+def run(mode='warn', root='/'):
+    """
+    Run the preflight stage: print the failing checks and, according to
+    mode (one of MODES), just warn, raise RuntimeError, or try to fix them
+    first (warning about those that can't be).
+    Returns the environment fingerprint after any fixes.
+    """
+    if mode not in MODES:
+        raise ValueError('unknown preflight mode: %r' % mode)
+    host = Host(root)
+    checks = host.run_checks()
+    if mode == 'apply':
+        for check, error in apply_profile(checks):
+            print('preflight: could not set %s: %s' % (check.name, error))
+        checks = host.run_checks()
+    bad = [check for check in checks if not check.is_ok()]
+    for check in bad:
+        print('preflight: warning: %s' % check)
+    if bad and mode == 'refuse':
+        raise RuntimeError('host is not set up for benchmarking: %s'
+                           % ', '.join(check.name for check in bad))
+    return host.fingerprint(checks)
@@ -0,0 +1,222 @@
+"""
+Differential sampling profiles of control and experiment.
+
+Each peer's compilation is run under "perf record -g" using the peer's
+unstripped binaries, and the samples read back with "perf script" are
+folded into one line per distinct stack ("comm;caller;...;callee count",
+the format of Brendan Gregg's stackcollapse scripts).
+
+The two folded profiles are then compared as shares of their own totals
+(so that a slower build's extra samples don't inflate every function):
+  - a ranked table of the functions whose self time changed most
+  - a differential flame graph, as SVG: frame widths are those of the
+    experiment, and frames are red where their share of the samples grew
+    and blue where it shrank
+"""
+from __future__ import division
+
+from collections import namedtuple
+import os
+import re
+import subprocess
+
+# Samples per second; a prime, to avoid sampling in lockstep with
+# periodic activity.
+DEFAULT_FREQUENCY = 997
+
+def record(argv, output, frequency=DEFAULT_FREQUENCY):
+    """
+    Run a command under "perf record", with call graphs, writing the
+    samples to output
+    """
+    subprocess.check_call(['perf', 'record', '-q', '-g', '-F', str(frequency),
+                           '-o', output, '--'] + list(argv))
+
+def parse_perf_script(text):
+    """
+    Fold the output of "perf script" into a dict mapping stacks
+    ("comm;outermost;...;innermost") to sample counts
+    """
+    folded = {}
+    comm = None
+    frames = []
+
+    def flush():
+        if comm is not None and frames:
+            stack = ';'.join([comm] + frames[::-1])
+            folded[stack] = folded.get(stack, 0) + 1
+
+    for line in text.splitlines():
+        if not line.strip():
+            flush()
+            comm = None
+            frames = []
+        elif not line[0].isspace():
+            flush()
+            comm = line.split()[0]
+            frames = []
+        else:
+            # e.g. "	    7f0e5c1d2e3f ggc_internal_alloc+0x1f (/path/cc1)"
+            m = re.match(r'^\s*[0-9a-f]+\s+(.+?)(?:\s+\((.*)\))?$', line)
+            if m:
+                frames.append(re.sub(r'\+0x[0-9a-f]+$', '', m.group(1)))
+    flush()
+    return folded
+
+def read_profile(perf_data):
+    """
+    Read the samples from a perf.data file, folded
+    """
+    with open(os.devnull, 'w') as devnull:
+        text = subprocess.check_output(['perf', 'script', '-i', perf_data],
+                                       stderr=devnull)
+    return parse_perf_script(text.decode('utf-8', 'replace'))
+
+def write_folded(folded, path):
+    with open(path, 'w') as f:
+        for stack, count in sorted(folded.items()):
+            f.write('%s %i\n' % (stack, count))
+
+def get_self_counts(folded):
+    """
+    Get a dict mapping function names to the number of samples in which
+    they were the innermost frame
+    """
+    counts = {}
+    for stack, count in folded.items():
+        function = stack.split(';')[-1]
+        counts[function] = counts.get(function, 0) + count
+    return counts
+
+SelfTimeDiff = namedtuple('SelfTimeDiff', ('function', 'old', 'new'))
+
+def diff_self_times(old_folded, new_folded):
+    """
+    Compare the self time of every function as a share of its profile's
+    samples, returning a list of SelfTimeDiff instances (shares from 0 to
+    1), largest absolute change first
+    """
+    old_total = sum(old_folded.values()) or 1
+    new_total = sum(new_folded.values()) or 1
+    old = get_self_counts(old_folded)
+    new = get_self_counts(new_folded)
+    diffs = [SelfTimeDiff(function, old.get(function, 0) / old_total,
+                          new.get(function, 0) / new_total)
+             for function in set(old) | set(new)]
+    diffs.sort(key=lambda d: (-abs(d.new - d.old), d.function))
+    return diffs
+
+class _Frame:
+    def __init__(self, name):
+        self.name = name
+        self.old = 0
+        self.new = 0
+        self.children = {}
+
+def _build_tree(old_folded, new_folded):
+    root = _Frame('all')
+    for attr, folded in (('old', old_folded), ('new', new_folded)):
+        for stack, count in folded.items():
+            frame = root
+            setattr(frame, attr, getattr(frame, attr) + count)
+            for name in stack.split(';'):
+                frame = frame.children.setdefault(name, _Frame(name))
+                setattr(frame, attr, getattr(frame, attr) + count)
+    return root
+
+def _escape(text):
+    return (text.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('>', '&gt;').replace('"', '&quot;'))
+
+def write_diff_svg(old_folded, new_folded, path, title, width=1200,
+                   frame_height=16, min_width=0.1):
+    """
+    Write a differential flame graph of two folded profiles as SVG
+    """
+    root = _build_tree(old_folded, new_folded)
+    old_total = root.old or 1
+    new_total = root.new or 1
+
+    def share_change(frame):
+        return frame.new / new_total - frame.old / old_total
+
+    def max_change(frame):
+        return max([abs(share_change(frame))]
+                   + [max_change(child) for child in frame.children.values()])
+
+    def depth(frame):
+        return 1 + max([depth(child) for child in frame.children.values()]
+                       or [0])
+
+    scale = max_change(root) or 1
+    height = (depth(root) + 2) * frame_height
+    rects = []
+
+    def draw(frame, x, level):
+        frame_width = frame.new / new_total * width
+        if frame_width < min_width:
+            return
+        change = share_change(frame)
+        # Fade from white to red (grew) or blue (shrank).
+        fade = int(255 * (1 - abs(change) / scale))
+        if change > 0:
+            color = 'rgb(255,%i,%i)' % (fade, fade)
+        else:
+            color = 'rgb(%i,%i,255)' % (fade, fade)
+        y = height - (level + 1) * frame_height
+        label = ('%s (%.2f%% -> %.2f%%)'
+                 % (frame.name, 100 * frame.old / old_total,
+                    100 * frame.new / new_total))
+        max_chars = int(frame_width / 7)
+        text = frame.name if len(frame.name) <= max_chars else (
+            frame.name[:max_chars - 2] + '..' if max_chars > 2 else '')
+        rects.append('<g><title>%s</title>'
+                     '<rect x="%.1f" y="%i" width="%.1f" height="%i"'
+                     ' fill="%s" stroke="white" stroke-width="0.5"/>'
+                     '<text x="%.1f" y="%i">%s</text></g>'
+                     % (_escape(label), x, y, frame_width, frame_height - 1,
+                        color, x + 3, y + frame_height - 4, _escape(text)))
+        child_x = x
+        for child in sorted(frame.children.values(), key=lambda c: c.name):
+            draw(child, child_x, level + 1)
+            child_x += child.new / new_total * width
+
+    draw(root, 0, 0)
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" standalone="no"?>\n'
+                '<svg version="1.1" xmlns="http://www.w3.org/2000/svg"'
+                ' width="%i" height="%i" font-family="monospace"'
+                ' font-size="11">\n' % (width, height))
+        f.write('<text x="%i" y="%i" text-anchor="middle" font-size="15">'
+                '%s</text>\n' % (width // 2, frame_height, _escape(title)))
+        for rect in rects:
+            f.write(rect + '\n')
+        f.write('</svg>\n')
+
+class ProfileDiffResult(object):
+    """
+    The functions whose share of the samples changed most between the
+    profiles of control and experiment
+    """
+
+    always_display = True
+
+    def __init__(self, diffs, old_samples, new_samples, files=(),
+                 max_rows=20):
+        self.diffs = diffs
+        self.old_samples = old_samples
+        self.new_samples = new_samples
+        self.files = list(files)
+        self.max_rows = max_rows
+
+    def __str__(self):
+        lines = ['Samples: %i -> %i' % (self.old_samples, self.new_samples)]
+        if self.diffs:
+            lines.append('Largest changes in self time:')
+            for d in self.diffs[:self.max_rows]:
+                lines.append('  %6.2f%% -> %6.2f%%: %+6.2f%%  %s'
+                             % (100 * d.old, 100 * d.new,
+                                100 * (d.new - d.old), d.function))
+        for path in self.files:
+            lines.append('Wrote %s' % path)
+        return '\n'.join(lines)
@@ -0,0 +1,163 @@
+"""
+Ordering of peers within each iteration ("block") of a benchmark, and
+removal of slow host drift across blocks.
+
+Always running control before experiment lets thermal ramp-up, page cache
+warmth and turbo budget favour one side systematically.  Randomizing (from
+a recorded seed) or counterbalancing the order within each block turns
+that bias into noise, and because every block contains every peer once,
+a drift common to all peers can be estimated from the blocks and removed.
+"""
+from __future__ import division
+
+import random
+
+ORDERS = ('fixed', 'random', 'counterbalanced')
+DRIFT_MODELS = ('none', 'linear', 'block')
+
+class Schedule:
+    """
+    How to order the peers within each block, and how to correct for
+    drift between blocks.
+
+    "order" is one of ORDERS; "seed" seeds the random order (one is chosen
+    and recorded if not given); "drift" is one of DRIFT_MODELS:
+      - "none": use the samples as measured
+      - "linear": fit a straight line to the per-block effects and remove it
+      - "block": remove each block's effect entirely
+    """
+    def __init__(self, order='fixed', seed=None, drift='none'):
+        if order not in ORDERS:
+            raise ValueError('unknown order: %r' % order)
+        if drift not in DRIFT_MODELS:
+            raise ValueError('unknown drift model: %r' % drift)
+        if seed is None:
+            seed = random.SystemRandom().randint(0, 2 ** 31 - 1)
+        self.order = order
+        self.seed = seed
+        self.drift = drift
+
+    def __str__(self):
+        if self.order == 'random':
+            return 'random (seed %i), drift: %s' % (self.seed, self.drift)
+        return '%s, drift: %s' % (self.order, self.drift)
+
+    def iter_blocks(self, num_peers, num_blocks):
+        """
+        Yield a list of peer indices for each block, in the order they
+        should run
+        """
+        rng = random.Random(self.seed)
+        for block_idx in range(num_blocks):
+            order = list(range(num_peers))
+            if self.order == 'random':
+                rng.shuffle(order)
+            elif self.order == 'counterbalanced':
+                # Rotate the order each block: over num_peers blocks,
+                # every peer runs in every position once.
+                shift = block_idx % num_peers
+                order = order[shift:] + order[:shift]
+            yield order
+
+    def correct(self, data, iterations=None):
+        """
+        Remove drift from a list of lists of samples (one list per peer),
+        returning new lists.  iterations is a parallel list of lists of the
+        block that each sample came from, for when some samples were left
+        out; by default the i-th sample of every peer came from block i,
+        and ValueError is raised if the peers have different numbers of
+        samples.
+        """
+        if iterations is None:
+            if len(set(len(samples) for samples in data)) > 1:
+                raise ValueError('peers have different numbers of samples')
+            iterations = [list(range(len(samples))) for samples in data]
+        blocks = get_blocks(iterations)
+        if self.drift == 'none' or len(blocks) < 3:
+            return data
+        effects = get_block_effects(data, iterations)
+        if self.drift == 'linear':
+            effects = fit_line(effects, blocks)
+        effects = dict(zip(blocks, effects))
+        return [[value - effects[block]
+                 for value, block in zip(samples, sample_blocks)]
+                for samples, sample_blocks in zip(data, iterations)]
+
+    def correct_chunks(self, data, chunks):
+        """
+        Like correct(), where block i of each peer is a chunk of several
+        samples, as described by chunks (see get_chunk_effects())
+        """
+        if self.drift == 'none' or not data or len(chunks[0]) < 3:
+            return data
+        effects = get_chunk_effects(data, chunks)
+        if self.drift == 'linear':
+            effects = fit_line(effects)
+        return [[value - effect
+                 for chunk, effect in zip(split_chunks(samples, lengths),
+                                          effects)
+                 for value in chunk]
+                for samples, lengths in zip(data, chunks)]
+
+def get_blocks(iterations):
+    """
+    Get the sorted list of the blocks that any sample came from
+    """
+    return sorted(set(block for sample_blocks in iterations
+                      for block in sample_blocks))
+
+def get_block_effects(data, iterations=None):
+    """
+    Estimate the effect of each block: the mean over the peers of how far
+    each peer's sample in that block was from that peer's mean.  If
+    iterations gives the block of each sample (see Schedule.correct()),
+    return the effects of get_blocks(iterations) in order, else of blocks
+    0 to the length of the shortest list of samples.
+    """
+    if iterations is None:
+        num_blocks = min(len(samples) for samples in data)
+        iterations = [list(range(num_blocks)) for samples in data]
+    means = [sum(samples) / len(samples) for samples in data]
+    deviations = {}
+    for samples, sample_blocks, mean in zip(data, iterations, means):
+        for value, block in zip(samples, sample_blocks):
+            deviations.setdefault(block, []).append(value - mean)
+    return [sum(deviations[block]) / len(deviations[block])
+            for block in get_blocks(iterations)]
+
+def fit_line(values, xs=None):
+    """
+    Least-squares fit of a straight line to the values against xs (by
+    default, their indices), returning the fitted values
+    """
+    n = len(values)
+    if xs is None:
+        xs = range(n)
+    mean_x = sum(xs) / n
+    mean_y = sum(values) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, values))
+    slope = sxy / sxx
+    return [mean_y + slope * (x - mean_x) for x in xs]
+
+def split_chunks(samples, lengths):
+    """
+    Split a list of samples into consecutive chunks of the given lengths
+    """
+    chunks = []
+    start = 0
+    for length in lengths:
+        chunks.append(samples[start:start + length])
+        start += length
+    return chunks
+
+def get_chunk_effects(data, chunks):
+    """
+    Like get_block_effects(), where block i of each peer is a chunk of
+    several samples: chunks[p][i] is the number of samples that peer p took
+    in block i.
+    """
+    means = [[sum(chunk) / len(chunk)
+              for chunk in split_chunks(samples, lengths)]
+             for samples, lengths in zip(data, chunks)]
+    return get_block_effects(means)
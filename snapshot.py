@@ -0,0 +1,163 @@
+"""
+Immutable, content-hashed snapshots of gcc build directories.
+
+Rather than stripping the binaries of a build directory in place (losing
+the debug info needed for profiling), each build is snapshotted once into
+a staging area:
+
+  STAGING/KEY/bin/    stripped, read-only copies of the BINARIES, and a
+                      symlink to every other entry of the build directory,
+                      so that the layout that -B relies on is kept
+  STAGING/KEY/debug/  unstripped, read-only copies of the BINARIES, for
+                      symbolizing profiles
+
+KEY is a hash of the build directory's path and of the contents of its
+BINARIES, so a snapshot is reused for as long as the build is unchanged.
+STAGING/index.json remembers the size and mtime of the binaries that each
+key was computed from, so that an unchanged build isn't even rehashed.
+"""
+from __future__ import division
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+
+BINARIES = ('xgcc', 'cc1', 'cc1plus', 'collect2')
+
+# Where snapshots are kept unless get_snapshot() is told otherwise; the
+# GCC_BENCHMARK_SNAPSHOTS environment variable overrides the default.
+staging_dir = os.environ.get(
+    'GCC_BENCHMARK_SNAPSHOTS',
+    os.path.join(os.path.expanduser('~'), '.cache', 'gcc-benchmarking',
+                 'snapshots'))
+
+INDEX = 'index.json'
+READ_ONLY = 0o555
+
+class Snapshot:
+    """
+    A snapshot of a build directory: "path" is the directory to time the
+    build from (and to pass to -B), "debug_path" the directory with the
+    unstripped binaries
+    """
+    def __init__(self, staging, key, build_path):
+        self.key = key
+        self.build_path = build_path
+        self.path = os.path.join(staging, key, 'bin')
+        self.debug_path = os.path.join(staging, key, 'debug')
+
+    def __repr__(self):
+        return 'Snapshot(%r, key=%r)' % (self.build_path, self.key)
+
+def _get_binaries(build_path):
+    """
+    Get the (name, path) pairs of the BINARIES that the build has, as
+    regular executable files
+    """
+    result = []
+    for binary_name in BINARIES:
+        path = os.path.join(build_path, binary_name)
+        try:
+            statinfo = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(statinfo.st_mode) and statinfo.st_mode & stat.S_IXOTH:
+            result.append((binary_name, path))
+    return result
+
+def _get_signature(binaries):
+    signature = []
+    for binary_name, path in binaries:
+        statinfo = os.stat(path)
+        signature.append([binary_name, statinfo.st_size, statinfo.st_mtime])
+    return signature
+
+def hash_file(path, hasher):
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            hasher.update(block)
+
+def get_key(build_path, binaries):
+    """
+    Hash the path of a build and the contents of its binaries
+    """
+    hasher = hashlib.sha1(build_path.encode('utf-8'))
+    for binary_name, path in binaries:
+        hasher.update(binary_name.encode('utf-8'))
+        hash_file(path, hasher)
+    return hasher.hexdigest()[:16]
+
+def _read_index(staging):
+    try:
+        with open(os.path.join(staging, INDEX)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def _write_index(staging, index):
+    tmp_path = os.path.join(staging, INDEX + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, os.path.join(staging, INDEX))
+
+def _make(staging, key, build_path, binaries):
+    """
+    Build a snapshot in a temporary directory, then move it into place
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='tmp-', dir=staging)
+    bin_dir = os.path.join(tmp_dir, 'bin')
+    debug_dir = os.path.join(tmp_dir, 'debug')
+    os.mkdir(bin_dir)
+    os.mkdir(debug_dir)
+    names = set(binary_name for binary_name, path in binaries)
+    for entry in os.listdir(build_path):
+        if entry not in names:
+            os.symlink(os.path.join(build_path, entry),
+                       os.path.join(bin_dir, entry))
+    for binary_name, path in binaries:
+        debug_copy = os.path.join(debug_dir, binary_name)
+        shutil.copy2(path, debug_copy)
+        stripped = os.path.join(bin_dir, binary_name)
+        if subprocess.call(['strip', '-o', stripped, path]) != 0:
+            # Not something strip understands; time it as it is.
+            shutil.copy2(path, stripped)
+        for copy in (debug_copy, stripped):
+            os.chmod(copy, READ_ONLY)
+    try:
+        os.rename(tmp_dir, os.path.join(staging, key))
+    except OSError:
+        # Another run made the same snapshot meanwhile.
+        shutil.rmtree(tmp_dir)
+
+def get_snapshot(build_path, staging=None):
+    """
+    Get the Snapshot of a build directory, making it if there isn't an
+    up-to-date one in staging (default: staging_dir)
+    """
+    if staging is None:
+        staging = staging_dir
+    if not os.path.isdir(staging):
+        os.makedirs(staging)
+    build_path = os.path.realpath(build_path)
+    binaries = _get_binaries(build_path)
+    signature = _get_signature(binaries)
+
+    index = _read_index(staging)
+    entry = index.get(build_path)
+    if entry and entry['signature'] == signature:
+        key = entry['key']
+    else:
+        key = get_key(build_path, binaries)
+        index[build_path] = {'signature': signature, 'key': key}
+        _write_index(staging, index)
+
+    if not os.path.isdir(os.path.join(staging, key)):
+        _make(staging, key, build_path, binaries)
+    return Snapshot(staging, key, build_path)
@@ -0,0 +1,26 @@
+"""
+The averages that the other modules take of their samples.
+"""
+from __future__ import division
+
+def mean(values):
+    """
+    The arithmetic mean of a non-empty sequence of numbers
+    """
+    values = list(values)
+    if not values:
+        raise ValueError('no data')
+    return sum(values) / len(values)
+
+def median(values):
+    """
+    The median of a non-empty sequence of numbers: the mean of the middle
+    two of an even number of them
+    """
+    values = sorted(values)
+    n = len(values)
+    if n == 0:
+        raise ValueError('no data')
+    if n % 2:
+        return values[n // 2]
+    return (values[n // 2 - 1] + values[n // 2]) / 2.
@@ -0,0 +1,194 @@
+"""
+Selection of a representative subset of configurations from history, and
+prediction of the deltas of the configurations left out.
+
+Each benchmark.py log gives, for every experiment, the relative change of
+its median wallclock time from the control's in each configuration (its
+"delta").  Over many logs, the deltas of some configurations move
+together - e.g. -O2 and -O3 of the same source - so that running one of
+them predicts the others.
+
+select() picks the subset greedily: starting from the configurations
+with too little history to predict, it keeps adding the configuration
+that most reduces the variance of the deltas left unexplained.  Each
+skipped configuration is predicted from a single selected configuration
+(its representative): the one whose straight-line fit leaves the least
+residual variance.  Selection stops once the given fraction of the
+variance is explained, or the subset has reached the given size;
+configurations that none of those selected can predict are then run
+too.
+
+Predictions for the skipped configurations come with a 95% interval from
+the residuals of their fit.
+"""
+from __future__ import division
+
+from collections import OrderedDict
+import math
+
+import history
+import stats
+
+# Stop adding configurations once this fraction of the variance of the
+# historical deltas is explained.
+DEFAULT_TARGET = 0.9
+
+# Fewer paired observations than this can't predict one configuration
+# from another.
+MIN_OBSERVATIONS = 3
+
+Z_95 = 1.96
+
+def get_deltas(logs, kind='compare_wallclock', control='control'):
+    """
+    Get the deltas from a list of history.BenchmarkLogs, as a list of the
+    configurations seen and a list of dicts mapping configurations to
+    deltas, one per experiment per log
+    """
+    configs = []
+    rows = []
+    for log in logs:
+        by_peer = OrderedDict()
+        for (log_kind, test_name, peer_name), samples in log.samples.items():
+            if log_kind != kind:
+                continue
+            by_peer.setdefault(peer_name, {})[test_name] = \
+                stats.median(samples)
+        base = by_peer.pop(control, {})
+        for peer_name, medians in by_peer.items():
+            row = {}
+            for test_name, value in medians.items():
+                if base.get(test_name):
+                    row[test_name] = value / base[test_name] - 1.
+                    if test_name not in configs:
+                        configs.append(test_name)
+            if row:
+                rows.append(row)
+    return configs, rows
+
+def _variance(values):
+    mean = sum(values) / len(values)
+    return sum((x - mean) ** 2 for x in values)
+
+class Fit:
+    """
+    A straight line predicting the deltas of one configuration from those
+    of another, with the standard deviation of its residuals
+    """
+    def __init__(self, xs, ys):
+        n = len(xs)
+        mean_x = sum(xs) / n
+        mean_y = sum(ys) / n
+        sxx = sum((x - mean_x) ** 2 for x in xs)
+        sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+        self.slope = sxy / sxx if sxx else 0.
+        self.intercept = mean_y - self.slope * mean_x
+        self.sse = sum((y - self.predict(x)) ** 2 for x, y in zip(xs, ys))
+        self.sd = math.sqrt(self.sse / (n - 2)) if n > 2 else float('inf')
+
+    def predict(self, x):
+        return self.intercept + self.slope * x
+
+def _fit(rows, source, target):
+    pairs = [(row[source], row[target]) for row in rows
+             if source in row and target in row]
+    if len(pairs) < MIN_OBSERVATIONS:
+        return None
+    return Fit([x for x, y in pairs], [y for x, y in pairs])
+
+class Subset:
+    """
+    The selected configurations, and for each skipped configuration with
+    enough history, its representative and Fit
+    """
+    def __init__(self, selected, fits, explained):
+        self.selected = list(selected)
+        self.fits = fits
+        self.explained = explained
+
+    def __str__(self):
+        lines = ['subset: %i configurations, explaining %.0f%% of the'
+                 ' variance of the historical deltas'
+                 % (len(self.selected), 100 * self.explained)]
+        for config in self.selected:
+            lines.append('  run: %s' % config)
+        for config, (representative, fit) in self.fits.items():
+            lines.append('  skip: %s (from %s, residual sd %.2f%%)'
+                         % (config, representative, 100 * fit.sd))
+        return '\n'.join(lines)
+
+    def predict(self, measured):
+        """
+        Given a dict mapping the selected configurations to measured
+        deltas, get an OrderedDict mapping each skipped configuration to a
+        (representative, predicted delta, half-width of its 95% interval)
+        triple
+        """
+        result = OrderedDict()
+        for config, (representative, fit) in self.fits.items():
+            if measured.get(representative) is not None:
+                result[config] = (representative,
+                                  fit.predict(measured[representative]),
+                                  Z_95 * fit.sd)
+        return result
+
+def select(configs, rows, max_size=None, target=DEFAULT_TARGET):
+    """
+    Choose a Subset of configs from the historical deltas in rows: of
+    max_size configurations if given, else the smallest explaining the
+    target fraction of their variance
+    """
+    values = dict((config, [row[config] for row in rows if config in row])
+                  for config in configs)
+    selected = [config for config in configs
+                if len(values[config]) < MIN_OBSERVATIONS]
+    baseline = dict((config, _variance(values[config])
+                     if config not in selected else 0.)
+                    for config in configs)
+    total = sum(baseline.values())
+    if not total:
+        return Subset(configs, OrderedDict(), 1.)
+    fits = dict(((source, target_config), _fit(rows, source, target_config))
+                for source in configs for target_config in configs
+                if source != target_config)
+
+    def cost(config, selected):
+        """
+        The unexplained variance of config's deltas given the selected
+        configurations
+        """
+        if config in selected:
+            return 0.
+        best = baseline[config]
+        for source in selected:
+            fit = fits[(source, config)]
+            if fit is not None:
+                best = min(best, fit.sse)
+        return best
+
+    unexplained = total
+    while len(selected) < len(configs):
+        if max_size is not None and len(selected) >= max_size:
+            break
+        if max_size is None and 1 - unexplained / total >= target:
+            break
+        candidates = [config for config in configs if config not in selected]
+        scores = [(sum(cost(config, selected + [candidate])
+                       for config in configs), candidate)
+                  for candidate in candidates]
+        unexplained, best = min(scores, key=lambda score: score[0])
+        selected.append(best)
+
+    skipped = OrderedDict()
+    for config in configs:
+        if config in selected:
+            continue
+        options = [(fits[(source, config)].sse, source) for source in selected
+                   if fits[(source, config)] is not None]
+        if options:
+            sse, source = min(options)
+            skipped[config] = (source, fits[(source, config)])
+        else:
+            selected.append(config)
+    return Subset([config for config in configs if config in selected],
+                  skipped, 1 - unexplained / total)
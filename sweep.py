@@ -0,0 +1,226 @@
+"""
+A parameter-space sweep engine for benchmark.py.
+
+A sweep is defined by a list of axes (sources, flag sets, --params,
+languages...), each with a list of levels.  A level is either a string,
+which is split on whitespace into gcc arguments, or a dict with "args"
+(a string or list), and optionally "label" and "cost".  A config file is
+JSON of the form:
+
+  {
+    "axes": [["source", ["-S test-sources/kdecore.cc -g",
+                         {"args": "-S test-sources/empty.c -g",
+                          "label": "empty.c", "cost": 0.02}]],
+             ["opt", ["-O0", "-O2"]],
+             ["lto", ["", "-flto"]]],
+    "design": "full",
+    "samples": 8,
+    "seed": 0,
+    "seconds_per_run": 1.5
+  }
+
+The design is one of "full" (every combination), "fractional" (a
+balanced fraction, 1/L of the full design, for three or more axes that
+all have L levels) or "lhs" (a Latin hypercube of "samples" points).
+The estimated cost of a point is seconds_per_run multiplied by the cost
+of each of its levels.
+"""
+from __future__ import division
+
+from collections import OrderedDict
+import itertools
+import json
+import random
+
+import stats
+
+DESIGNS = ('full', 'fractional', 'lhs')
+
+class Level:
+    def __init__(self, value):
+        if isinstance(value, dict):
+            args = value.get('args', '')
+            self.label = value.get('label')
+            self.cost = float(value.get('cost', 1.))
+        else:
+            args = value
+            self.label = None
+            self.cost = 1.
+        if not isinstance(args, list):
+            args = args.split()
+        self.args = args
+        if self.label is None:
+            self.label = ' '.join(args) or '(none)'
+
+    def __repr__(self):
+        return 'Level(%r)' % self.label
+
+class Axis:
+    def __init__(self, name, levels):
+        self.name = name
+        self.levels = [Level(level) for level in levels]
+
+    def __repr__(self):
+        return 'Axis(%r, %r)' % (self.name, self.levels)
+
+# The configurations that benchmark.py has always run.
+DEFAULT_AXES = [Axis('source', ['-S test-sources/kdecore.cc -g',
+                                '-S test-sources/empty.c -g',
+                                '-S test-sources/big-code.c -g',
+                                '-S test-sources/influence.i -g']),
+                Axis('opt', ['-O0', '-O1', '-O2', '-O3', '-Os'])]
+
+class Sweep:
+    """
+    A set of axes, the design used to sample points from them, and the
+    cost model.  Points are tuples of level indices, one per axis.
+    """
+    def __init__(self, axes=None, design='full', samples=None, seed=0,
+                 seconds_per_run=1.):
+        if design not in DESIGNS:
+            raise ValueError('unknown design: %r' % design)
+        self.axes = axes if axes is not None else DEFAULT_AXES
+        if design == 'fractional':
+            # With fewer axes, or unequal numbers of levels, the fraction
+            # below would alias main effects or leave levels out.
+            if (len(self.axes) < 3
+                    or len(set(len(axis.levels) for axis in self.axes)) > 1):
+                raise ValueError('the fractional design needs three or more'
+                                 ' axes with the same number of levels;'
+                                 ' use lhs instead')
+        self.design = design
+        self.samples = samples
+        self.seed = seed
+        self.seconds_per_run = seconds_per_run
+
+    @classmethod
+    def from_file(cls, path, design=None, samples=None):
+        """
+        Load a sweep from a config file; design and samples, if given,
+        override the file's
+        """
+        with open(path) as f:
+            config = json.load(f)
+        axes = [Axis(name, levels) for name, levels in config['axes']]
+        return cls(axes,
+                   design=design or config.get('design', 'full'),
+                   samples=samples or config.get('samples'),
+                   seed=config.get('seed', 0),
+                   seconds_per_run=config.get('seconds_per_run', 1.))
+
+    def get_plan(self):
+        """
+        Get the list of points to run, in order
+        """
+        full = itertools.product(*[range(len(axis.levels))
+                                   for axis in self.axes])
+        if self.design == 'full' or len(self.axes) < 2:
+            return list(full)
+        if self.design == 'fractional':
+            # Keep the points where the last axis's level is determined
+            # by the others: every pair of levels of every two axes still
+            # appears equally often, so main effects remain balanced and
+            # are aliased only with interactions.
+            num_levels = len(self.axes[-1].levels)
+            return [point for point in full
+                    if sum(point[:-1]) % num_levels == point[-1]]
+        return self._latin_hypercube()
+
+    def _latin_hypercube(self):
+        rng = random.Random(self.seed)
+        n = self.samples or max(len(axis.levels) for axis in self.axes)
+        columns = []
+        for axis in self.axes:
+            strata = list(range(n))
+            rng.shuffle(strata)
+            columns.append([s * len(axis.levels) // n for s in strata])
+        plan = []
+        for point in zip(*columns):
+            if point not in plan:
+                plan.append(point)
+        return plan
+
+    def get_args(self, point):
+        args = []
+        for axis, idx in zip(self.axes, point):
+            args += axis.levels[idx].args
+        return args
+
+    def get_labels(self, point):
+        return OrderedDict((axis.name, axis.levels[idx].label)
+                           for axis, idx in zip(self.axes, point))
+
+    def estimate_cost(self, plan, num_runs):
+        """
+        Estimate the number of seconds needed to run a plan, given the
+        number of compilations per point (iterations times peers)
+        """
+        total = 0.
+        for point in plan:
+            cost = self.seconds_per_run
+            for axis, idx in zip(self.axes, point):
+                cost *= axis.levels[idx].cost
+            total += cost * num_runs
+        return total
+
+def compute_effects(sweep, results):
+    """
+    Given a mapping from points to the relative change (experiment vs
+    control) observed there, compute:
+      - the main effect of each level: the mean change at that level
+        minus the grand mean, as an OrderedDict mapping axis names to
+        OrderedDicts mapping level labels to effects;
+      - for each pair of axes, the largest interaction between their
+        levels, as an OrderedDict mapping (name, name) to
+        (effect, label, label).
+    """
+    grand = stats.mean(list(results.values()))
+    means = []
+    main_effects = OrderedDict()
+    for axis_idx, axis in enumerate(sweep.axes):
+        level_means = {}
+        effects = OrderedDict()
+        for level_idx, level in enumerate(axis.levels):
+            values = [v for p, v in results.items() if p[axis_idx] == level_idx]
+            if values:
+                level_means[level_idx] = stats.mean(values)
+                effects[level.label] = level_means[level_idx] - grand
+        means.append(level_means)
+        main_effects[axis.name] = effects
+
+    interactions = OrderedDict()
+    for a, b in itertools.combinations(range(len(sweep.axes)), 2):
+        if len(means[a]) < 2 or len(means[b]) < 2:
+            continue
+        cells = {}
+        for p, v in results.items():
+            cells.setdefault((p[a], p[b]), []).append(v)
+        worst = None
+        for (la, lb), values in cells.items():
+            effect = stats.mean(values) - means[a][la] - means[b][lb] + grand
+            if worst is None or abs(effect) > abs(worst[0]):
+                worst = (effect,
+                         sweep.axes[a].levels[la].label,
+                         sweep.axes[b].levels[lb].label)
+        if worst is not None:
+            interactions[(sweep.axes[a].name, sweep.axes[b].name)] = worst
+    return main_effects, interactions
+
+def format_effects(title, sweep, results):
+    """
+    Describe the main effects and interactions of a set of relative
+    changes as text
+    """
+    if not results:
+        return '%s: no results' % title
+    main_effects, interactions = compute_effects(sweep, results)
+    lines = ['%s: mean change %+.2f%% over %i configurations'
+             % (title, 100. * stats.mean(list(results.values())), len(results))]
+    for name, effects in main_effects.items():
+        lines.append('  main effects of %s:' % name)
+        for label, effect in effects.items():
+            lines.append('    %s: %+.2f%%' % (label, 100. * effect))
+    for (name_a, name_b), (effect, label_a, label_b) in interactions.items():
+        lines.append('  largest %s x %s interaction: %s with %s: %+.2f%%'
+                     % (name_a, name_b, label_a, label_b, 100. * effect))
+    return '\n'.join(lines)
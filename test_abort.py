@@ -0,0 +1,61 @@
+"""
+Tests for abort.py, and for killing launches at their timeouts
+"""
+import unittest
+
+import abort
+import launcher
+
+class PolicyTests(unittest.TestCase):
+    def test_timeouts(self):
+        policy = abort.Policy(factor=5, timeout=30.)
+        self.assertEqual(policy.get_timeout('experiment'), 30.)
+        for elapsed in (0.5, 0.4, 0.6):
+            self.assertEqual(policy.record('control', elapsed, False), '')
+        self.assertEqual(policy.get_base_time(), 0.5)
+        self.assertEqual(policy.get_timeout('experiment'), 2.5)
+        # The control only gets the fixed timeout.
+        self.assertEqual(policy.get_timeout('control'), 30.)
+
+    def test_min_time(self):
+        policy = abort.Policy()
+        policy.record('control', 0.01, False)
+        self.assertEqual(policy.get_timeout('experiment'), abort.MIN_TIME)
+
+    def test_no_factor(self):
+        policy = abort.Policy(factor=0)
+        policy.record('control', 1., False)
+        self.assertEqual(policy.get_timeout('experiment'), None)
+
+    def test_abort(self):
+        policy = abort.Policy(runs=2)
+        policy.record('control', 1., False)
+        self.assertEqual(policy.record('experiment', 5., True),
+                         ' (killed after 5.00 s)')
+        self.assertEqual(policy.aborted, set())
+        self.assertEqual(policy.get_results(), {})
+        self.assertEqual(policy.record('experiment', 5.5, True),
+                         ' (killed after 5.50 s; aborted)')
+        self.assertEqual(policy.aborted, set(['experiment']))
+        result = policy.get_results()['experiment']
+        self.assertEqual((result.base_time, result.changed_time), (1., 5.5))
+        self.assertTrue('at least 5.5x slower' in str(result))
+
+    def test_killed_control(self):
+        policy = abort.Policy(timeout=2.)
+        self.assertRaises(RuntimeError, policy.record, 'control', 2., True)
+
+class KillTests(unittest.TestCase):
+    def test_launch_timeout(self):
+        the_launch = launcher.Launcher(['sleep', '10']).launch(0.2)
+        self.assertTrue(the_launch.timed_out)
+        self.assertTrue(the_launch.elapsed < 5.)
+        self.assertTrue(the_launch.status < 0)
+
+    def test_launch_in_time(self):
+        the_launch = launcher.Launcher(['true']).launch(5.)
+        self.assertFalse(the_launch.timed_out)
+        self.assertEqual(the_launch.status, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+"""
+Tests for benchmark.py, with a fake launcher in place of the builds
+"""
+from collections import OrderedDict
+import unittest
+
+import abort
+import benchmark
+import launcher
+
+class FakeLauncher:
+    """
+    Stands in for launcher.Launcher: each launch of a build takes the
+    next (elapsed, timed_out) pair from SCRIPTS, keyed by the build's
+    path (the argument to -B), or 1 s if there are none left
+    """
+    SCRIPTS = {}
+
+    def __init__(self, argv, *args, **kwargs):
+        self.argv = argv
+        self.script = FakeLauncher.SCRIPTS.setdefault(argv[2], [])
+
+    def launch(self, timeout=None):
+        elapsed, timed_out = 1., False
+        if self.script:
+            elapsed, timed_out = self.script.pop(0)
+        return launcher.Launch(elapsed, -9 if timed_out else 0, elapsed,
+                               0, 0, 0, timed_out)
+
+class FakeLauncherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.saved = (benchmark.launcher.Launcher,
+                      benchmark.Peer.use_snapshot)
+        benchmark.launcher.Launcher = FakeLauncher
+        benchmark.Peer.use_snapshot = lambda peer: None
+        FakeLauncher.SCRIPTS = {}
+
+    def tearDown(self):
+        benchmark.launcher.Launcher, benchmark.Peer.use_snapshot = self.saved
+
+    def make_policy(self):
+        policy = abort.Policy()
+        policy.record('control', 1., False)
+        return policy
+
+class WallclockTests(FakeLauncherTestCase):
+    def test_one_killed_run(self):
+        # The experiment is killed once, in iteration 1, which isn't
+        # enough to abort it.
+        FakeLauncher.SCRIPTS = {
+            'control': [(1., False), (1.1, False), (1.2, False),
+                        (1.3, False)],
+            'experiment': [(2., False), (5., True), (2.2, False),
+                           (2.3, False)]}
+        peers = benchmark.make_peers('control', ['experiment'])
+        policy = self.make_policy()
+        data = benchmark.measure_wallclock(peers, 'xgcc', ['-O2'], 4,
+                                           policy=policy)
+        self.assertEqual(data, [[1., 1.2, 1.3], [2., 2.2, 2.3]])
+        self.assertEqual(policy.aborted, set())
+        results = benchmark.Comparisons.from_data(
+            peers, data, benchmark.perf.CompareMultipleRuns, 'test')
+        self.assertTrue(isinstance(results[('control', 'experiment')],
+                                   benchmark.perf.BenchmarkResult))
+
+    def test_aborted(self):
+        FakeLauncher.SCRIPTS = {
+            'control': [(1., False), (1.1, False), (1.2, False),
+                        (1.3, False)],
+            'experiment1': [(5., True), (5., True)],
+            'experiment2': [(1.5, False), (1.6, False), (5., True),
+                            (1.8, False)]}
+        peers = benchmark.make_peers('control',
+                                     ['experiment1', 'experiment2'])
+        policy = self.make_policy()
+        data = benchmark.measure_wallclock(peers, 'xgcc', ['-O2'], 4,
+                                           policy=policy)
+        self.assertEqual(policy.aborted, set(['experiment1']))
+        # experiment1's kills don't cost the others any samples, but
+        # experiment2's does.
+        self.assertEqual(data, [[1., 1.1, 1.3], [], [1.5, 1.6, 1.8]])
+        results = benchmark.Comparisons.from_data(
+            peers, data, benchmark.perf.CompareMultipleRuns, 'test',
+            aborted=policy.get_results())
+        self.assertTrue(isinstance(results[('control', 'experiment1')],
+                                   abort.AbortedResult))
+        self.assertTrue(isinstance(results[('control', 'experiment2')],
+                                   benchmark.perf.BenchmarkResult))
+
+    def test_killed_control(self):
+        FakeLauncher.SCRIPTS = {'control': [(1., False), (5., True)]}
+        peers = benchmark.make_peers('control', ['experiment'])
+        policy = abort.Policy(timeout=4.)
+        self.assertRaises(RuntimeError, benchmark.measure_wallclock, peers,
+                          'xgcc', ['-O2'], 4, policy=policy)
+
+class ColdTests(FakeLauncherTestCase):
+    def test_one_killed_run(self):
+        # Each iteration runs each build cold, then warm; the experiment's
+        # cold run is killed in iteration 1, and not run warm.
+        FakeLauncher.SCRIPTS = {
+            'control': [(2., False), (1., False), (2.1, False), (1.1, False),
+                        (2.2, False), (1.2, False), (2.3, False),
+                        (1.3, False)],
+            'experiment': [(3., False), (1.5, False), (50., True),
+                           (3.2, False), (1.7, False), (3.3, False),
+                           (1.8, False)]}
+        policy = self.make_policy()
+        results = benchmark.compare_wallclock_cold(
+            'control', ['experiment'], 'xgcc', ['-O2'], 4, policy=policy)
+        result = results[('control', 'experiment')]
+        self.assertTrue(isinstance(result,
+                                   benchmark.coldcache.ColdStartResult))
+        self.assertEqual([(cold.elapsed, warm.elapsed)
+                          for cold, warm in result.base_launches],
+                         [(2., 1.), (2.2, 1.2), (2.3, 1.3)])
+        self.assertEqual([(cold.elapsed, warm.elapsed)
+                          for cold, warm in result.changed_launches],
+                         [(3., 1.5), (3.2, 1.7), (3.3, 1.8)])
+
+class FakeMeter:
+    """
+    Stands in for energy.Meter: each reading takes the next number of
+    joules from READINGS
+    """
+    READINGS = []
+
+    def __init__(self, root='/'):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        return OrderedDict([('package-0', FakeMeter.READINGS.pop(0))])
+
+class EnergyTests(FakeLauncherTestCase):
+    def setUp(self):
+        FakeLauncherTestCase.setUp(self)
+        self.saved_meter = benchmark.energy.Meter
+        benchmark.energy.Meter = FakeMeter
+
+    def tearDown(self):
+        benchmark.energy.Meter = self.saved_meter
+        FakeLauncherTestCase.tearDown(self)
+
+    def test_one_killed_run(self):
+        # The experiment's run in iteration 2 is killed.
+        FakeLauncher.SCRIPTS = {'experiment': [(1., False), (1., False),
+                                               (5., True)]}
+        FakeMeter.READINGS = [10., 12., 10.5, 12.5, 11., 50., 11.5, 13.5]
+        policy = self.make_policy()
+        results = benchmark.compare_energy_multi(
+            'control', ['experiment'], 'xgcc', ['-O2'], 4, policy=policy)
+        result = results[('control', 'experiment')]
+        self.assertTrue(isinstance(result, benchmark.energy.EnergyResult))
+        self.assertEqual([reading['package-0']
+                          for reading in result.base_readings],
+                         [10., 10.5, 11.5])
+        self.assertEqual([reading['package-0']
+                          for reading in result.changed_readings],
+                         [12., 12.5, 13.5])
+
+class LayoutTests(FakeLauncherTestCase):
+    def test_killed_layout(self):
+        # Every run of the experiment under the second layout is killed,
+        # which isn't enough to abort it.
+        FakeLauncher.SCRIPTS = {
+            'control': [(1., False), (1., False), (1.1, False), (1.1, False),
+                        (1.2, False), (1.2, False)],
+            'experiment': [(2., False), (2., False), (5., True), (5., True),
+                           (2.4, False), (2.4, False)]}
+        layouts = [benchmark.layout.Layout(0, 1, None),
+                   benchmark.layout.Layout(0, 2, None),
+                   benchmark.layout.Layout(0, 3, None)]
+        policy = abort.Policy(runs=3)
+        policy.record('control', 1., False)
+        results = benchmark.compare_wallclock_layouts(
+            'control', ['experiment'], 'xgcc', ['-O2'], layouts, 2,
+            policy=policy)
+        result = results[('control', 'experiment')]
+        self.assertEqual((result.avg_base, result.avg_changed), (1.1, 2.2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests for budget.py
+"""
+import unittest
+
+import abort
+import budget
+
+class FakeResult(object):
+    def __init__(self, avg_base, avg_changed, always_display):
+        self.avg_base = avg_base
+        self.avg_changed = avg_changed
+        self.always_display = always_display
+
+class GateTests(unittest.TestCase):
+    def setUp(self):
+        self.gate = budget.Gate(budget.Budgets([
+            budget.Budget('*', 'time', max_relative=0.02)]))
+
+    def test_time(self):
+        self.assertEqual(self.gate.check('a', FakeResult(1., 1.01, True)),
+                         [])
+        self.assertEqual(self.gate.check('b', FakeResult(1., 1.1, False)),
+                         [])
+        self.assertTrue(self.gate.passed())
+        self.assertEqual(len(self.gate.check('c', FakeResult(1., 1.1, True))),
+                         1)
+        self.assertFalse(self.gate.passed())
+
+    def test_aborted(self):
+        result = abort.AbortedResult('experiment', [5., 5.], 1.)
+        self.assertEqual(len(self.gate.check('a', result)), 1)
+        self.assertFalse(self.gate.passed())
+
+    def test_aborted_untimed_control(self):
+        # The control wasn't timed, so there's no ratio to check.
+        result = abort.AbortedResult('experiment', [5., 5.], None)
+        self.assertEqual(len(self.gate.check('a', result)), 1)
+        self.assertFalse(self.gate.passed())
+
+    def test_aborted_no_budget(self):
+        gate = budget.Gate(budget.Budgets([
+            budget.Budget('*', 'memory', max_relative=0.02)]))
+        result = abort.AbortedResult('experiment', [5., 5.], None)
+        self.assertEqual(len(gate.check('a', result)), 1)
+        self.assertFalse(gate.passed())
+
+    def test_aborted_once(self):
+        # The same aborted peer is reported for each measurement.
+        result = abort.AbortedResult('experiment', [5., 5.], 1.)
+        for _ in range(3):
+            self.gate.check('a', result)
+        self.gate.check('b', result)
+        self.assertEqual([check['config']
+                          for check in self.gate.get_violations()],
+                         ['a', 'b'])
+        self.assertTrue('experiment: aborted after 2 killed run(s)'
+                        in str(self.gate))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Tests for energy.py, against a fake /sys
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import energy
+
+# The zones of the fake tree: (directory, name, energy_uj,
+# max_energy_range_uj).
+ZONES = [
+    ('intel-rapl:0', 'package-0', 1000000, 262143328850),
+    ('intel-rapl:0/intel-rapl:0:0', 'core', 500000, 262143328850),
+    ('intel-rapl:0/intel-rapl:0:1', 'dram', 2000000, 65712999613),
+    ('intel-rapl:1', 'package-1', 3000000, 262143328850),
+    ('intel-rapl-mmio:0', 'package-0', 4000000, 262143328850),
+]
+
+class FakeSysTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.powercap = os.path.join(self.root, energy.POWERCAP)
+        for path, name, energy_uj, max_range in ZONES:
+            zone = os.path.join(self.powercap, path)
+            os.makedirs(zone)
+            self.write(zone, 'name', name)
+            self.write(zone, 'energy_uj', energy_uj)
+            self.write(zone, 'max_energy_range_uj', max_range)
+        # The kernel links each subzone into the top level too.
+        for path in ('intel-rapl:0:0', 'intel-rapl:0:1'):
+            os.symlink(os.path.join(self.powercap, 'intel-rapl:0', path),
+                       os.path.join(self.powercap, path))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, zone, filename, value):
+        with open(os.path.join(zone, filename), 'w') as f:
+            f.write('%s\n' % value)
+
+    def set_counter(self, path, energy_uj):
+        self.write(os.path.join(self.powercap, path), 'energy_uj', energy_uj)
+
+    def test_find_domains(self):
+        domains = energy.find_domains(self.root)
+        self.assertEqual([domain.label for domain in domains],
+                         ['package-0', 'dram-0', 'package-1'])
+        self.assertEqual([domain.max_range for domain in domains],
+                         [262143328850, 65712999613, 262143328850])
+
+    def test_no_rapl(self):
+        shutil.rmtree(self.powercap)
+        self.assertEqual(energy.find_domains(self.root), [])
+        self.assertRaises(RuntimeError, energy.check_readable, [])
+
+    def test_meter(self):
+        meter = energy.Meter(self.root)
+        meter.start()
+        self.set_counter('intel-rapl:0', 3500000)
+        self.set_counter('intel-rapl:0/intel-rapl:0:1', 2250000)
+        reading = meter.stop()
+        self.assertEqual(list(reading.items()),
+                         [('package-0', 2.5), ('dram-0', 0.25),
+                          ('package-1', 0.)])
+        self.assertEqual(energy.get_total(reading), 2.75)
+        self.assertEqual(energy.format_reading(reading),
+                         '2.750 J (package-0 2.500 J, dram-0 0.250 J,'
+                         ' package-1 0.000 J)')
+
+    def test_wraparound(self):
+        self.write(os.path.join(self.powercap, 'intel-rapl:1'),
+                   'max_energy_range_uj', 999)
+        self.set_counter('intel-rapl:1', 990)
+        meter = energy.Meter(self.root)
+        meter.start()
+        self.set_counter('intel-rapl:1', 5)
+        # 990 -> 999 is 9 uJ, 999 -> 0 one more, and 0 -> 5 another 5.
+        self.assertEqual(meter.stop()['package-1'], 15e-6)
+
+class EnergyResultTests(unittest.TestCase):
+    def readings(self, totals):
+        return [energy.OrderedDict([('package-0', total - 1.),
+                                    ('dram-0', 1.)])
+                for total in totals]
+
+    def test_significant(self):
+        result = energy.compare(self.readings([10., 10.5, 9.5, 10.]),
+                                self.readings([12., 12.5, 11.5, 12.]), None)
+        self.assertTrue(result.always_display)
+        self.assertEqual((result.base_joules, result.changed_joules),
+                         (10., 12.))
+        self.assertTrue('dram-0: 1.000 J -> 1.000 J' in str(result))
+
+    def test_not_significant(self):
+        result = energy.compare(self.readings([10., 10.5, 9.5, 10.]),
+                                self.readings([10., 10.5, 9.5, 10.]), None)
+        self.assertFalse(result.always_display)
+        self.assertEqual(result.t_msg, 'Not significant')
+
+if __name__ == '__main__':
+    unittest.main()
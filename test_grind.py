@@ -0,0 +1,54 @@
+"""
+Tests for grind.py's result cache
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import grind
+
+class CachePathTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.build = os.path.join(self.tmpdir, 'build')
+        os.mkdir(self.build)
+        self.xgcc = self.write('build/xgcc', 'driver')
+        self.cc1 = self.write('build/cc1', 'compiler')
+        self.source = self.write('test.c', 'int x;')
+        self.argv = [self.xgcc, '-B', self.build, '-S', self.source]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text, mtime=None):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def get_cache_path(self):
+        return grind.get_cache_path(self.tmpdir, 'cachegrind', self.argv,
+                                    'valgrind-3')
+
+    def test_inputs(self):
+        self.assertEqual(grind.get_inputs(self.argv),
+                         [self.xgcc, self.cc1, self.source])
+
+    def test_unchanged(self):
+        self.assertEqual(self.get_cache_path(), self.get_cache_path())
+
+    def test_source_edited(self):
+        before = self.get_cache_path()
+        self.write('test.c', 'int y;', mtime=1)
+        self.assertNotEqual(self.get_cache_path(), before)
+
+    def test_compiler_rebuilt(self):
+        before = self.get_cache_path()
+        self.write('build/cc1', 'compiler, rebuilt', mtime=1)
+        self.assertNotEqual(self.get_cache_path(), before)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests for history.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import history
+
+LOG = """started: 2026-01-01T00:00:00
+fingerprint: 0123abcd
+compare_wallclock: xgcc -S test-sources/empty.c -o null -O2
+  iteration 0: control: xgcc -S empty.c -o null -O2: time_taken: 1.5
+  iteration 0: experiment: xgcc -S empty.c -o null -O2: time_taken: 1.25
+  iteration 1: control: xgcc -S empty.c -o null -O2: time_taken: 1.75
+  iteration 1: experiment: xgcc -S empty.c -o null -O2: time_taken: 2e-1
+compare_memory: xgcc -S test-sources/empty.c -o null -O2
+  iteration 0: control: xgcc -S empty.c -o null -O2: total_ggc: 1024
+"""
+
+class PeltTests(unittest.TestCase):
+    def test_too_short(self):
+        self.assertEqual(history.pelt([1., 5., 1.]), [])
+
+    def test_flat(self):
+        self.assertEqual(history.pelt([1.] * 20), [])
+
+    def test_single_step(self):
+        values = [1., 1.1, 0.9, 1., 1.05, 0.95] * 3
+        values += [2., 2.1, 1.9, 2., 2.05, 1.95] * 3
+        self.assertEqual(history.pelt(values), [18])
+
+    def test_two_steps(self):
+        values = [1.] * 10 + [3.] * 10 + [1.] * 10
+        self.assertEqual(history.pelt(values), [10, 20])
+
+    def test_min_size(self):
+        # A single outlier isn't a segment of its own.
+        values = [1.] * 10 + [9.] + [1.] * 10
+        changes = history.pelt(values, penalty=1., min_size=3)
+        bounds = [0] + changes + [len(values)]
+        self.assertTrue(changes)
+        for start, end in zip(bounds, bounds[1:]):
+            self.assertTrue(end - start >= 3)
+
+class BenchmarkLogTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'log.txt')
+        with open(self.path, 'w') as f:
+            f.write(LOG)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse(self):
+        log = history.BenchmarkLog(self.path)
+        self.assertEqual(log.fingerprint, '0123abcd')
+        self.assertEqual(log.date, history.time.mktime(
+            history.time.strptime('2026-01-01T00:00:00',
+                                  history.DATE_FORMAT)))
+        test_name = 'xgcc -S empty.c -o null -O2'
+        self.assertEqual(list(log.samples.items()), [
+            (('compare_wallclock', test_name, 'control'), [1.5, 1.75]),
+            (('compare_wallclock', test_name, 'experiment'), [1.25, 0.2]),
+            (('compare_memory', test_name, 'control'), [1024.])])
+
+    def test_no_date(self):
+        with open(self.path, 'w') as f:
+            f.write(LOG.split('\n', 1)[1])
+        log = history.BenchmarkLog(self.path)
+        self.assertEqual(log.date, os.path.getmtime(self.path))
+
+    def test_find_changes(self):
+        series = history.Series(('compare_wallclock', 'test', 'control'))
+        for i in range(20):
+            series.append(i, 1. if i < 10 else 2., 'log%i.txt' % i)
+        changes = history.find_changes(series)
+        self.assertEqual(len(changes), 1)
+        change = changes[0]
+        self.assertEqual((change.before, change.after), (1., 2.))
+        self.assertEqual((change.earliest, change.latest), (9, 10))
+        self.assertEqual(change.path, 'log10.txt')
+
+class FormatChangeTests(unittest.TestCase):
+    def make_change(self, before, after):
+        return history.Change(('compare_memory', 'test', 'control'), before,
+                              after, 0, 0, 'log.txt')
+
+    def test_percentage(self):
+        text = history.format_change(self.make_change(100., 150.))
+        self.assertTrue('100 -> 150 KB (+50.0%) between' in text)
+
+    def test_from_zero(self):
+        text = history.format_change(self.make_change(0., 150.))
+        self.assertTrue('0 -> 150 KB between' in text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Tests for the local changes to perf.py
+"""
+from array import array
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import launcher
+import perf
+
+def make_options():
+    return optparse.Values({'track_memory': False,
+                            'diff_instrumentation': False,
+                            'disable_timelines': True,
+                            'benchmark_name': 'test'})
+
+def make_launches(times, minflt=100):
+    return [launcher.Launch(t, 0, t / 2., minflt, 0, 0, False)
+            for t in times]
+
+class MergeRawDataTests(unittest.TestCase):
+    def test_runtimes(self):
+        merged = perf.MergeRawData([perf.RawData([1., 2.], None, 'a'),
+                                    perf.RawData([3.], None, 'b')])
+        self.assertEqual(merged.runtimes, [1., 2., 3.])
+        self.assertEqual(merged.chunks, [2, 1])
+        self.assertEqual(merged.mem_usage, None)
+        self.assertEqual(merged.inst_output, 'b')
+
+    def test_mem_usage(self):
+        # MemoryUsageFuture.GetMemoryUsage() returns arrays.
+        merged = perf.MergeRawData([
+            perf.RawData([1.], array('I', [10, 20])),
+            perf.RawData([2.], [30]),
+            perf.RawData([3.], array('I', [40]))])
+        self.assertEqual(list(merged.mem_usage), [10, 20, 30, 40])
+
+class RunInterleavedTests(unittest.TestCase):
+    def test_track_memory(self):
+        calls = []
+
+        def benchmark_function(python, options):
+            calls.append(python)
+            idx = len([p for p in calls if p == python])
+            runtime = {'base': 1., 'changed': 2.}[python] + idx / 10.
+            return perf.RawData([runtime, runtime], array('I', [idx]),
+                                chunks=[2])
+
+        options = optparse.Values({'interleave_chunks': 2, 'drift': 'none'})
+        base_data, changed_data = perf._RunInterleaved(
+            benchmark_function, 'base', 'changed', options)
+        self.assertEqual(calls, ['changed', 'base', 'base', 'changed'])
+        self.assertEqual(base_data.chunks, [2, 2])
+        self.assertEqual(base_data.runtimes, [1.1, 1.1, 1.2, 1.2])
+        self.assertEqual(changed_data.runtimes, [2.1, 2.1, 2.2, 2.2])
+        self.assertEqual(list(base_data.mem_usage), [1, 2])
+        self.assertEqual(list(changed_data.mem_usage), [1, 2])
+
+class StartupTests(unittest.TestCase):
+    def setUp(self):
+        # MeasureCommand removes the pyc files under the current directory.
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def test_measure_command(self):
+        data = perf.MeasureCommand([sys.executable, '-c', ''], 3, None,
+                                   False)
+        self.assertEqual(len(data.launches), 4)
+        self.assertEqual(data.runtimes,
+                         [getattr(launch, data.clock)
+                          for launch in data.launches[1:]])
+        if launcher.DEFAULT_BACKEND != 'subprocess':
+            self.assertEqual(data.clock, 'utime')
+
+    def test_user_time(self):
+        base = perf.RawData([0.5, 0.6, 0.7], None,
+                            launches=make_launches([2., 1., 1.2, 1.4]),
+                            clock='utime')
+        changed = perf.RawData([1., 1.1, 1.2], None,
+                               launches=make_launches([4., 2., 2.2, 2.4]),
+                               clock='utime')
+        result = perf.CompareBenchmarkData(base, changed, make_options())
+        self.assertTrue(isinstance(result, perf.StartupResult))
+        lines = result.get_latencies().splitlines()
+        self.assertTrue(lines[0].startswith('User time p50: 600.000 ms ->'
+                                            ' 1100.000 ms'))
+        self.assertTrue(lines[4].startswith('Cold launch: 1000.000 ms ->'
+                                            ' 2000.000 ms'))
+
+    def test_elapsed(self):
+        base = perf.RawData([1., 1.2, 1.4], None,
+                            launches=make_launches([2., 1., 1.2, 1.4]))
+        changed = perf.RawData([2., 2.2, 2.4], None,
+                               launches=make_launches([4., 2., 2.2, 2.4]))
+        result = perf.CompareBenchmarkData(base, changed, make_options())
+        lines = result.get_latencies().splitlines()
+        self.assertTrue(lines[0].startswith('Latency p50: 1200.000 ms ->'
+                                            ' 2200.000 ms'))
+        self.assertTrue(lines[4].startswith('Cold launch: 2000.000 ms ->'
+                                            ' 4000.000 ms'))
+
+class SignificanceThresholdTests(unittest.TestCase):
+    # A 1% change, under the default threshold of 2%.
+    BASE = [1., 1.001, 0.999, 1.0005, 0.9995]
+    CHANGED = [1.01, 1.011, 1.009, 1.0105, 1.0095]
+
+    def test_default(self):
+        result = perf.CompareMultipleRuns(self.BASE, self.CHANGED,
+                                          make_options())
+        self.assertFalse(result.always_display)
+
+    def test_calibrated_zero(self):
+        options = make_options()
+        options.significance_threshold = 0.
+        result = perf.CompareMultipleRuns(self.BASE, self.CHANGED, options)
+        self.assertTrue(result.always_display)
+
+if __name__ == '__main__':
+    unittest.main()
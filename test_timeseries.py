@@ -0,0 +1,41 @@
+"""
+Tests for timeseries.py
+"""
+import unittest
+
+import timeseries
+
+class SampleBufferTests(unittest.TestCase):
+    def test_iter(self):
+        buf = timeseries.SampleBuffer()
+        for t, value in [(0., 1), (1., 5), (2., 3)]:
+            buf.append(t, value)
+        pairs = iter(buf)
+        self.assertEqual(next(pairs), (0., 1))
+        self.assertEqual(list(pairs), [(1., 5), (2., 3)])
+        self.assertEqual(len(buf), 3)
+        self.assertEqual(buf.peak(), (1., 5))
+
+    def test_downsample_keeps_peak(self):
+        buf = timeseries.SampleBuffer()
+        for i in range(1000):
+            buf.append(float(i), 1000 if i == 537 else i % 10)
+        times, values = buf.downsample(20)
+        self.assertEqual(len(times), 20)
+        self.assertEqual((times[0], times[-1]), (0., 999.))
+        self.assertTrue(1000 in values)
+
+class StreamingDownsamplerTests(unittest.TestCase):
+    def test_peak(self):
+        downsampler = timeseries.StreamingDownsampler(10)
+        for i in range(10000):
+            downsampler.append(float(i), 7777 if i == 4321 else i % 100)
+        self.assertEqual(len(downsampler), 10000)
+        self.assertEqual(downsampler.peak(), (4321., 7777))
+        times, values = downsampler.points()
+        self.assertEqual(len(times), 10)
+        self.assertTrue(7777 in values)
+        self.assertEqual(times, sorted(times))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+"""
+Compact storage and constant-memory downsampling for long series of
+(time, value) samples, such as memory usage traces.
+
+SampleBuffer keeps every sample in a pair of C arrays (12 bytes per
+sample, rather than two boxed Python objects in two lists).
+StreamingDownsampler keeps only a fixed number of min/max buckets however
+many samples are fed to it, and reduces them with Largest-Triangle-
+Three-Buckets (Steinarsson, 2013) on output.  Both track the exact peak.
+"""
+from __future__ import division
+
+from array import array
+import heapq
+
+class SampleBuffer(object):
+    """
+    Every sample of a series, stored compactly.  "times" is an array of
+    doubles, and "values" an array of unsigned ints (e.g. kilobytes).
+    """
+    def __init__(self, typecode='I'):
+        self.times = array('d')
+        self.values = array(typecode)
+        self._peak = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(zip(self.times, self.values))
+
+    def append(self, t, value):
+        if self._peak is None or value > self._peak[1]:
+            self._peak = (t, value)
+        self.times.append(t)
+        self.values.append(value)
+
+    def peak(self):
+        """
+        The (time, value) of the first maximal sample, or None if empty
+        """
+        return self._peak
+
+    def points(self):
+        return self.times, self.values
+
+    def downsample(self, points=100):
+        """
+        Reduce to at most "points" samples with LTTB, keeping the peak.
+        Returns a (times, values) pair of lists.
+        """
+        keep = None
+        if self._peak is not None:
+            keep = self.values.index(self._peak[1])
+        return lttb(self.times, self.values, points, keep)
+
+class StreamingDownsampler(object):
+    """
+    Summarize an unbounded stream of (time, value) samples in constant
+    memory.
+
+    Samples are grouped into at most 2 * points buckets of equal sample
+    count, each remembering its minimal and maximal sample; when the
+    buckets fill up, neighbouring pairs are merged and the bucket size
+    doubles.  The candidates are reduced to "points" samples with LTTB on
+    output, always keeping the exact peak.
+    """
+    def __init__(self, points=100):
+        self.num_points = points
+        self.count = 0
+        self._bucket_size = 1
+        # Each bucket is [count, min_t, min_v, max_t, max_v]
+        self._buckets = []
+        self._peak = None
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, value):
+        self.count += 1
+        if self._peak is None or value > self._peak[1]:
+            self._peak = (t, value)
+        if self._buckets and self._buckets[-1][0] < self._bucket_size:
+            bucket = self._buckets[-1]
+            bucket[0] += 1
+            if value < bucket[2]:
+                bucket[1:3] = t, value
+            if value > bucket[4]:
+                bucket[3:5] = t, value
+            return
+        if len(self._buckets) == 2 * self.num_points:
+            self._halve()
+        self._buckets.append([1, t, value, t, value])
+
+    def _halve(self):
+        merged = []
+        for i in range(0, len(self._buckets), 2):
+            a = self._buckets[i]
+            if i + 1 == len(self._buckets):
+                merged.append(a)
+                continue
+            b = self._buckets[i + 1]
+            lo = a[1:3] if a[2] <= b[2] else b[1:3]
+            hi = a[3:5] if a[4] >= b[4] else b[3:5]
+            merged.append([a[0] + b[0]] + lo + hi)
+        self._buckets = merged
+        self._bucket_size *= 2
+
+    def peak(self):
+        """
+        The (time, value) of the first maximal sample, or None if empty
+        """
+        return self._peak
+
+    def candidates(self):
+        """
+        Yield the retained (time, value) samples in time order
+        """
+        for count, min_t, min_v, max_t, max_v in self._buckets:
+            if min_t == max_t:
+                yield min_t, min_v
+            elif min_t < max_t:
+                yield min_t, min_v
+                yield max_t, max_v
+            else:
+                yield max_t, max_v
+                yield min_t, min_v
+
+    def points(self):
+        """
+        Get the downsampled series, as a (times, values) pair of lists
+        """
+        times = []
+        values = []
+        keep = None
+        for t, value in self.candidates():
+            if self._peak is not None and keep is None \
+               and (t, value) == self._peak:
+                keep = len(times)
+            times.append(t)
+            values.append(value)
+        return lttb(times, values, self.num_points, keep)
+
+    @classmethod
+    def merge(cls, downsamplers, points=None):
+        """
+        Combine the retained samples of several downsamplers (e.g. one per
+        run) into a new one, in time order
+        """
+        downsamplers = list(downsamplers)
+        if points is None:
+            points = max(d.num_points for d in downsamplers)
+        result = cls(points)
+        for t, value in heapq.merge(*[d.candidates() for d in downsamplers]):
+            result.append(t, value)
+        return result
+
+def lttb(times, values, threshold, keep=None):
+    """
+    Downsample with Largest-Triangle-Three-Buckets, which preserves the
+    visual shape of a series far better than taking a value per window.
+    If "keep" is an index, that sample is chosen for its bucket, so that
+    e.g. the peak always survives.  Returns a (times, values) pair of
+    lists.
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(times), list(values)
+
+    out_times = [times[0]]
+    out_values = [values[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # The average of the next bucket is the third point of the triangle
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            avg_t, avg_v = times[n - 1], values[n - 1]
+        else:
+            span = next_end - next_start
+            avg_t = sum(times[j] for j in range(next_start, next_end)) / span
+            avg_v = sum(values[j] for j in range(next_start, next_end)) / span
+
+        if keep is not None and start <= keep < end:
+            chosen = keep
+        else:
+            chosen = start
+            max_area = -1.
+            for j in range(start, end):
+                area = abs((times[a] - avg_t) * (values[j] - values[a])
+                           - (times[a] - times[j]) * (avg_v - values[a]))
+                if area > max_area:
+                    max_area = area
+                    chosen = j
+        out_times.append(times[chosen])
+        out_values.append(values[chosen])
+        a = chosen
+    out_times.append(times[n - 1])
+    out_values.append(values[n - 1])
+    return out_times, out_values